@@ -0,0 +1,154 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# --- CACHE JAWABAN UNTUK BOT ---
+# Banyak karyawan menanyakan SOP yang sama. Jawaban disimpan di memori:
+# 1. Exact match   : teks pertanyaan yang sudah dinormalisasi
+# 2. Near-duplicate: cosine similarity embedding pertanyaan >= threshold
+# Cache otomatis dikosongkan jika isi folder chroma_db berubah (habis ingest).
+
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+
+
+def normalize_question(text):
+    """Huruf kecil, whitespace dirapikan, tanda baca di akhir dibuang"""
+    text = " ".join(text.lower().split())
+    return re.sub(r"[\s?!.,]+$", "", text)
+
+
+def collection_fingerprint(persist_directory):
+    """
+    Sidik jari murah (hanya stat file) untuk mendeteksi perubahan isi chroma_db.
+    Rekursif: Chroma menulis index HNSW ke subfolder UUID per segment, bukan hanya chroma.sqlite3.
+    """
+    if not os.path.isdir(persist_directory):
+        return None
+    parts = []
+    for root, dirs, files in os.walk(persist_directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue  # dihapus di tengah walk (mis. ingest sedang berjalan)
+            parts.append((os.path.relpath(path, persist_directory), stat.st_size, stat.st_mtime_ns))
+    return tuple(parts)
+
+
+class AnswerCache:
+    def __init__(self, embeddings=None, persist_directory=None, similarity_threshold=ANSWER_CACHE_SIMILARITY,
+                 ttl_seconds=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        self.embeddings = embeddings
+        self.persist_directory = persist_directory
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (response, vector, created_at)
+        # Vector dari get() yang miss disimpan sebentar agar put() tidak meng-embed ulang
+        self._recent_vectors = OrderedDict()
+        self._lock = threading.Lock()
+        self._fingerprint = self._current_fingerprint()
+
+    def _current_fingerprint(self):
+        if self.persist_directory is None:
+            return None
+        return collection_fingerprint(self.persist_directory)
+
+    def _check_invalidation(self):
+        fingerprint = self._current_fingerprint()
+        if fingerprint != self._fingerprint:
+            self._entries.clear()
+            self._fingerprint = fingerprint
+
+    def _embed(self, question):
+        if self.embeddings is None or self.similarity_threshold >= 1.0:
+            return None
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expired(self, created_at, now):
+        return self.ttl_seconds and now - created_at > self.ttl_seconds
+
+    def _hit(self, key, response, question):
+        self._entries.move_to_end(key)
+        # Input diganti dengan pertanyaan yang sekarang, sisanya identik dengan jawaban asli
+        return {**response, "input": question}
+
+    def get(self, question):
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            self._check_invalidation()
+            entry = self._entries.get(key)
+            if entry is not None:
+                response, _, created_at = entry
+                if not self._expired(created_at, now):
+                    self.exact_hits += 1
+                    return self._hit(key, response, question)
+                del self._entries[key]
+
+        # Embedding pertanyaan di luar lock (bisa berupa panggilan jaringan).
+        # Dengan CachedEmbeddings, retriever nanti memakai vector yang sama dari cache.
+        vector = self._embed(question)
+        if vector is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self._recent_vectors[key] = vector
+            while len(self._recent_vectors) > 128:
+                self._recent_vectors.popitem(last=False)
+
+            best_key, best_score = None, -1.0
+            for other_key, (response, other_vector, created_at) in list(self._entries.items()):
+                if self._expired(created_at, now):
+                    del self._entries[other_key]
+                    continue
+                if other_vector is None:
+                    continue
+                score = float(np.dot(vector, other_vector))
+                if score > best_score:
+                    best_key, best_score = other_key, score
+
+            if best_key is not None and best_score >= self.similarity_threshold:
+                self.similar_hits += 1
+                return self._hit(best_key, self._entries[best_key][0], question)
+            self.misses += 1
+            return None
+
+    def put(self, question, response):
+        key = normalize_question(question)
+        with self._lock:
+            vector = self._recent_vectors.pop(key, None)
+        if vector is None:
+            vector = self._embed(question)
+        with self._lock:
+            self._entries[key] = (response, vector, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+        }
@@ -1,40 +1,19 @@
-import os
+import time
 from dotenv import load_dotenv
-from langchain_chroma import Chroma
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_classic.chains import create_retrieval_chain
-from langchain_classic.chains.combine_documents import create_stuff_documents_chain
-from langchain_core.prompts import ChatPromptTemplate
+from rag_engine import get_engine
 
 load_dotenv()
 
 # 1. Load Database dari Folder (Bukan dari PDF lagi!)
 print("cpu Memuat 'Otak' dari Disk...")
-embeddings = GoogleGenerativeAIEmbeddings(model="gemini-embedding-001")
-
-vectorstore = Chroma(
-    persist_directory="./chroma_db", # Baca dari folder yang dibuat ingest.py
-    embedding_function=embeddings,
-    collection_name="knowledge_base_perusahaan"
-)
-
-retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
-
-# 2. Setup LLM & Chain (Sama seperti sebelumnya)
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite", temperature=0)
 
+# 2. Setup LLM & Chain (dibangun sekali oleh rag_engine, baca dari folder yang dibuat ingest.py)
 system_prompt = (
     "Anda adalah Asisten. Jawab berdasarkan konteks berikut:\n\n"
     "{context}"
 )
 
-prompt = ChatPromptTemplate.from_messages([
-    ("system", system_prompt),
-    ("human", "{input}"),
-])
-
-qa_chain = create_stuff_documents_chain(llm, prompt)
-rag_chain = create_retrieval_chain(retriever, qa_chain)
+engine = get_engine("cli", system_prompt=system_prompt)
 
 # 3. Loop Chat Interaktif
 print("🤖 Bot Siap! (Ketik 'exit' untuk keluar)")
@@ -43,5 +22,18 @@ while True:
     if query.lower() == "exit":
         break
     
-    response = rag_chain.invoke({"input": query})
-    print(f"Bot: {response['answer']}")
\ No newline at end of file
+    # Streaming: sumber tampil begitu retrieval selesai, lalu jawaban dicetak token demi token
+    started = time.perf_counter()
+    ttft = None
+    for kind, payload in engine.stream_answer(query):
+        if kind == "context":
+            pages = ", ".join(str(doc.metadata.get('page', '?')) for doc in payload)
+            print(f"📚 Sumber: Hal {pages}")
+            continue
+        if ttft is None:
+            ttft = time.perf_counter() - started
+            print("Bot: ", end="", flush=True)
+        print(payload, end="", flush=True)
+    total = time.perf_counter() - started
+    print()
+    print(f"⏱️  Token pertama: {ttft or 0:.2f}s | Total: {total:.2f}s")
\ No newline at end of file
@@ -1,15 +1,13 @@
 import streamlit as st
 import os
-import base64 # <-- Library baru untuk encoding PDF
+import time
 from dotenv import load_dotenv
+from pdf_preview import display_pdf, display_cited_pages
 
-# Import Library LangChain
-from langchain_chroma import Chroma
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_classic.chains import create_retrieval_chain, create_history_aware_retriever
-from langchain_classic.chains.combine_documents import create_stuff_documents_chain
-from langchain_core.prompts import ChatPromptTemplate
+# Import Library LangChain (chain dirakit oleh engine bersama)
 from langchain_core.messages import HumanMessage, AIMessage
+from rag_engine import RAGEngine
+from chat_history import BoundedChatHistory
 
 # --- 1. KONFIGURASI HALAMAN (WIDE MODE) ---
 # Penting: layout="wide" agar muat 2 kolom
@@ -26,64 +24,40 @@ load_dotenv()
 # Tentukan Lokasi File PDF Anda (Harus sama dengan yang di ingest.py)
 # Gunakan relative path agar aman di device baru
 PDF_FILE_PATH = "./PDF Langchain Test.pdf"
+# Snapshot hasil `python snapshot.py export --output knowledge_base.ragsnap`
+SNAPSHOT_PATH = os.getenv("RAG_SNAPSHOT", "./knowledge_base.ragsnap")
 
 # --- FUNGSI TAMPILKAN PDF (KIRI) ---
-def display_pdf(file_path):
-    # Cek apakah file ada
-    if not os.path.exists(file_path):
-        st.error(f"File PDF tidak ditemukan di: {file_path}")
-        return
-
-    # Baca file dan ubah ke Base64
-    with open(file_path, "rb") as f:
-        base64_pdf = base64.b64encode(f.read()).decode('utf-8')
-
-    # Embed PDF menggunakan HTML iframe
-    pdf_display = f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="100%" height="800px" type="application/pdf"></iframe>'
-    st.markdown(pdf_display, unsafe_allow_html=True)
+# display_pdf & thumbnail halaman ada di pdf_preview.py (PDF tidak lagi dikirim ulang setiap rerun)
 
 # --- FUNGSI LOAD ENGINE RAG (BACKEND) ---
 @st.cache_resource
-def get_rag_chain():
+def get_rag_engine():
+    if not os.path.exists("./chroma_db") and os.path.exists(SNAPSHOT_PATH):
+        # Deploy dari artefak snapshot (tanpa commit chroma_db & tanpa embedding ulang)
+        from embedding_cache import get_embeddings
+        from snapshot import restore_snapshot
+        with st.spinner("📦 Memulihkan database dari snapshot..."):
+            restore_snapshot(SNAPSHOT_PATH, get_embeddings(), persist_directory="./chroma_db")
+
     if not os.path.exists("./chroma_db"):
-        st.error("Folder 'chroma_db' belum ada. Pastikan database sudah ada di repository!")
+        st.error("Folder 'chroma_db' belum ada. Sertakan database atau file snapshot (RAG_SNAPSHOT) di repository!")
         return None
         
-    embeddings = GoogleGenerativeAIEmbeddings(model="gemini-embedding-001")
-    vectorstore = Chroma(
-        persist_directory="./chroma_db",
-        embedding_function=embeddings,
-        collection_name="knowledge_base_perusahaan"
-    )
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
-    llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite", temperature=0)
-
-    # Context Prompt
-    context_system_prompt = "Rumuskan kembali pertanyaan user menjadi pertanyaan mandiri berdasarkan riwayat chat."
-    context_prompt = ChatPromptTemplate.from_messages([
-        ("system", context_system_prompt),
-        ("placeholder", "{chat_history}"),
-        ("human", "{input}"),
-    ])
-    history_aware_retriever = create_history_aware_retriever(llm, retriever, context_prompt)
 
+    # Context Prompt (reformulasi pertanyaan) sudah ada di dalam engine.
     # QA Prompt
     qa_system_prompt = (
         "Anda adalah Asisten HRD. Jawab berdasarkan konteks berikut.\n"
         "Jika tidak tahu, katakan 'Maaf, informasi tidak ditemukan di SOP'.\n\n"
         "{context}"
     )
-    qa_prompt = ChatPromptTemplate.from_messages([
-        ("system", qa_system_prompt),
-        ("placeholder", "{chat_history}"),
-        ("human", "{input}"),
-    ])
-    question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
-    rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
-    
-    return rag_chain
+    engine = RAGEngine(system_prompt=qa_system_prompt)
+    # Bangun sekarang (di dalam cache_resource) supaya rerun Streamlit tidak membangun ulang
+    engine.rag_chain
+    return engine
 
-rag_chain = get_rag_chain()
+rag_engine = get_rag_engine()
 
 # --- LAYOUT UTAMA: MEMBAGI LAYAR JADI 2 KOLOM ---
 # Ratio [1, 1] artinya lebar kolom sama besar. Bisa diganti [1.5, 1] jika mau PDF lebih lebar.
@@ -92,7 +66,11 @@ col1, col2 = st.columns([1, 1])
 # === KOLOM KIRI (PDF PREVIEW) ===
 with col1:
     st.header("📄 Dokumen Sumber")
-    display_pdf(PDF_FILE_PATH)
+    display_pdf(PDF_FILE_PATH, page=st.session_state.get("pdf_page", 1))
+    # Diisi ulang oleh kolom kanan begitu ada jawaban baru
+    cited_slot = st.empty()
+    with cited_slot.container():
+        display_cited_pages(PDF_FILE_PATH, st.session_state.get("cited_docs", []))
 
 # === KOLOM KANAN (CHAT INTERFACE) ===
 with col2:
@@ -101,6 +79,9 @@ with col2:
     # Init Session
     if "chat_history" not in st.session_state:
         st.session_state.chat_history = []
+    # chat_history hanya untuk tampilan; yang dikirim ke prompt adalah riwayat terbatas + ringkasan
+    if "history" not in st.session_state and rag_engine is not None:
+        st.session_state.history = BoundedChatHistory(llm=rag_engine.llm)
 
     # Tampilkan History Chat (Hanya di kolom kanan)
     # Kita gunakan container agar chat area punya batas tinggi (opsional)
@@ -127,25 +108,48 @@ with col2:
             with st.chat_message("user"):
                 st.markdown(user_input)
 
-        # 2. Proses Jawaban
+        # 2. Proses Jawaban (streaming token demi token)
         with chat_container:
             with st.chat_message("assistant"):
-                with st.spinner("Menganalisa dokumen..."):
-                    try:
-                        response = rag_chain.invoke({
-                            "input": user_input,
-                            "chat_history": st.session_state.chat_history
-                        })
-                        answer = response['answer']
-                        
-                        st.markdown(answer)
-                        
-                        # Expander Referensi
-                        with st.expander("🔍 Cek Halaman Sumber"):
-                            for doc in response['context']:
-                                page = doc.metadata.get('page', '?')
-                                st.markdown(f"- **Halaman {page}:** {doc.page_content[:100]}...")
-                        
-                        st.session_state.chat_history.append(AIMessage(content=answer))
-                    except Exception as e:
-                        st.error(f"Error: {e}")
\ No newline at end of file
+                answer_area = st.container()
+                sources_area = st.container()
+                timing = {}
+
+                def token_stream():
+                    started = time.perf_counter()
+                    for kind, payload in rag_engine.stream_answer(
+                        user_input,
+                        history=st.session_state.history.messages
+                    ):
+                        if kind == "context":
+                            # Thumbnail halaman sumber di kolom kiri
+                            st.session_state.cited_docs = payload
+                            with cited_slot.container():
+                                display_cited_pages(PDF_FILE_PATH, payload, key_prefix="cited_live")
+                            # Expander Referensi: tampil begitu retrieval selesai
+                            with sources_area:
+                                with st.expander("🔍 Cek Halaman Sumber"):
+                                    for doc in payload:
+                                        page = doc.metadata.get('page', '?')
+                                        st.markdown(f"- **Halaman {page}:** {doc.page_content[:100]}...")
+                            continue
+                        if "ttft" not in timing:
+                            timing["ttft"] = time.perf_counter() - started
+                        yield payload
+                    timing["total"] = time.perf_counter() - started
+
+                try:
+                    with answer_area:
+                        answer = st.write_stream(token_stream())
+                    st.session_state.chat_history.append(AIMessage(content=answer))
+                    st.session_state.history.add_messages([
+                        HumanMessage(content=user_input),
+                        AIMessage(content=answer),
+                    ])
+                    size = st.session_state.history.size_report()
+                    st.caption(
+                        f"⏱️ Token pertama: {timing.get('ttft', 0):.2f}s · Total: {timing.get('total', 0):.2f}s"
+                        f" · 📏 History prompt: {size['prompt_tokens']} token"
+                    )
+                except Exception as e:
+                    st.error(f"Error: {e}")
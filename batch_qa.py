@@ -0,0 +1,67 @@
+import sys
+import json
+import time
+import argparse
+from dotenv import load_dotenv
+
+import rag_engine
+
+load_dotenv()
+
+# --- TANYA-JAWAB MASSAL (FAQ / REGRESSION CHECK) ---
+# python batch_qa.py pertanyaan.txt --output jawaban.jsonl --max-concurrency 8
+# Input: satu pertanyaan per baris, atau JSONL dengan field "question".
+# Output: JSONL (index, question, answer, sources) ditulis begitu tiap gelombang selesai.
+
+SYSTEM_PROMPT = (
+    "Anda adalah Asisten Bot Internal. Jawab pertanyaan berdasarkan konteks berikut. "
+    "Jika informasi tidak ada di dokumen, katakan: 'Maaf, informasi tidak ditemukan di database'.\n\n"
+    "{context}"
+)
+
+
+def read_questions(path):
+    questions = []
+    with (sys.stdin if path == "-" else open(path, encoding="utf-8")) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                line = json.loads(line)["question"]
+            questions.append(line)
+    return questions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Jawab banyak pertanyaan sekaligus (hasil JSONL)")
+    parser.add_argument("input", help="File pertanyaan (.txt per baris atau .jsonl), '-' untuk stdin")
+    parser.add_argument("--output", help="File JSONL hasil (default: stdout)")
+    parser.add_argument("--max-concurrency", type=int, default=rag_engine.BATCH_MAX_CONCURRENCY)
+    parser.add_argument("--chunk-size", type=int, default=rag_engine.BATCH_CHUNK_SIZE,
+                        help="Jumlah pertanyaan per gelombang (1 panggilan embedding per gelombang)")
+    args = parser.parse_args()
+
+    questions = read_questions(args.input)
+    engine = rag_engine.get_engine("batch", system_prompt=SYSTEM_PROMPT)
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    started = time.perf_counter()
+    errors = 0
+    try:
+        for record in engine.answer_batch(questions, max_concurrency=args.max_concurrency,
+                                          chunk_size=args.chunk_size):
+            errors += "error" in record
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+    finally:
+        if args.output:
+            out.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ {len(questions)} pertanyaan dalam {elapsed:.1f}s "
+          f"({len(questions) / elapsed:.2f} pertanyaan/s, {errors} error)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+import os
+import sys
+import json
+import time
+import random
+import platform
+import fnmatch
+import argparse
+import tempfile
+import tracemalloc
+from importlib import metadata
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import HumanMessage, AIMessage
+from token_chunker import TokenChunker
+from langchain_chroma import Chroma
+
+from ingest import sync_source
+from ingest_pipeline import embed_and_store, iter_chunks
+from bm25_index import BM25Index
+from chat_history import BoundedChatHistory
+from rag_engine import RAGEngine
+
+# --- BENCHMARK KOMPONEN (OFFLINE) ---
+# Gemini diganti model lokal yang deterministik + latensi simulasi, jadi tidak butuh
+# kuota API maupun jaringan. Yang diukur:
+# 1. Ingest (jalur ingest.py): halaman/s & chunk/s, plus re-ingest tanpa perubahan
+# 2. Latensi query Chroma & BM25 (p50/p95/p99) terhadap ukuran corpus
+# 3. Overhead chain (jalur app.py & main_memory.py) di luar waktu model
+# 4. Puncak memori per tahap (tracemalloc)
+# Hasilnya laporan JSON yang bisa dibandingkan antar versi: --compare baseline.json
+
+EMBEDDING_SIZE = 768
+QA_SYSTEM_PROMPT = "Anda adalah Asisten. Jawab berdasarkan konteks berikut:\n\n{context}"
+
+_WORDS = (
+    "karyawan cuti tahunan izin sakit lembur gaji tunjangan kontrak evaluasi kinerja "
+    "rekrutmen pelatihan prosedur formulir persetujuan atasan divisi laporan absensi "
+    "kebijakan perusahaan hak kewajiban sanksi pelanggaran jam kerja shift kantor "
+    "pengajuan dokumen verifikasi pembayaran reimburse perjalanan dinas asuransi kesehatan"
+).split()
+
+QUERIES = [
+    "Berapa hari jatah cuti tahunan karyawan?",
+    "Bagaimana prosedur pengajuan lembur?",
+    "SOP-HR-012",
+    "Apa sanksi pelanggaran jam kerja?",
+    "Dokumen apa yang dibutuhkan untuk reimburse perjalanan dinas?",
+    "Siapa yang menyetujui izin sakit lebih dari 3 hari?",
+]
+
+
+# --- MODEL PALSU DENGAN LATENSI SIMULASI ---
+class FakeEmbeddings(DeterministicFakeEmbedding):
+    """Vector deterministik per teks, `latency` detik per panggilan API"""
+
+    latency: float = 0.0
+    calls: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return super().embed_query(text)
+
+
+class FakeChatModel(FakeListChatModel):
+    """Jawaban tetap, `latency` detik per panggilan (non-streaming & streaming)"""
+
+    latency: float = 0.0
+    calls: int = 0
+
+    def _call(self, *args, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return super()._call(*args, **kwargs)
+
+    def _stream(self, *args, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        yield from super()._stream(*args, **kwargs)
+
+
+# --- DATA SINTETIS ---
+def synthetic_pages(n_pages, words_per_page=450, seed=0, source="bench/sop.pdf"):
+    rng = random.Random(seed)
+    for page in range(n_pages):
+        words = [rng.choice(_WORDS) for _ in range(words_per_page)]
+        # Sisipkan kode SOP supaya jalur BM25 punya kata kunci unik
+        words.insert(rng.randrange(len(words)), f"SOP-HR-{page:03d}")
+        text = " ".join(words)
+        yield Document(page_content=text, metadata={"source": source, "page": page})
+
+
+def synthetic_chunks(n_chunks, seed=0):
+    rng = random.Random(seed)
+    for i in range(n_chunks):
+        text = " ".join(rng.choice(_WORDS) for _ in range(150))
+        yield Document(page_content=text, metadata={
+            "source": "bench/corpus.pdf", "page": i // 4, "start_index": (i % 4) * 800, "chunk_id": f"c{i}",
+        })
+
+
+def pdf_pages(path):
+    from langchain_community.document_loaders import PyPDFLoader
+    return PyPDFLoader(path).lazy_load()
+
+
+# --- UTIL PENGUKURAN ---
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def pick(q):
+        index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+        return round(ordered[index] * 1000, 3)
+
+    return {
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+    }
+
+
+class MemoryPeak:
+    """Puncak alokasi Python (MB) selama blok `with`"""
+
+    def __enter__(self):
+        tracemalloc.reset_peak()
+        self.start = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, *exc):
+        self.peak_mb = round((tracemalloc.get_traced_memory()[1] - self.start) / 2**20, 2)
+
+
+def new_store(directory, name, embeddings):
+    return Chroma(persist_directory=directory, collection_name=name, embedding_function=embeddings)
+
+
+# --- 1. INGEST ---
+def bench_ingest(args, workdir):
+    embeddings = FakeEmbeddings(size=EMBEDDING_SIZE, latency=args.embed_latency)
+    vectorstore = new_store(workdir, "bench_ingest", embeddings)
+    splitter = TokenChunker()
+    source = os.path.normpath(args.pdf) if args.pdf else "bench/sop.pdf"
+
+    def run():
+        counted = {"pages": 0}
+
+        def pages():
+            loaded = pdf_pages(args.pdf) if args.pdf else synthetic_pages(args.pages, source=source)
+            for page in loaded:
+                counted["pages"] += 1
+                yield page
+
+        bm25 = BM25Index()
+        started = time.perf_counter()
+        new_count, _, records = sync_source(
+            vectorstore, source, iter_chunks(pages(), splitter),
+            batch_size=args.batch_size, max_concurrency=args.concurrency, bm25=bm25,
+        )
+        return counted["pages"], new_count, len(records), time.perf_counter() - started
+
+    with MemoryPeak() as memory:
+        n_pages, embedded, n_chunks, seconds = run()
+    # Jalan kedua: tidak ada yang berubah, jadi yang terukur hanya overhead split + hash + diff
+    _, reembedded, _, reingest_seconds = run()
+
+    return {
+        "pages": n_pages,
+        "chunks": n_chunks,
+        "embedded": embedded,
+        "seconds": round(seconds, 3),
+        "pages_per_second": round(n_pages / seconds, 2),
+        "chunks_per_second": round(n_chunks / seconds, 2),
+        "embed_calls": embeddings.calls,
+        "reingest_unchanged_seconds": round(reingest_seconds, 3),
+        "reingest_embedded": reembedded,
+        "peak_memory_mb": memory.peak_mb,
+    }
+
+
+# --- 2. LATENSI QUERY VS UKURAN CORPUS ---
+def bench_query(args, workdir):
+    results = {}
+    for size in args.corpus_sizes:
+        embeddings = FakeEmbeddings(size=EMBEDDING_SIZE)
+        vectorstore = new_store(workdir, f"bench_query_{size}", embeddings)
+        embed_and_store(synthetic_chunks(size), vectorstore, batch_size=256,
+                        max_concurrency=args.concurrency, label=f"Corpus {size}")
+        bm25 = BM25Index.from_vectorstore(vectorstore)
+
+        # Vector query di-embed dulu supaya yang terukur murni pencarian Chroma
+        query_vectors = [embeddings.embed_query(q) for q in QUERIES]
+        vector_samples, bm25_samples = [], []
+        with MemoryPeak() as memory:
+            for i in range(args.queries):
+                vector = query_vectors[i % len(query_vectors)]
+                started = time.perf_counter()
+                vectorstore.similarity_search_by_vector(vector, k=args.k)
+                vector_samples.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                bm25.search(QUERIES[i % len(QUERIES)], args.k)
+                bm25_samples.append(time.perf_counter() - started)
+
+        results[str(size)] = {
+            "chroma": percentiles(vector_samples),
+            "bm25": percentiles(bm25_samples),
+            "peak_memory_mb": memory.peak_mb,
+        }
+    return results
+
+
+# --- 3. OVERHEAD CHAIN ---
+def bench_chain(args, workdir):
+    embeddings = FakeEmbeddings(size=EMBEDDING_SIZE, latency=args.embed_latency)
+    # Corpus diisi lewat instance dengan embedding tanpa latensi; engine membaca collection yang sama
+    loader_store = new_store(workdir, "bench_chain", FakeEmbeddings(size=EMBEDDING_SIZE))
+    embed_and_store(synthetic_chunks(args.chain_corpus), loader_store,
+                    batch_size=256, max_concurrency=args.concurrency, label="Corpus chain")
+    vectorstore = new_store(workdir, "bench_chain", embeddings)
+    llm = FakeChatModel(responses=["Jawaban benchmark berdasarkan konteks SOP."], latency=args.llm_latency)
+    engine = RAGEngine(system_prompt=QA_SYSTEM_PROMPT, vectorstore=vectorstore, embeddings=embeddings, llm=llm)
+    engine.rag_chain
+
+    def measure(call):
+        samples, model_seconds = [], []
+        for i in range(args.chain_runs):
+            llm_calls, embed_calls = llm.calls, embeddings.calls
+            started = time.perf_counter()
+            call(QUERIES[i % len(QUERIES)])
+            samples.append(time.perf_counter() - started)
+            model_seconds.append((llm.calls - llm_calls) * args.llm_latency
+                                 + (embeddings.calls - embed_calls) * args.embed_latency)
+        overhead = [total - model for total, model in zip(samples, model_seconds)]
+        return {"total": percentiles(samples), "overhead": percentiles(overhead)}
+
+    # Jalur app.py: tanpa riwayat, streaming
+    def app_path(question):
+        for _ in engine.stream_answer(question):
+            pass
+
+    # Jalur main_memory.py: riwayat terbatas -> reformulasi pertanyaan + QA
+    history = BoundedChatHistory(llm=llm)
+    for question in QUERIES[:3]:
+        history.add_messages([HumanMessage(content=question), AIMessage(content="Jawaban sebelumnya.")])
+
+    def memory_path(question):
+        engine.answer(question, history=history.messages)
+
+    def retrieval_only(question):
+        vectorstore.similarity_search(question, k=engine.k)
+
+    with MemoryPeak() as memory:
+        report = {
+            "retrieval_only": measure(retrieval_only),
+            "app_stream": measure(app_path),
+            "memory_invoke": measure(memory_path),
+        }
+    report["startup_ms"] = {name: round(seconds * 1000, 3) for name, seconds in engine.timings.items()}
+    report["peak_memory_mb"] = memory.peak_mb
+    return report
+
+
+# --- LAPORAN & PERBANDINGAN ---
+def environment():
+    versions = {}
+    for package in ("langchain-core", "langchain-classic", "langchain-chroma", "chromadb"):
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "packages": versions}
+
+
+def flatten(report, prefix=""):
+    flat = {}
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+# Arah & ambang per metrik (pola pertama yang cocok dipakai):
+#   (pola nama, arah, toleransi relatif (None = --tolerance), selisih absolut minimum)
+# Selisih absolut menyaring noise di angka kecil, dan jadi satu-satunya cek jika baseline = 0.
+# Metrik jumlah (halaman, chunk, panggilan embed) mengikuti beban kerja -> hanya informasi.
+METRIC_RULES = [
+    ("*.reingest_embedded", "lower", 0.0, 0),  # re-ingest tanpa perubahan harus tetap 0
+    ("*.pages", "info", None, 0),
+    ("*.chunks", "info", None, 0),
+    ("*.embedded", "info", None, 0),
+    ("*.embed_calls", "info", None, 0),
+    ("*_per_second", "higher", None, 1.0),
+    ("*_ms", "lower", None, 0.5),
+    ("*.startup_ms.*", "lower", None, 5.0),
+    ("*seconds", "lower", None, 0.01),
+    ("*peak_memory_mb", "lower", None, 1.0),
+]
+
+
+def metric_rule(name):
+    for pattern, direction, tolerance, slack in METRIC_RULES:
+        if fnmatch.fnmatchcase(name, pattern):
+            return direction, tolerance, slack
+    return "info", None, 0
+
+
+def compare(current, baseline, tolerance):
+    """Return daftar regresi menurut METRIC_RULES (metrik tanpa aturan hanya dicetak)"""
+    regressions = []
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    for name in sorted(old.keys() & new.keys()):
+        before, after = old[name], new[name]
+        direction, limit, slack = metric_rule(name)
+        limit = tolerance if limit is None else limit
+        delta = after - before if direction == "lower" else before - after  # > 0 berarti memburuk
+        change = f"{(after - before) / abs(before):+.1%}" if before else f"{after - before:+g}"
+        if direction == "info":
+            worse = False
+        elif before:
+            worse = delta > slack and delta / abs(before) > limit
+        else:
+            worse = delta > slack
+        marker = "❌" if worse else "  "
+        print(f"{marker} {name}: {before} -> {after} ({change})")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark komponen RAG secara offline (tanpa API Gemini)")
+    parser.add_argument("--pdf", help="Pakai PDF asli untuk tahap ingest (default: halaman sintetis)")
+    parser.add_argument("--pages", type=int, default=200, help="Jumlah halaman sintetis")
+    parser.add_argument("--corpus-sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--queries", type=int, default=200, help="Jumlah query per ukuran corpus")
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--chain-corpus", type=int, default=2000)
+    parser.add_argument("--chain-runs", type=int, default=50)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Detik per panggilan embedding")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Detik per panggilan LLM")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--only", nargs="+", choices=["ingest", "query", "chain"], default=["ingest", "query", "chain"])
+    parser.add_argument("--output", help="Simpan laporan JSON ke file ini")
+    parser.add_argument("--compare", help="Laporan JSON versi sebelumnya (baseline)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Batas regresi relatif (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    tracemalloc.start()
+
+    stages = {"ingest": bench_ingest, "query": bench_query, "chain": bench_chain}
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="rag_bench_") as workdir:
+        for name in args.only:
+            print(f"⏱️  Benchmark {name}...")
+            results[name] = stages[name](args, workdir)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": environment(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"✅ Laporan disimpan di {args.output}")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} metrik regresi (toleransi {args.tolerance:.0%})")
+            sys.exit(1)
+        print("✅ Tidak ada regresi")
+
+
+if __name__ == "__main__":
+    main()
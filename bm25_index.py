@@ -0,0 +1,237 @@
+import os
+import re
+import json
+import gzip
+import math
+import argparse
+from collections import Counter, defaultdict
+from typing import Any, Optional
+
+from pydantic import PrivateAttr
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# --- INDEX BM25 LOKAL (LEXICAL SEARCH) ---
+# Disimpan di samping chroma_db dan di-update saat ingest.
+# Query seperti kode SOP, nama, atau nomor formulir bisa dicari tanpa embedding sama sekali.
+
+PERSIST_DIRECTORY = "./chroma_db"
+COLLECTION_NAME = "knowledge_base_perusahaan"
+
+_TOKEN_RE = re.compile(r"\w+(?:[-/.]\w+)*")
+
+
+def tokenize(text):
+    """
+    Token huruf kecil. Token gabungan seperti 'sop-hr-012' disimpan utuh
+    DAN dipecah ('sop', 'hr', '012') supaya pencarian parsial tetap kena.
+    """
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[-/.]", token) if part)
+    return tokens
+
+
+def index_path(persist_directory=PERSIST_DIRECTORY, collection_name=COLLECTION_NAME):
+    return os.path.join(persist_directory, f"bm25_{collection_name}.json.gz")
+
+
+class BM25Index:
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs = {}                      # id -> (text, metadata, panjang)
+        self.postings = defaultdict(dict)   # term -> {id: term frequency}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.docs)
+
+    # --- UPDATE INDEX ---
+    def add(self, doc_id, text, metadata):
+        if doc_id in self.docs:
+            self.remove([doc_id])
+        counts = Counter(tokenize(text))
+        length = sum(counts.values())
+        self.docs[doc_id] = (text, metadata, length)
+        self.total_length += length
+        for term, tf in counts.items():
+            self.postings[term][doc_id] = tf
+
+    def remove(self, doc_ids):
+        for doc_id in doc_ids:
+            entry = self.docs.pop(doc_id, None)
+            if entry is None:
+                continue
+            text, _, length = entry
+            self.total_length -= length
+            for term in set(tokenize(text)):
+                posting = self.postings.get(term)
+                if posting is not None:
+                    posting.pop(doc_id, None)
+                    if not posting:
+                        del self.postings[term]
+
+    # --- PENCARIAN ---
+    def search(self, query, k=3):
+        """Return list (Document, skor) terurut dari skor tertinggi"""
+        n_docs = len(self.docs)
+        if not n_docs:
+            return []
+        avg_length = self.total_length / n_docs
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, tf in posting.items():
+                length = self.docs[doc_id][2]
+                norm = tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / avg_length))
+                scores[doc_id] += idf * norm
+
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        results = []
+        for doc_id, score in top:
+            text, metadata, _ = self.docs[doc_id]
+            results.append((Document(page_content=text, metadata=metadata, id=doc_id), score))
+        return results
+
+    # --- SIMPAN / MUAT ---
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        payload = {
+            "version": 1,
+            "k1": self.k1,
+            "b": self.b,
+            "docs": {doc_id: [text, metadata, length] for doc_id, (text, metadata, length) in self.docs.items()},
+            "postings": self.postings,
+        }
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            payload = json.load(f)
+        index = cls(k1=payload["k1"], b=payload["b"])
+        for doc_id, (text, metadata, length) in payload["docs"].items():
+            index.docs[doc_id] = (text, metadata, length)
+            index.total_length += length
+        index.postings = defaultdict(dict, payload["postings"])
+        return index
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore):
+        """Bangun ulang dari isi collection Chroma (tanpa panggilan embedding)"""
+        index = cls()
+        data = vectorstore.get(include=["documents", "metadatas"])
+        for doc_id, text, metadata in zip(data["ids"], data["documents"], data["metadatas"]):
+            index.add(doc_id, text, metadata or {})
+        return index
+
+
+def load_or_build(vectorstore, persist_directory=PERSIST_DIRECTORY, collection_name=COLLECTION_NAME):
+    """Muat index dari disk; jika belum ada (collection lama) atau tidak sinkron, bangun dari isi Chroma"""
+    path = index_path(persist_directory, collection_name)
+    if os.path.exists(path):
+        index = BM25Index.load(path)
+        # Jumlah beda = ingest sebelumnya terhenti di tengah jalan, bangun ulang saja
+        if len(index) == vectorstore._collection.count():
+            return index
+    print("🔤 Index BM25 belum ada / tidak sinkron, membangun dari isi Chroma...")
+    return BM25Index.from_vectorstore(vectorstore)
+
+
+# --- RETRIEVER HYBRID (BM25 + VECTOR, DIGABUNG DENGAN RRF) ---
+_CODE_RE = re.compile(r"\b(?=\w*\d)\w+(?:[-/.]\w+)+\b|\b[A-Z]{2,}\d+\b|\b[A-Z]{2,}-\w+")
+
+
+def looks_lexical(query):
+    """Query berisi kode/nomor (mis. 'SOP-HR-012', 'FRM/01') atau sangat pendek"""
+    return bool(_CODE_RE.search(query)) or len(tokenize(query)) <= 2
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Gabungkan hasil BM25 dan vector search dengan reciprocal-rank fusion.
+    Fast path: query yang jelas lexical dan punya pemenang BM25 yang dominan
+    dijawab dari BM25 saja, tanpa embedding query (tanpa panggilan API).
+    Jika `bm25_path` diisi, index dimuat ulang otomatis saat file berubah (habis ingest).
+    """
+
+    vectorstore: Any
+    bm25: Any = None
+    bm25_path: Optional[str] = None
+    k: int = 3
+    fetch_k: int = 10
+    rrf_k: int = 60
+    lexical_fast_path: bool = True
+    dominance: float = 1.5
+    _bm25_mtime: Optional[int] = PrivateAttr(default=None)
+
+    def _current_bm25(self):
+        if self.bm25_path is None:
+            return self.bm25
+        try:
+            mtime = os.stat(self.bm25_path).st_mtime_ns
+        except FileNotFoundError:
+            return self.bm25
+        if mtime != self._bm25_mtime:
+            self.bm25 = BM25Index.load(self.bm25_path)
+            self._bm25_mtime = mtime
+        return self.bm25
+
+    def _fast_path(self, query, lexical):
+        if not (self.lexical_fast_path and lexical and looks_lexical(query)):
+            return None
+        best = lexical[0][1]
+        runner_up = lexical[1][1] if len(lexical) > 1 else 0.0
+        if best >= self.dominance * runner_up:
+            return [doc for doc, _ in lexical[:self.k]]
+        return None
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self.search_with_vector(query)
+
+    def search_with_vector(self, query, vector=None):
+        """Seperti invoke(), tapi boleh memakai vector query yang sudah dihitung (mode batch)"""
+        bm25 = self._current_bm25()
+        lexical = bm25.search(query, self.fetch_k) if bm25 is not None else []
+        fast = self._fast_path(query, lexical)
+        if fast is not None:
+            return fast
+
+        if vector is None:
+            semantic = self.vectorstore.similarity_search(query, k=self.fetch_k)
+        else:
+            semantic = self.vectorstore.similarity_search_by_vector(vector, k=self.fetch_k)
+
+        scores, docs = defaultdict(float), {}
+        for results in ([doc for doc, _ in lexical], semantic):
+            for rank, doc in enumerate(results):
+                key = doc.id or doc.metadata.get("chunk_id") or doc.page_content
+                scores[key] += 1.0 / (self.rrf_k + rank + 1)
+                docs.setdefault(key, doc)
+
+        ranked = sorted(scores, key=scores.get, reverse=True)[:self.k]
+        return [docs[key] for key in ranked]
+
+
+if __name__ == "__main__":
+    # Bangun ulang index BM25 dari collection yang sudah ada:
+    # python bm25_index.py --collection knowledge_base_perusahaan
+    from langchain_chroma import Chroma
+
+    parser = argparse.ArgumentParser(description="Bangun ulang index BM25 dari Chroma")
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    args = parser.parse_args()
+
+    store = Chroma(persist_directory=PERSIST_DIRECTORY, collection_name=args.collection)
+    bm25 = BM25Index.from_vectorstore(store)
+    bm25.save(index_path(PERSIST_DIRECTORY, args.collection))
+    print(f"✅ Index BM25: {len(bm25)} chunk, {len(bm25.postings)} term")
@@ -1,13 +1,13 @@
 import os
-from flask import Flask, request, jsonify
+import json
+import argparse
+import threading
+from flask import Flask, Response, request, jsonify, stream_with_context
 from dotenv import load_dotenv
 
-# Import Library RAG (LangChain)
-from langchain_chroma import Chroma
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_classic.chains import create_retrieval_chain
-from langchain_classic.chains.combine_documents import create_stuff_documents_chain
-from langchain_core.prompts import ChatPromptTemplate
+# Engine RAG bersama (LangChain di-import secara lazy di dalam rag_engine)
+import rag_engine
+from tenant_router import TenantRouter
 
 # Setup Aplikasi Flask
 app = Flask(__name__)
@@ -16,85 +16,328 @@ load_dotenv()
 # --- 1. MEMUAT OTAK AI (RAG) ---
 print("⚙️  Sedang memuat Database Knowledge Base...")
 
-# Cek apakah folder database ada
-if not os.path.exists("./chroma_db"):
-    print("❌ ERROR: Folder 'chroma_db' tidak ditemukan! Harap jalankan 'ingest.py' atau 'ingest_universal.py' terlebih dahulu.")
-    rag_chain = None
-else:
-    # Setup Embeddings & DB
-    embeddings = GoogleGenerativeAIEmbeddings(model="gemini-embedding-001")
-    vectorstore = Chroma(
-        persist_directory="./chroma_db",
-        embedding_function=embeddings,
-        collection_name="knowledge_base_perusahaan"
-    )
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
-
-    # Setup LLM & Prompt
-    llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite", temperature=0)
-    
-    system_prompt = (
-        "Anda adalah Asisten Bot Internal. Jawab pertanyaan berdasarkan konteks berikut. "
-        "Jika informasi tidak ada di dokumen, katakan: 'Maaf, informasi tidak ditemukan di database'.\n\n"
-        "{context}"
-    )
-    
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", system_prompt),
-        ("human", "{input}"),
-    ])
-    
-    question_answer_chain = create_stuff_documents_chain(llm, prompt)
-    rag_chain = create_retrieval_chain(retriever, question_answer_chain)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE", "1") != "0"
+
+SYSTEM_PROMPT = (
+    "Anda adalah Asisten Bot Internal. Jawab pertanyaan berdasarkan konteks berikut. "
+    "Jika informasi tidak ada di dokumen, katakan: 'Maaf, informasi tidak ditemukan di database'.\n\n"
+    "{context}"
+)
+
+
+def load_engine():
+    """
+    None jika folder chroma_db belum ada (pesan error sudah dicetak oleh boot).
+    answer_cache: pertanyaan yang sama/mirip dijawab dari cache tanpa memanggil Gemini.
+    """
+    return rag_engine.boot("google_chat", system_prompt=SYSTEM_PROMPT, answer_cache=ANSWER_CACHE_ENABLED)
+
+
+# Dipanggil ulang oleh serve_prefork.py saat reload (SIGHUP)
+engine = load_engine()
+if engine:
     print("✅ Bot Siap! Menunggu pesan dari Google Chat...")
 
+# Space tertentu hanya melihat collection divisinya (tenants.json, lihat tenant_router.py)
+tenants = TenantRouter()
 
-# --- 2. SETUP JALUR KOMUNIKASI (ENDPOINT) ---
-@app.route('/', methods=['POST'])
-def on_event():
-    """Fungsi ini dipanggil otomatis oleh Google Chat setiap ada pesan"""
-    event = request.get_json()
-    
+
+# --- 2. LOGIKA EVENT GOOGLE CHAT (DIPAKAI MODE SYNC & ASYNC) ---
+def parse_event(event):
+    """
+    Return (balasan_langsung, pertanyaan, engine).
+    Event non-pesan langsung dibalas; pesan diteruskan ke engine milik Space tersebut.
+    """
     # Skenario A: Bot baru diundang ke Space/DM
     if event['type'] == 'ADDED_TO_SPACE':
-        return jsonify({'text': 'Halo! Saya Asisten Dokumen. Silakan tanya saya tentang SOP/Data.'})
-    
+        return {'text': 'Halo! Saya Asisten Dokumen. Silakan tanya saya tentang SOP/Data.'}, None, None
+
     # Skenario B: Pesan Masuk (MESSAGE)
     if event['type'] == 'MESSAGE':
         # Ambil teks pesan user
         user_message = event['message']['text']
         # Bersihkan nama bot (jika di-mention di grup)
         clean_message = user_message.replace(event['message'].get('argumentText', ''), '').strip() or user_message
-        
+
         print(f"📩 Pesan Masuk: {clean_message}")
 
-        if not rag_chain:
-            return jsonify({'text': '⚠️ Error: Database belum siap. Cek server.'})
+        space = event.get('space', {}).get('name')
+        try:
+            target = tenants.engine_for("gchat", space, engine, system_prompt=SYSTEM_PROMPT,
+                                        answer_cache=ANSWER_CACHE_ENABLED)
+        except PermissionError as e:
+            print(f"🚫 {e}")
+            return {'text': '🚫 Space ini belum diberi akses ke dokumen mana pun. Hubungi admin.'}, None, None
+        if not target:
+            return {'text': '⚠️ Error: Database belum siap. Cek server.'}, None, None
+        return None, clean_message, target
+
+    return {}, None, None
+
+
+def format_reply(response):
+    answer = response['answer']
+
+    # (Opsional) Tampilkan sumber halaman
+    sources = []
+    for doc in response['context']:
+        page = doc.metadata.get('page', '?')
+        source_file = os.path.basename(doc.metadata.get('source', 'Doc'))
+        sources.append(f"{source_file} (Hal {page})")
+
+    # Format Balasan
+    source_text = f"\n\n📚 *Sumber:* {', '.join(sources)}" if sources else ""
+    return {'text': f"{answer}{source_text}"}
+
+
+def error_reply(e):
+    print(f"Error RAG: {e}")
+    return {'text': f"Maaf, terjadi kesalahan sistem: {str(e)}"}
+
+
+# --- 3. SETUP JALUR KOMUNIKASI (ENDPOINT FLASK / MODE SYNC) ---
+@app.route('/', methods=['POST'])
+def on_event():
+    """Fungsi ini dipanggil otomatis oleh Google Chat setiap ada pesan"""
+    reply, question, target = parse_event(request.get_json())
+    if reply is not None:
+        return jsonify(reply)
+
+    # Tanya ke RAG
+    try:
+        return jsonify(format_reply(target.answer(question)))
+    except Exception as e:
+        return jsonify(error_reply(e))
+
+
+# --- 3b. MODE BATCH: BANYAK PERTANYAAN SEKALIGUS, HASIL JSONL STREAMING ---
+# POST /batch {"questions": [...], "max_concurrency": 8} -> 1 baris JSON per pertanyaan
+def parse_batch(payload):
+    """Return (pesan_error, pertanyaan, max_concurrency)"""
+    payload = payload if isinstance(payload, dict) else {}
+    questions = payload.get("questions")
+    if not isinstance(questions, list) or not questions or not all(isinstance(q, str) for q in questions):
+        return "'questions' harus berupa list teks yang tidak kosong", None, None
+    if not engine:
+        return "Database belum siap", None, None
+    try:
+        requested = int(payload.get("max_concurrency", rag_engine.BATCH_MAX_CONCURRENCY))
+    except (TypeError, ValueError):
+        return "'max_concurrency' harus berupa angka", None, None
+    # RAG_BATCH_MAX_CONCURRENCY sekaligus jadi batas atas (kuota Gemini)
+    return None, questions, max(1, min(requested, rag_engine.BATCH_MAX_CONCURRENCY))
+
+
+def jsonl(record):
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+@app.route('/batch', methods=['POST'])
+def on_batch():
+    error, questions, max_concurrency = parse_batch(request.get_json(silent=True))
+    if error:
+        return jsonify({"error": error}), 400
+
+    def generate():
+        for record in engine.answer_batch(questions, max_concurrency=max_concurrency):
+            yield jsonl(record)
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+def metrics_text():
+    """Metrik per tahap rag_chain + limiter Gemini dalam format Prometheus"""
+    from instrumentation import METRICS
+    from gemini_limiter import render_prometheus
+    return METRICS.render_prometheus() + render_prometheus()
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
 
-        # Tanya ke RAG
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(metrics_text(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+# --- HEALTH CHECK (load balancer / orchestrator) ---
+def health_status():
+    """/healthz: proses hidup. Tidak menyentuh engine, jadi tetap cepat walau Gemini/index bermasalah."""
+    return 200, {"status": "ok", "pid": os.getpid()}
+
+
+def serving_engines():
+    """Engine default + engine tiap tenant gchat di tenants.json: semuanya harus siap sebelum menerima trafik"""
+    if engine is None:
+        return []
+    return [engine] + tenants.engines("gchat", engine, system_prompt=SYSTEM_PROMPT, answer_cache=ANSWER_CACHE_ENABLED)
+
+
+_preloading = set()
+_preloading_lock = threading.Lock()
+
+
+def _preload(target):
+    try:
+        target.preload()
+    except Exception as e:
+        print(f"⚠️ Gagal membangun engine {target.collections}: {e}")
+    finally:
+        with _preloading_lock:
+            _preloading.discard(target)
+
+
+def preload_in_background():
+    """
+    Bangun engine yang belum siap di thread latar (tanpa panggilan API), sekali per engine.
+    Dipanggil saat boot & oleh /readyz: tanpa ini chain baru dibangun oleh pertanyaan pertama,
+    sementara load balancer tidak mengirim pertanyaan sebelum /readyz 200.
+    """
+    for target in serving_engines():
+        with _preloading_lock:
+            if target.ready or target in _preloading:
+                continue
+            _preloading.add(target)
+        threading.Thread(target=_preload, args=(target,), name="preload", daemon=True).start()
+
+
+def ready_status():
+    """/readyz: 200 hanya jika semua engine (default + tenant) sudah dibangun & siap menjawab"""
+    if engine is None:
+        return 503, {"status": "no_database", "pid": os.getpid()}
+    loading = [target for target in serving_engines() if not target.ready]
+    if loading:
+        # Tenant baru di tenants.json / build yang gagal: dicoba lagi di latar, probe tetap cepat
+        preload_in_background()
+        return 503, {"status": "loading", "pending": [",".join(t.collections) for t in loading], "pid": os.getpid()}
+    return 200, {"status": "ready", "pid": os.getpid()}
+
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    status, payload = health_status()
+    return jsonify(payload), status
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    status, payload = ready_status()
+    return jsonify(payload), status
+
+
+# --- 4. MODE ASYNC (ASGI + uvicorn) ---
+# Satu proses bisa menahan banyak event Google Chat sekaligus tanpa 1 thread per request.
+# Pertanyaan identik yang datang bersamaan berbagi satu eksekusi chain (lihat RAGEngine.aanswer).
+async def on_event_async(event):
+    reply, question, target = parse_event(event)
+    if reply is not None:
+        return reply
+    try:
+        return format_reply(await target.aanswer(question))
+    except Exception as e:
+        return error_reply(e)
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_text(send, status, text, content_type):
+    body = text.encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def on_batch_async(receive, send):
+    try:
+        payload = json.loads(await _read_body(receive) or b"{}")
+    except ValueError:
+        payload = None
+    error, questions, max_concurrency = parse_batch(payload)
+    if error:
+        await _send_json(send, 400, {"error": error})
+        return
+
+    # Kirim tiap baris begitu jawabannya siap (chunked response)
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"application/x-ndjson")],
+    })
+    async for record in engine.aanswer_batch(questions, max_concurrency=max_concurrency):
+        await send({"type": "http.response.body", "body": jsonl(record).encode("utf-8"), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def asgi_app(scope, receive, send):
+    """Aplikasi ASGI minimal (tanpa framework tambahan) untuk dijalankan oleh uvicorn"""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    if scope["path"] == "/" and scope["method"] == "POST":
+        body = await _read_body(receive)
         try:
-            response = rag_chain.invoke({"input": clean_message})
-            answer = response['answer']
-            
-            # (Opsional) Tampilkan sumber halaman
-            sources = []
-            for doc in response['context']:
-                page = doc.metadata.get('page', '?')
-                source_file = os.path.basename(doc.metadata.get('source', 'Doc'))
-                sources.append(f"{source_file} (Hal {page})")
-            
-            # Format Balasan
-            source_text = f"\n\n📚 *Sumber:* {', '.join(sources)}" if sources else ""
-            final_reply = f"{answer}{source_text}"
-            
-            return jsonify({'text': final_reply})
-            
-        except Exception as e:
-            print(f"Error RAG: {e}")
-            return jsonify({'text': f"Maaf, terjadi kesalahan sistem: {str(e)}"})
-
-    return jsonify({})
+            event = json.loads(body or b"{}")
+        except ValueError:
+            await _send_json(send, 400, {"error": "invalid json"})
+            return
+        await _send_json(send, 200, await on_event_async(event))
+        return
+
+    if scope["path"] == "/batch" and scope["method"] == "POST":
+        await on_batch_async(receive, send)
+        return
+
+    if scope["path"] == "/metrics" and scope["method"] == "GET":
+        await _send_text(send, 200, metrics_text(), PROMETHEUS_CONTENT_TYPE)
+        return
+
+    if scope["path"] in ("/healthz", "/readyz") and scope["method"] == "GET":
+        await _send_json(send, *(health_status() if scope["path"] == "/healthz" else ready_status()))
+        return
+
+    await _send_json(send, 404, {"error": "not found"})
+
 
 if __name__ == '__main__':
-    # Jalankan server di port 5000
-    app.run(port=5000)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Bot Google Chat (RAG)")
+    parser.add_argument("--async", dest="async_mode", action="store_true", help="Jalankan mode async (uvicorn)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+
+    # Engine dibangun sejak boot (bukan menunggu pertanyaan pertama), supaya /readyz bisa menjadi 200
+    preload_in_background()
+    if args.async_mode:
+        import uvicorn
+        uvicorn.run(asgi_app, host=args.host, port=args.port)
+    else:
+        # Jalankan server di port 5000
+        app.run(host=args.host, port=args.port)
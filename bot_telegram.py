@@ -1,17 +1,20 @@
 import os
+import json
+import time
 import asyncio
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # Library Telegram
 from telegram import Update
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, MessageHandler, filters
 
-# Library RAG (LangChain) - Masih sama persis!
-from langchain_chroma import Chroma
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_classic.chains import create_retrieval_chain
-from langchain_classic.chains.combine_documents import create_stuff_documents_chain
-from langchain_core.prompts import ChatPromptTemplate
+# Engine RAG bersama (LangChain di-import secara lazy di dalam rag_engine)
+import rag_engine
+from tenant_router import TenantRouter
 
 load_dotenv()
 
@@ -19,38 +22,52 @@ load_dotenv()
 # Masukkan Token dari BotFather di sini (atau taruh di .env biar aman)
 TELEGRAM_TOKEN = os.getenv("bot_tele_token")
 
+# Batas beban: pool thread khusus RAG (bukan default executor yang tidak terbatas)
+MAX_WORKERS = int(os.getenv("TELEGRAM_MAX_WORKERS", "8"))
+MAX_PENDING = int(os.getenv("TELEGRAM_MAX_PENDING", "32"))   # total pesan yang diproses + antri
+MAX_PER_CHAT = int(os.getenv("TELEGRAM_MAX_PER_CHAT", "3"))  # antrian per chat
+EDIT_INTERVAL = float(os.getenv("TELEGRAM_EDIT_INTERVAL", "1.0"))  # jeda minimal antar edit pesan (detik)
+TELEGRAM_MAX_LENGTH = 4096
+FINAL_EDIT_ATTEMPTS = 3  # edit terakhir (jawaban lengkap) dicoba ulang setelah RetryAfter, lalu kirim pesan baru
+
 # --- 1. SETUP OTAK AI (RAG) ---
 print("⚙️  Memuat Database RAG...")
 
-if not os.path.exists("./chroma_db"):
-    print("❌ ERROR: Folder 'chroma_db' tidak ditemukan! Jalankan 'ingest_universal.py' dulu.")
-    rag_chain = None
-else:
-    embeddings = GoogleGenerativeAIEmbeddings(model="gemini-embedding-001")
-    vectorstore = Chroma(
-        persist_directory="./chroma_db",
-        embedding_function=embeddings,
-        collection_name="knowledge_base_perusahaan"
-    )
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
-    llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite", temperature=0)
-
-    system_prompt = (
-        "Anda adalah Asisten Telegram. Jawab pertanyaan berdasarkan konteks dokumen berikut. "
-        "Gunakan bahasa Indonesia yang luwes namun profesional. "
-        "Jika tidak ada di dokumen, katakan tidak tahu.\n\n"
-        "{context}"
-    )
-    
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", system_prompt),
-        ("human", "{input}"),
-    ])
-    
-    question_answer_chain = create_stuff_documents_chain(llm, prompt)
-    rag_chain = create_retrieval_chain(retriever, question_answer_chain)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE", "1") != "0"
+
+SYSTEM_PROMPT = (
+    "Anda adalah Asisten Telegram. Jawab pertanyaan berdasarkan konteks dokumen berikut. "
+    "Gunakan bahasa Indonesia yang luwes namun profesional. "
+    "Jika tidak ada di dokumen, katakan tidak tahu.\n\n"
+    "{context}"
+)
+
+# None jika folder chroma_db belum ada (pesan error sudah dicetak oleh boot)
+# answer_cache: pertanyaan yang sama/mirip dijawab dari cache tanpa memanggil Gemini
+engine = rag_engine.boot("telegram", system_prompt=SYSTEM_PROMPT, answer_cache=ANSWER_CACHE_ENABLED)
+if engine:
     print("✅ Otak AI Siap!")
 
+# Tiap chat hanya mencari di collection miliknya (tenants.json, lihat tenant_router.py)
+tenants = TenantRouter()
+
+# --- 1b. METRIK PER TAHAP SEBAGAI STRUCTURED LOG (1 baris JSON per pertanyaan) ---
+metrics_logger = logging.getLogger("rag.metrics")
+metrics_logger.setLevel(logging.INFO)
+metrics_logger.propagate = False  # jangan ikut log httpx/telegram di root logger
+_metrics_handler = logging.StreamHandler()
+_metrics_handler.setFormatter(logging.Formatter("%(message)s"))
+metrics_logger.addHandler(_metrics_handler)
+
+
+def log_trace(record):
+    metrics_logger.info(json.dumps({"ts": round(time.time(), 3), "bot": "telegram", **record}))
+
+
+if engine and rag_engine.METRICS_ENABLED:
+    from instrumentation import METRICS
+    METRICS.add_listener(log_trace)
+
 # --- 2. FUNGSI TELEGRAM ---
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -60,48 +77,152 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Silakan kirim pertanyaan, saya akan cari jawabannya di file Drive Anda."
     )
 
+# --- 2b. POOL, ANTRIAN & STREAMING ---
+rag_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="rag")
+pending_total = 0
+pending_per_chat = defaultdict(int)
+chat_locks = defaultdict(asyncio.Lock)  # pesan dalam satu chat diproses berurutan
+
+
+async def stream_from_pool(target, question):
+    """Jalankan target.stream_answer di rag_pool, lalu alirkan event-nya ke event loop"""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def produce():
+        try:
+            for event in target.stream_answer(question):
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, ("error", e))
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    loop.run_in_executor(rag_pool, produce)
+    while True:
+        event = await queue.get()
+        if event is None:
+            return
+        yield event
+
+
+def format_sources(docs):
+    sources = []
+    for doc in docs:
+        page = doc.metadata.get('page', '?')
+        source_file = os.path.basename(doc.metadata.get('source', 'Doc'))
+        sources.append(f"- {source_file} (Hal {page})")
+    return "\n\n📚 *Sumber:*\n" + "\n".join(sources) if sources else ""
+
+
+def _retry_seconds(error):
+    # python-telegram-bot baru memakai timedelta, versi lama int detik
+    retry_after = error.retry_after
+    return retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+
+
+async def safe_edit(message, text, final=False):
+    """
+    Edit pesan. Edit sementara yang kena RetryAfter dilewati (edit berikutnya menyusul);
+    edit final menunggu & mencoba ulang. Return False jika edit final tetap gagal.
+    """
+    for _ in range(FINAL_EDIT_ATTEMPTS if final else 1):
+        try:
+            await message.edit_text(text[:TELEGRAM_MAX_LENGTH])
+            return True
+        except RetryAfter as e:
+            if final:
+                await asyncio.sleep(_retry_seconds(e))
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+            return True
+    return not final
+
+
+async def stream_reply(update: Update, target, question):
+    """Kirim jawaban bertahap: pesan dibuat saat token pertama datang, lalu di-edit (di-throttle)"""
+    reply = None
+    answer = ""
+    sources_text = ""
+    last_edit = 0.0
+
+    async for kind, payload in stream_from_pool(target, question):
+        if kind == "error":
+            raise payload
+        if kind == "context":
+            sources_text = format_sources(payload)
+            continue
+
+        answer += payload
+        now = time.monotonic()
+        if reply is None:
+            reply = await update.message.reply_text(answer[:TELEGRAM_MAX_LENGTH] or "…")
+            last_edit = now
+        elif now - last_edit >= EDIT_INTERVAL:
+            await safe_edit(reply, answer + " ▌")
+            last_edit = now
+
+    final_reply = f"{answer}{sources_text}"
+    if reply is None:
+        reply = await update.message.reply_text(final_reply[:TELEGRAM_MAX_LENGTH])
+    elif not await safe_edit(reply, final_reply, final=True):
+        # Pesan bertahap tertinggal dengan kursor " ▌": kirim jawaban lengkap sebagai pesan baru
+        reply = await update.message.reply_text(final_reply[:TELEGRAM_MAX_LENGTH])
+    # Jawaban lebih panjang dari batas Telegram dikirim sebagai pesan lanjutan
+    for i in range(TELEGRAM_MAX_LENGTH, len(final_reply), TELEGRAM_MAX_LENGTH):
+        await update.message.reply_text(final_reply[i:i + TELEGRAM_MAX_LENGTH])
+
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Fungsi utama: Terima pesan -> Tanya AI -> Balas"""
+    """Fungsi utama: Terima pesan -> Tanya AI -> Balas (streaming)"""
+    global pending_total
     user_text = update.message.text
     user_name = update.effective_user.first_name
-    
+    chat_id = update.effective_chat.id
+
     print(f"📩 {user_name}: {user_text}")
-    
-    # Beri status 'Typing...' biar user tahu bot sedang mikir
-    await context.bot.send_chat_action(chat_id=update.effective_chat.id, action='typing')
 
-    if not rag_chain:
+    try:
+        target = tenants.engine_for("telegram", chat_id, engine, system_prompt=SYSTEM_PROMPT,
+                                    answer_cache=ANSWER_CACHE_ENABLED)
+    except PermissionError as e:
+        print(f"🚫 {e}")
+        await update.message.reply_text("🚫 Chat ini belum diberi akses ke dokumen mana pun. Hubungi admin.")
+        return
+    if not target:
         await update.message.reply_text("⚠️ Error: Database belum siap.")
         return
 
+    # Backpressure: kalau penuh, langsung balas "sibuk" daripada menumpuk thread
+    if pending_total >= MAX_PENDING or pending_per_chat[chat_id] >= MAX_PER_CHAT:
+        await update.message.reply_text("⏳ Maaf, saya sedang sibuk melayani banyak pertanyaan. Coba lagi sebentar lagi ya.")
+        return
+
+    pending_total += 1
+    pending_per_chat[chat_id] += 1
     try:
-        # Panggil RAG Chain (Proses berpikir)
-        # Note: Kita jalankan synchronous code di dalam async wrapper
-        response = await asyncio.to_thread(rag_chain.invoke, {"input": user_text})
-        answer = response['answer']
-        
-        # (Opsional) Ambil Sumber
-        sources = []
-        for doc in response['context']:
-            page = doc.metadata.get('page', '?')
-            source_file = os.path.basename(doc.metadata.get('source', 'Doc'))
-            sources.append(f"- {source_file} (Hal {page})")
-        
-        # Format Balasan
-        source_text = "\n\n📚 *Sumber:*\n" + "\n".join(sources) if sources else ""
-        final_reply = f"{answer}{source_text}"
-        
-        # Kirim Balasan (Parse Markdown agar bold/italic jalan)
-        await update.message.reply_text(final_reply)
+        async with chat_locks[chat_id]:
+            # Beri status 'Typing...' biar user tahu bot sedang mikir
+            await context.bot.send_chat_action(chat_id=chat_id, action='typing')
+            await stream_reply(update, target, user_text)
 
     except Exception as e:
         print(f"❌ Error: {e}")
         await update.message.reply_text("Maaf, saya pusing. Coba lagi nanti.")
+    finally:
+        pending_total -= 1
+        pending_per_chat[chat_id] -= 1
+        if pending_per_chat[chat_id] == 0:
+            del pending_per_chat[chat_id]
+            chat_locks.pop(chat_id, None)
 
 # --- 3. JALANKAN BOT ---
 if __name__ == '__main__':
     print("🚀 Bot Telegram Sedang Berjalan...")
-    app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+    # concurrent_updates: pesan dari banyak chat diproses bersamaan,
+    # batasnya diatur sendiri oleh MAX_PENDING / MAX_PER_CHAT / rag_pool
+    app = ApplicationBuilder().token(TELEGRAM_TOKEN).concurrent_updates(True).build()
 
     # Daftarkan Handlers
     app.add_handler(CommandHandler("start", start))
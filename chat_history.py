@@ -0,0 +1,130 @@
+import os
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import HumanMessage, SystemMessage
+
+# --- RIWAYAT CHAT TERBATAS + RINGKASAN BERGULIR ---
+# Riwayat penuh dikirim ke 2 prompt (reformulasi pertanyaan & QA) di setiap giliran,
+# jadi ukuran prompt terus membesar. Di sini:
+# - N giliran terakhir disimpan apa adanya
+# - giliran yang lebih lama dilipat ke ringkasan yang di-update bertahap oleh LLM
+# - total token riwayat dijaga di bawah batas keras
+
+MAX_TURNS = int(os.getenv("CHAT_HISTORY_MAX_TURNS", "4"))
+MAX_TOKENS = int(os.getenv("CHAT_HISTORY_MAX_TOKENS", "1500"))
+# Lipat beberapa giliran sekaligus supaya LLM ringkasan tidak dipanggil di setiap giliran
+FOLD_BATCH = int(os.getenv("CHAT_HISTORY_FOLD_BATCH", "2"))
+
+SUMMARY_PROMPT = (
+    "Perbarui ringkasan percakapan berikut dengan giliran-giliran baru. "
+    "Pertahankan fakta penting, nama, angka, dan topik yang sedang dibahas. "
+    "Tulis maksimal 5 kalimat.\n\n"
+    "Ringkasan sebelumnya:\n{summary}\n\n"
+    "Giliran baru:\n{turns}\n\n"
+    "Ringkasan terbaru:"
+)
+SUMMARY_PREFIX = "Ringkasan percakapan sebelumnya: "
+
+
+def approx_tokens(text):
+    """Estimasi kasar (±4 karakter per token)"""
+    return max(1, len(text) // 4)
+
+
+def _message_tokens(message):
+    return approx_tokens(str(message.content))
+
+
+class BoundedChatHistory(BaseChatMessageHistory):
+    """
+    Riwayat chat yang ukurannya tetap: `messages` berisi ringkasan (sebagai SystemMessage)
+    + giliran terakhir, maksimal `max_tokens`.
+    """
+
+    def __init__(self, llm=None, max_turns=MAX_TURNS, max_tokens=MAX_TOKENS, fold_batch=FOLD_BATCH,
+                 summary="", recent=None, total_turns=0):
+        self.llm = llm
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.fold_batch = fold_batch
+        self.summary = summary
+        self.recent = list(recent or [])
+        self.total_turns = total_turns
+        self.last_prompt_tokens = 0
+
+    # --- VIEW UNTUK PROMPT ---
+    @property
+    def messages(self):
+        recent = list(self.recent)
+        summary = self.summary
+        budget = self.max_tokens
+
+        # Batas keras: buang giliran tertua dulu (sisakan minimal 1 pasang), lalu potong ringkasan,
+        # terakhir potong isi pasangan yang tersisa
+        def total():
+            return sum(_message_tokens(m) for m in recent) + (approx_tokens(SUMMARY_PREFIX + summary) if summary else 0)
+
+        while total() > budget and len(recent) > 2:
+            recent.pop(0)
+        if summary and total() > budget:
+            # Prefix SystemMessage ikut dihitung supaya batasnya benar-benar keras
+            room = (budget - sum(_message_tokens(m) for m in recent)) * 4 - len(SUMMARY_PREFIX)
+            summary = summary[-room:] if room > 0 else ""
+        if total() > budget:
+            # Pasangan terakhir sendiri sudah melewati batas: potong pesan terpanjang dulu
+            # (hanya di view prompt, riwayat asli tetap utuh)
+            sizes = [_message_tokens(m) for m in recent]
+            cap = budget
+            while cap > 1 and sum(min(size, cap) for size in sizes) > budget:
+                cap -= 1
+            recent = [
+                m.model_copy(update={"content": str(m.content)[:cap * 4]}) if size > cap else m
+                for m, size in zip(recent, sizes)
+            ]
+
+        result = []
+        if summary:
+            result.append(SystemMessage(content=SUMMARY_PREFIX + summary))
+        result.extend(recent)
+        self.last_prompt_tokens = sum(_message_tokens(m) for m in result)
+        return result
+
+    # --- UPDATE ---
+    def _turn_starts(self):
+        return [i for i, m in enumerate(self.recent) if isinstance(m, HumanMessage)]
+
+    def add_messages(self, messages):
+        for message in messages:
+            if isinstance(message, HumanMessage):
+                self.total_turns += 1
+            self.recent.append(message)
+
+        starts = self._turn_starts()
+        if len(starts) > self.max_turns + self.fold_batch:
+            cut = starts[len(starts) - self.max_turns]
+            folded, self.recent = self.recent[:cut], self.recent[cut:]
+            self._fold(folded)
+
+    def _fold(self, folded):
+        turns = "\n".join(
+            f"{'User' if isinstance(m, HumanMessage) else 'Asisten'}: {m.content}" for m in folded
+        )
+        if self.llm is None:
+            # Tanpa LLM: giliran lama cukup dibuang (riwayat tetap terbatas)
+            return
+        prompt = SUMMARY_PROMPT.format(summary=self.summary or "-", turns=turns)
+        self.summary = str(self.llm.invoke(prompt).content).strip()
+
+    def clear(self):
+        self.summary = ""
+        self.recent = []
+        self.total_turns = 0
+
+    # --- MONITORING ---
+    def size_report(self):
+        self.messages  # hitung ulang last_prompt_tokens untuk state terbaru
+        return {
+            "turns": self.total_turns,
+            "recent_messages": len(self.recent),
+            "summary_tokens": approx_tokens(self.summary) if self.summary else 0,
+            "prompt_tokens": self.last_prompt_tokens,
+        }
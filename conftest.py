@@ -0,0 +1 @@
+# Root repo dimasukkan ke sys.path oleh pytest (modul-modul di repo ini berupa script top-level)
@@ -0,0 +1,148 @@
+from typing import Any
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# --- KOMPRESI KONTEKS SETELAH RETRIEVAL ---
+# Chunker memakai overlap antar chunk, jadi chunk hasil retrieval sering mengulang teks
+# atau merupakan potongan bersebelahan dari halaman yang sama. Tahap ini:
+# 1. Membuang chunk yang isinya sudah tercakup chunk lain
+# 2. Menggabungkan chunk yang overlap/bersebelahan (source & page sama) jadi satu passage
+# 3. Memasukkan passage ke budget token, urut dari peringkat terbaik
+
+MIN_TEXT_OVERLAP = 20
+MAX_TEXT_OVERLAP = 400
+
+
+def approx_tokens(text):
+    """Estimasi kasar (±4 karakter per token), cukup untuk menjaga ukuran prompt"""
+    return max(1, len(text) // 4)
+
+
+def _text_overlap(left, right):
+    """Panjang suffix `left` yang sama dengan prefix `right` (0 jika tidak ada)"""
+    longest = min(len(left), len(right), MAX_TEXT_OVERLAP)
+    for size in range(longest, MIN_TEXT_OVERLAP - 1, -1):
+        if right.startswith(left[-size:]):
+            return size
+    return 0
+
+
+def _merge_pair(left, right):
+    """
+    Coba gabungkan dua passage dari halaman yang sama.
+    Return teks gabungan, atau None jika keduanya tidak bersambung.
+    """
+    left_text, left_start = left["text"], left["start"]
+    right_text, right_start = right["text"], right["start"]
+
+    if left_start is not None and right_start is not None:
+        left_end = left_start + len(left_text)
+        if right_start < left_start or right_start > left_end:
+            return None
+        skip = left_end - right_start
+        return left_text + right_text[skip:] if skip < len(right_text) else left_text
+
+    overlap = _text_overlap(left_text, right_text)
+    if overlap:
+        return left_text + right_text[overlap:]
+    return None
+
+
+def _truncate(text, token_budget):
+    """Potong teks ke budget token (estimasi approx_tokens), mundur ke spasi terdekat"""
+    limit = token_budget * 4
+    if len(text) <= limit:
+        return text
+    cut = max(text.rfind(" ", 0, limit + 1), text.rfind("\n", 0, limit + 1))
+    return text[:cut if cut > limit // 2 else limit].rstrip()
+
+
+def _merge_once(items):
+    """Gabungkan satu pasangan yang bersambung (in-place). Return True jika ada yang digabung."""
+    for left in items:
+        for right in items:
+            if left is right:
+                continue
+            merged = _merge_pair(left, right)
+            if merged is None:
+                continue
+            left["text"] = merged
+            left["rank"] = min(left["rank"], right["rank"])
+            left["members"] += right["members"]
+            items.remove(right)
+            return True
+    return False
+
+
+def compress_documents(docs, token_budget):
+    """
+    `docs` terurut dari yang paling relevan. Return list Document hasil merge,
+    masih urut relevansi, dengan total token <= token_budget
+    (passage terbaik yang lebih besar dari budget dipotong, metadata["truncated"] = True).
+    """
+    # 1. Buang duplikat / chunk yang tercakup chunk lain
+    unique = []
+    for rank, doc in enumerate(docs):
+        text = doc.page_content
+        if any(text in other["text"] for other in unique):
+            continue
+        unique = [other for other in unique if other["text"] not in text]
+        unique.append({
+            "rank": rank,
+            "text": text,
+            "start": doc.metadata.get("start_index"),
+            "metadata": dict(doc.metadata),
+            "members": 1,
+        })
+
+    # 2. Gabungkan chunk bersebelahan per (source, page)
+    groups = {}
+    for item in unique:
+        key = (item["metadata"].get("source"), item["metadata"].get("page"))
+        groups.setdefault(key, []).append(item)
+
+    passages = []
+    for items in groups.values():
+        items.sort(key=lambda item: (item["start"] is None, item["start"] or 0, item["rank"]))
+        # Ulangi sampai tidak ada lagi pasangan yang bisa digabung (jumlah item kecil, cukup murah)
+        while len(items) > 1 and _merge_once(items):
+            pass
+        passages.extend(items)
+
+    # 3. Packing ke budget token sesuai peringkat
+    passages.sort(key=lambda item: item["rank"])
+    packed, used = [], 0
+    for item in passages:
+        text = item["text"]
+        tokens = approx_tokens(text)
+        if used + tokens > token_budget:
+            if packed:
+                continue  # coba passage berikutnya yang mungkin lebih kecil
+            # Passage terbaik sendiri sudah melebihi budget: potong, jangan kirim konteks kosong
+            text = _truncate(text, token_budget)
+            tokens = approx_tokens(text)
+            item["metadata"]["truncated"] = True
+        used += tokens
+        metadata = item["metadata"]
+        if item["members"] > 1:
+            metadata["merged_chunks"] = item["members"]
+            if item["start"] is not None:
+                metadata["start_index"] = item["start"]
+        packed.append(Document(page_content=text, metadata=metadata))
+    return packed
+
+
+class CompressingRetriever(BaseRetriever):
+    """Bungkus retriever lain: ambil kandidat lebih banyak, lalu merge & packing ke budget token"""
+
+    base_retriever: Any
+    token_budget: int = 1000
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        docs = self.base_retriever.invoke(query)
+        return compress_documents(docs, self.token_budget)
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None):
+        docs = await self.base_retriever.ainvoke(query)
+        return compress_documents(docs, self.token_budget)
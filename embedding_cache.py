@@ -0,0 +1,360 @@
+import os
+import json
+import time
+import inspect
+import sqlite3
+import hashlib
+import threading
+import weakref
+import unicodedata
+from array import array
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+load_dotenv()
+
+# --- KONFIGURASI BACKEND & CACHE ---
+# gemini = API Google (default), local = sentence-transformers di CPU (lihat local_embeddings.py)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "gemini")
+EMBEDDING_MODEL = "gemini-embedding-001"
+CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./.embedding_cache/embeddings.sqlite3")
+CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+CACHE_ENABLED = os.getenv("EMBEDDING_CACHE", "1") != "0"
+
+
+def normalize_text(text):
+    """Normalisasi ringan: unicode NFC + whitespace dirapikan (huruf besar/kecil tidak diubah)"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+# Worker serve_prefork.py di-fork dari master yang sudah memuat engine: buka ulang koneksi cache di worker
+_open_caches = weakref.WeakSet()
+_inherited_connections = []
+
+
+def _reopen_caches_after_fork():
+    for cache in list(_open_caches):
+        cache._reopen_after_fork()
+
+
+os.register_at_fork(after_in_child=_reopen_caches_after_fork)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wrapper Embeddings dengan cache SQLite di disk.
+    Key = (nama model, jenis embedding, hash teks yang sudah dinormalisasi).
+    Jenis dibedakan karena Gemini memakai task_type berbeda untuk dokumen & query.
+    """
+
+    def __init__(self, underlying, model_name, db_path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._connect()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings(last_access)")
+        self._conn.commit()
+        self._init_counter()
+        _open_caches.add(self)
+
+    def _connect(self):
+        # Satu koneksi dipakai bersama oleh banyak thread (dijaga oleh self._lock)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+    def _reopen_after_fork(self):
+        # Koneksi SQLite tidak boleh dipakai lintas fork. Koneksi warisan tidak di-close
+        # (close di child bisa mengganggu lock/WAL milik proses induk), cukup ditinggal.
+        _inherited_connections.append(self._conn)
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _init_counter(self):
+        # File cache dipakai bersama oleh worker prefork: jumlah entry dijaga trigger di tabel
+        # embedding_count (bukan counter per proses), diisi sekali dari COUNT(*) untuk file lama
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_count ("
+                " id INTEGER PRIMARY KEY CHECK (id = 0), n INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS embeddings_count_insert AFTER INSERT ON embeddings"
+                " BEGIN UPDATE embedding_count SET n = n + 1; END"
+            )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS embeddings_count_delete AFTER DELETE ON embeddings"
+                " BEGIN UPDATE embedding_count SET n = n - 1; END"
+            )
+            self._conn.execute(
+                "INSERT OR IGNORE INTO embedding_count (id, n) SELECT 0, COUNT(*) FROM embeddings"
+            )
+            self._conn.commit()
+        except BaseException:
+            self._conn.rollback()
+            raise
+
+    def _entry_count(self):
+        return self._conn.execute("SELECT n FROM embedding_count").fetchone()[0]
+
+    # --- UTILITAS INTERNAL ---
+    def _key(self, kind, text):
+        raw = f"{self.model_name}|{kind}|{normalize_text(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _pack(vector):
+        return array("f", vector).tobytes()
+
+    @staticmethod
+    def _unpack(blob):
+        vector = array("f")
+        vector.frombytes(blob)
+        return vector.tolist()
+
+    def _lookup(self, keys):
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        now = time.time()
+        with self._lock:
+            # SQLite membatasi jumlah parameter per query, jadi lookup dipecah per 500 key
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = self._unpack(blob)
+            if found:
+                # Update waktu akses untuk LRU
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+        return found
+
+    def _store(self, items):
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE: insert, hitung, dan eviction dalam satu transaksi tulis,
+            # jadi worker lain tidak bisa menyisip di antaranya
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                    [(key, self._pack(vector), now) for key, vector in items],
+                )
+                count = self._entry_count()
+                if count > self.max_entries:
+                    self._evict(count)
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def _evict(self, count):
+        # Buang entry yang paling lama tidak diakses, sisakan 90% kapasitas
+        # supaya eviction tidak jalan di setiap insert.
+        target = int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            " SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+            (count - target,),
+        )
+
+    # --- API LANGCHAIN EMBEDDINGS ---
+    def _embed_many(self, kind, texts, compute):
+        keys = [self._key(kind, text) for text in texts]
+        cached = self._lookup(keys)
+
+        # Teks yang belum ada di cache (tanpa duplikat) dikirim dalam satu panggilan
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        miss_count = sum(1 for key in keys if key not in cached)
+        with self._lock:
+            self.hits += len(keys) - miss_count
+            self.misses += miss_count
+
+        if missing:
+            vectors = compute(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self._store(fresh.items())
+            cached.update(fresh)
+
+        return [cached[key] for key in keys]
+
+    def embed_documents(self, texts):
+        return self._embed_many("document", texts, self.underlying.embed_documents)
+
+    def embed_queries(self, texts):
+        """Banyak query sekaligus (mis. mode batch): cache dicek per query, sisanya satu panggilan API"""
+        return self._embed_many("query", texts, lambda missing: embed_queries(self.underlying, missing))
+
+    def embed_query(self, text):
+        key = self._key("query", text)
+        cached = self._lookup([key])
+        if key in cached:
+            with self._lock:
+                self.hits += 1
+            return cached[key]
+
+        with self._lock:
+            self.misses += 1
+        vector = self.underlying.embed_query(text)
+        self._store([(key, vector)])
+        return vector
+
+    def stats(self):
+        total = self.hits + self.misses
+        with self._lock:
+            entries = self._entry_count()
+        return {
+            "model": self.model_name,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def embed_queries(embeddings, texts):
+    """
+    Embed banyak query dalam satu panggilan jika backend mendukung.
+    Gemini: embed_documents dengan task_type query (bukan embed_query berulang).
+    """
+    batch = getattr(embeddings, "embed_queries", None)
+    if batch is not None:
+        return batch(texts)
+    if "task_type" in inspect.signature(embeddings.embed_documents).parameters:
+        return embeddings.embed_documents(texts, task_type="RETRIEVAL_QUERY")
+    return [embeddings.embed_query(text) for text in texts]
+
+
+# --- FACTORY (DIPAKAI SEMUA ENTRY POINT) ---
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def _default_model(backend):
+    if backend == "local":
+        from local_embeddings import LOCAL_EMBEDDING_MODEL
+        return LOCAL_EMBEDDING_MODEL
+    return EMBEDDING_MODEL
+
+
+def embedding_model_id(backend=EMBEDDING_BACKEND, model=None):
+    """ID model yang dicatat per collection, mis. 'gemini:gemini-embedding-001'"""
+    return f"{backend}:{model or _default_model(backend)}"
+
+
+def get_embeddings(model=None, backend=EMBEDDING_BACKEND):
+    """
+    Embeddings sesuai EMBEDDING_BACKEND. Satu instance per (backend, model) per proses.
+    Gemini memakai cache disk; backend lokal tidak (embedding lokal sudah ~ms per query).
+    """
+    model = model or _default_model(backend)
+    with _instances_lock:
+        key = (backend, model)
+        if key not in _instances:
+            if backend == "local":
+                from local_embeddings import LocalEmbeddings
+                _instances[key] = LocalEmbeddings(model_name=model)
+            elif backend == "gemini":
+                from langchain_google_genai import GoogleGenerativeAIEmbeddings
+                from gemini_limiter import limit_embeddings
+
+                # Limiter di bawah cache: cache hit tidak memakai kuota API
+                underlying = limit_embeddings(GoogleGenerativeAIEmbeddings(model=model))
+                if CACHE_ENABLED:
+                    _instances[key] = CachedEmbeddings(underlying, model_name=model)
+                else:
+                    _instances[key] = underlying
+            else:
+                raise ValueError(f"EMBEDDING_BACKEND tidak dikenal: '{backend}' (pilih gemini/local)")
+        return _instances[key]
+
+
+# --- GUARD: COLLECTION HARUS DI-QUERY DENGAN MODEL YANG SAMA ---
+# Model & dimensi yang dipakai saat ingest dicatat di chroma_db/embedding_<collection>.json.
+# Collection lama tanpa file ini dianggap dibangun dengan Gemini (satu-satunya model sebelumnya).
+LEGACY_MODEL_ID = f"gemini:{EMBEDDING_MODEL}"
+
+
+def signature_path(persist_directory, collection_name):
+    return os.path.join(persist_directory, f"embedding_{collection_name}.json")
+
+
+def collection_dimension(vectorstore):
+    """Dimensi vector yang tersimpan di collection (None jika masih kosong), tanpa panggilan embedding"""
+    if not hasattr(vectorstore, "_collection"):
+        return vectorstore.dimension  # FlatVectorStore
+    data = vectorstore._collection.get(limit=1, include=["embeddings"])
+    embeddings = data.get("embeddings")
+    if embeddings is None or len(embeddings) == 0:
+        return None
+    return len(embeddings[0])
+
+
+def read_embedding_signature(persist_directory, collection_name):
+    """Model & dimensi yang tercatat untuk collection ini (tanpa file: collection lama berbasis Gemini)"""
+    path = signature_path(persist_directory, collection_name)
+    if not os.path.exists(path):
+        return {"model": LEGACY_MODEL_ID}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def check_embedding_compat(vectorstore, persist_directory, collection_name, embeddings,
+                           model_id=None):
+    """Tolak query/ingest ke collection yang dibangun dengan model atau dimensi berbeda"""
+    model_id = model_id or embedding_model_id()
+    dimension = collection_dimension(vectorstore)
+    if dimension is None:
+        return  # collection kosong, model apa saja boleh
+
+    stored = read_embedding_signature(persist_directory, collection_name)
+    expected_dimension = getattr(embeddings, "dimension", None)
+    if stored["model"] != model_id or (expected_dimension and expected_dimension != dimension):
+        raise ValueError(
+            f"Collection '{collection_name}' dibangun dengan {stored['model']} (dimensi {dimension}), "
+            f"tapi backend aktif adalah {model_id}"
+            + (f" (dimensi {expected_dimension})" if expected_dimension else "")
+            + ". Samakan EMBEDDING_BACKEND atau ingest ulang ke collection lain."
+        )
+
+
+def write_embedding_signature(vectorstore, persist_directory, collection_name, model_id=None):
+    """Dipanggil setelah ingest: catat model & dimensi yang dipakai collection ini"""
+    payload = {
+        "model": model_id or embedding_model_id(),
+        "dimension": collection_dimension(vectorstore),
+    }
+    path = signature_path(persist_directory, collection_name)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2)
+
+
+if __name__ == "__main__":
+    # Cek isi cache: python embedding_cache.py
+    cache = CachedEmbeddings(underlying=None, model_name=EMBEDDING_MODEL)
+    print(f"📦 Cache: {CACHE_PATH}")
+    print(f"   Entry tersimpan: {cache.stats()['entries']} / {CACHE_MAX_ENTRIES}")
@@ -0,0 +1,278 @@
+import os
+import json
+import uuid
+import argparse
+import threading
+from typing import Any, NamedTuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+# --- FLAT INDEX (NUMPY MEMORY-MAPPED) SEBAGAI ALTERNATIF CHROMA ---
+# Untuk corpus puluhan ribu chunk, brute force exact search sudah sub-milidetik:
+# - Vector dinormalisasi, disimpan sebagai matriks .npy (float32/float16) yang di-mmap.
+#   Beberapa proses bot berbagi halaman yang sama lewat page cache OS, start-up hampir instan.
+# - Teks & metadata di file sidecar (JSON).
+# - Top-k = satu perkalian matriks-vector + argpartition (recall exact, tanpa HNSW).
+# Dibangun dari collection Chroma: python flat_index.py --collection knowledge_base_perusahaan
+
+PERSIST_DIRECTORY = "./chroma_db"
+COLLECTION_NAME = "knowledge_base_perusahaan"
+# VECTOR_STORE=flat: engine query ke flat index, ingest meng-export ulang flat index setelah selesai
+FLAT_INDEX_ENABLED = os.getenv("VECTOR_STORE", "chroma") == "flat"
+FLAT_INDEX_DTYPE = os.getenv("FLAT_INDEX_DTYPE", "float32")
+VECTORS_FILE = "vectors.npy"
+META_FILE = "meta.json"
+# float16: scoring per blok supaya tidak menyalin seluruh matriks ke float32 di setiap query
+FLOAT16_BLOCK_ROWS = 8192
+
+
+def flat_path(persist_directory=PERSIST_DIRECTORY, collection_name=COLLECTION_NAME):
+    return os.path.join(persist_directory, f"flat_{collection_name}")
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _matches(metadata, where):
+    return all(metadata.get(key) == value for key, value in where.items())
+
+
+def _open_matrix(path):
+    """
+    mmap read-only file .npy lewat SATU file handle. np.load(path, mmap_mode="r") membuka file dua kali
+    (header & mmap), sehingga os.replace dari proses ingest di antaranya bisa memasangkan header & data berbeda.
+    """
+    with open(path, "rb") as f:
+        version = np.lib.format.read_magic(f)
+        read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+        shape, fortran_order, dtype = read_header(f)
+        return np.memmap(f, dtype=dtype, mode="r", shape=shape, order="F" if fortran_order else "C", offset=f.tell())
+
+
+class _FlatState(NamedTuple):
+    """Satu versi index. Diganti utuh dengan satu assignment: query tidak pernah melihat matriks & teks campuran."""
+    matrix: np.ndarray
+    ids: list
+    texts: list
+    metadatas: list
+    position: dict
+    mtime: Any
+
+
+class FlatVectorStore(VectorStore):
+    """
+    VectorStore LangChain di atas matriks numpy. Read-mostly: dipakai engine untuk query,
+    data diisi dari Chroma (export_from_chroma) atau add_texts.
+    File dimuat ulang otomatis jika index di disk dibangun ulang (habis ingest).
+    """
+
+    def __init__(self, path, embedding, dtype="float32"):
+        self.path = path
+        self._embedding = embedding
+        self.dtype = np.dtype(dtype)
+        self._state = _FlatState(np.zeros((0, 0), dtype=self.dtype), [], [], [], {}, None)
+        # Hanya untuk muat ulang & tulis; query cukup membaca self._state sekali
+        self._lock = threading.RLock()
+        self._reload_if_changed()
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    @property
+    def dimension(self):
+        state = self._state
+        return state.matrix.shape[1] if state.ids else None
+
+    def __len__(self):
+        return len(self._state.ids)
+
+    # --- MUAT / SIMPAN ---
+    def _reload_if_changed(self):
+        """Return state terbaru (dimuat ulang dari disk jika meta.json berubah)"""
+        meta_path = os.path.join(self.path, META_FILE)
+        try:
+            mtime = os.stat(meta_path).st_mtime_ns
+        except FileNotFoundError:
+            return self._state
+        if mtime == self._state.mtime:
+            return self._state
+        with self._lock:
+            if mtime == self._state.mtime:
+                return self._state
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            matrix = _open_matrix(os.path.join(self.path, VECTORS_FILE))
+            if matrix.shape[0] != len(meta["ids"]):
+                return self._state  # sedang ditulis ulang, coba lagi di query berikutnya
+            ids = meta["ids"]
+            self.dtype = matrix.dtype
+            self._state = _FlatState(matrix, ids, meta["texts"], meta["metadatas"],
+                                     {doc_id: i for i, doc_id in enumerate(ids)}, mtime)
+            return self._state
+
+    def _write(self, matrix, ids, texts, metadatas):
+        os.makedirs(self.path, exist_ok=True)
+        # Tulis ke file sementara lalu os.replace: proses lain yang masih mmap file lama tetap aman
+        vectors_path = os.path.join(self.path, VECTORS_FILE)
+        np.save(vectors_path + ".tmp.npy", np.ascontiguousarray(matrix, dtype=self.dtype))
+        os.replace(vectors_path + ".tmp.npy", vectors_path)
+
+        meta_path = os.path.join(self.path, META_FILE)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "texts": texts, "metadatas": metadatas}, f, ensure_ascii=False)
+        os.replace(meta_path + ".tmp", meta_path)
+        self._state = self._state._replace(mtime=None)  # paksa muat ulang walaupun mtime kebetulan sama
+        self._reload_if_changed()
+
+    # --- TULIS ---
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        vectors = self._embedding.embed_documents(texts)
+        return self.add_vectors(vectors, texts, metadatas, ids)
+
+    def add_vectors(self, vectors, texts, metadatas=None, ids=None):
+        """Upsert vector yang sudah dihitung (tanpa memanggil model embedding)"""
+        metadatas = list(metadatas or [{} for _ in texts])
+        # uuid4, bukan nomor urut: nomor urut bisa bentrok dengan ID lama setelah ada yang dihapus
+        ids = list(ids or [str(uuid.uuid4()) for _ in texts])
+        replaced = set(ids)
+        with self._lock:
+            state = self._reload_if_changed()
+            keep = [i for i, doc_id in enumerate(state.ids) if doc_id not in replaced]
+
+            new = _normalize(vectors).astype(self.dtype)
+            old = np.asarray(state.matrix[keep]) if keep else np.zeros((0, new.shape[1]), dtype=self.dtype)
+            self._write(
+                np.vstack([old, new]),
+                [state.ids[i] for i in keep] + ids,
+                [state.texts[i] for i in keep] + list(texts),
+                [state.metadatas[i] for i in keep] + metadatas,
+            )
+        return ids
+
+    def delete(self, ids=None, **kwargs):
+        drop = set(ids or [])
+        with self._lock:
+            state = self._reload_if_changed()
+            keep = [i for i, doc_id in enumerate(state.ids) if doc_id not in drop]
+            self._write(
+                np.asarray(state.matrix[keep]),
+                [state.ids[i] for i in keep],
+                [state.texts[i] for i in keep],
+                [state.metadatas[i] for i in keep],
+            )
+        return True
+
+    # --- CARI ---
+    @staticmethod
+    def _scores(state, query_vector):
+        query = _normalize(query_vector)
+        if state.matrix.dtype == np.float32:
+            return state.matrix @ query
+        scores = np.empty(len(state.ids), dtype=np.float32)
+        for start in range(0, len(state.ids), FLOAT16_BLOCK_ROWS):
+            block = state.matrix[start:start + FLOAT16_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ query
+        return scores
+
+    @staticmethod
+    def _document(state, i):
+        return Document(page_content=state.texts[i], metadata=state.metadatas[i], id=state.ids[i])
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4, filter=None, **kwargs):
+        # Satu snapshot state untuk seluruh query, walaupun index dimuat ulang di tengah jalan
+        state = self._reload_if_changed()
+        if not state.ids:
+            return []
+        scores = self._scores(state, embedding)
+        if filter:
+            mask = np.fromiter((_matches(m, filter) for m in state.metadatas), dtype=bool, count=len(state.ids))
+            scores = np.where(mask, scores, -np.inf)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._document(state, i), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k, filter)
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        # Skor = cosine similarity [-1, 1] -> relevansi [0, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    def get_by_ids(self, ids):
+        state = self._reload_if_changed()
+        return [self._document(state, state.position[doc_id]) for doc_id in ids if doc_id in state.position]
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, path=None, dtype="float32", **kwargs):
+        store = cls(path or flat_path(), embedding, dtype=dtype)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+
+def export_from_chroma(vectorstore, path, dtype="float32", page_size=5000):
+    """
+    Salin isi collection Chroma (vector yang sudah ada, tanpa embedding ulang) ke flat index.
+    Matriks diisi per halaman langsung ke file, jadi memori tetap kecil.
+    """
+    collection = vectorstore._collection
+    total = collection.count()
+    os.makedirs(path, exist_ok=True)
+    ids, texts, metadatas = [], [], []
+    matrix = None
+    vectors_tmp = os.path.join(path, VECTORS_FILE + ".tmp.npy")
+
+    for offset in range(0, total, page_size):
+        data = collection.get(limit=page_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+        block = _normalize(data["embeddings"])
+        if matrix is None:
+            matrix = np.lib.format.open_memmap(vectors_tmp, mode="w+", dtype=np.dtype(dtype),
+                                               shape=(total, block.shape[1]))
+        matrix[offset:offset + len(block)] = block
+        ids.extend(data["ids"])
+        texts.extend(data["documents"])
+        metadatas.extend(m or {} for m in data["metadatas"])
+
+    if matrix is None:
+        print("⚠️ Collection kosong, flat index tidak dibuat")
+        return 0
+    matrix.flush()
+    del matrix
+    os.replace(vectors_tmp, os.path.join(path, VECTORS_FILE))
+
+    meta_path = os.path.join(path, META_FILE)
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"ids": ids, "texts": texts, "metadatas": metadatas}, f, ensure_ascii=False)
+    os.replace(meta_path + ".tmp", meta_path)
+    return total
+
+
+if __name__ == "__main__":
+    # Bangun flat index dari collection Chroma yang sudah ada:
+    # python flat_index.py --collection knowledge_base_perusahaan --dtype float16
+    import time
+    from langchain_chroma import Chroma
+
+    parser = argparse.ArgumentParser(description="Export collection Chroma ke flat index (numpy mmap)")
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    args = parser.parse_args()
+
+    store = Chroma(persist_directory=PERSIST_DIRECTORY, collection_name=args.collection)
+    started = time.perf_counter()
+    count = export_from_chroma(store, flat_path(PERSIST_DIRECTORY, args.collection), dtype=args.dtype)
+    print(f"✅ Flat index: {count} vector ({args.dtype}) dalam {time.perf_counter() - started:.1f}s "
+          f"-> {flat_path(PERSIST_DIRECTORY, args.collection)}")
@@ -0,0 +1,815 @@
+import os
+import re
+import json
+import math
+import time
+import heapq
+import random
+import sqlite3
+import asyncio
+import argparse
+import itertools
+import threading
+import weakref
+import contextvars
+from contextlib import contextmanager
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+
+# --- LAPISAN BERSAMA UNTUK SEMUA PANGGILAN GEMINI (CHAT & EMBEDDING) ---
+# Bot, batch & ingest memanggil Gemini tanpa koordinasi -> 429 saat berjalan bersamaan. Lapisan ini:
+# - token bucket requests/menit & token/menit per model (opsional dibagi antar proses lewat SQLite)
+# - prioritas: "interactive" (bot) didahulukan; "batch" (ingest, /batch) tidak boleh memakai cadangan kuota
+# - retry 429/5xx dengan exponential backoff + jitter (menghormati Retry-After / retry_delay dari server)
+# - circuit breaker: setelah beberapa kegagalan layanan (5xx/timeout, bukan 429) beruntun, panggilan baru
+#   langsung ditolak sampai cooldown habis
+# - hedging opsional: request interaktif yang lambat dikirim ulang, hasil tercepat yang dipakai
+# Uji tanpa API: python gemini_limiter.py fake-server & python gemini_limiter.py load-test
+
+GEMINI_LIMITER_ENABLED = os.getenv("GEMINI_LIMITER", "1") == "1"
+# Default = kuota tier berbayar 1 (gemini-2.5-flash-lite & gemini-embedding-001), sesuaikan dengan project
+GEMINI_CHAT_RPM = float(os.getenv("GEMINI_CHAT_RPM", "4000"))
+GEMINI_CHAT_TPM = float(os.getenv("GEMINI_CHAT_TPM", "4000000"))
+GEMINI_EMBED_RPM = float(os.getenv("GEMINI_EMBED_RPM", "3000"))
+GEMINI_EMBED_TPM = float(os.getenv("GEMINI_EMBED_TPM", "1000000"))
+# File SQLite bersama: semua proses di host (bot + ingest) berbagi satu kuota. Kosong = per proses.
+GEMINI_LIMITER_DB = os.getenv("GEMINI_LIMITER_DB", "")
+# Porsi kapasitas bucket yang disisakan untuk trafik interaktif (batch menunggu di atas batas ini)
+GEMINI_BATCH_RESERVE = float(os.getenv("GEMINI_BATCH_RESERVE", "0.2"))
+GEMINI_PRIORITY = os.getenv("GEMINI_PRIORITY", "interactive")
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "5"))
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "0.5"))
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "30"))
+GEMINI_BREAKER_THRESHOLD = int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5"))
+GEMINI_BREAKER_COOLDOWN = float(os.getenv("GEMINI_BREAKER_COOLDOWN", "30"))
+# Kirim duplikat jika request interaktif belum selesai setelah N detik (0 = tanpa hedging)
+GEMINI_HEDGE_AFTER = float(os.getenv("GEMINI_HEDGE_AFTER", "0"))
+# Thread pool hedging per model; jika penuh, request dijalankan langsung tanpa hedging
+GEMINI_HEDGE_WORKERS = int(os.getenv("GEMINI_HEDGE_WORKERS", "32"))
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RATE_LIMIT_STATUS = 429
+# Estimasi token (tokenizer Gemini tidak tersedia offline) & jatah output untuk bucket token/menit
+CHARS_PER_TOKEN = 4
+OUTPUT_TOKENS_ESTIMATE = 512
+# GoogleGenerativeAIEmbeddings mengirim maksimal 100 teks per request batchEmbedContents
+EMBED_TEXTS_PER_REQUEST = 100
+# Bucket bersama bisa diisi/dipakai proses lain, jadi waiter mengecek ulang paling lama tiap N detik
+MAX_POLL_SECONDS = 0.25
+
+# ChatGoogleGenerativeAI punya retry sendiri; dimatikan (1 percobaan) supaya backoff tidak bertumpuk
+INNER_RETRY_KWARGS = {"max_retries": 1} if GEMINI_LIMITER_ENABLED else {}
+
+_RETRYABLE_TEXT = re.compile(
+    r"\b(429|500|502|503|504)\b|RESOURCE_EXHAUSTED|UNAVAILABLE|DEADLINE_EXCEEDED|rate limit|quota", re.I)
+_RATE_LIMIT_TEXT = re.compile(r"\b429\b|RESOURCE_EXHAUSTED|rate limit|quota", re.I)
+_RETRY_DELAY = re.compile(r"retry in (\d+(?:\.\d+)?)\s*s|retry_delay\s*\{\s*seconds:\s*(\d+)", re.I)
+
+
+# --- PRIORITAS ---
+_default_priority = GEMINI_PRIORITY
+_priority = contextvars.ContextVar("gemini_priority", default=None)
+
+
+def set_default_priority(name):
+    """Prioritas default proses ini, mis. set_default_priority("batch") di script ingest"""
+    global _default_priority
+    if name not in PRIORITIES:
+        raise ValueError(f"Prioritas harus salah satu dari {list(PRIORITIES)}, bukan '{name}'")
+    _default_priority = name
+
+
+@contextmanager
+def priority(name):
+    """Prioritas untuk panggilan di dalam blok ini saja (mis. endpoint /batch di proses bot)"""
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get() or _default_priority
+
+
+# --- TOKEN BUCKET ---
+class TokenBucket:
+    """Bucket di memori proses. take() tidak pernah blok: return 0 jika berhasil, selain itu detik tunggu."""
+
+    def __init__(self, name, per_minute):
+        self.name = name
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self._level = per_minute
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def _transact(self, update):
+        """update(level) -> (hasil, level_baru); level sudah diisi ulang sesuai waktu berlalu"""
+        with self._lock:
+            now = time.time()
+            level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+            result, self._level = update(level)
+            self._updated = now
+            return result
+
+    def take(self, amount, reserve=0.0):
+        # Permintaan lebih besar dari kapasitas tetap bisa lewat (menunggu bucket penuh)
+        amount = min(amount, self.capacity * (1 - reserve))
+        floor = amount + reserve * self.capacity
+
+        def update(level):
+            if level >= floor:
+                return 0.0, level - amount
+            return (floor - level) / self.rate, level
+
+        return self._transact(update)
+
+    def give(self, amount):
+        """Kembalikan token (negatif = tagih tambahan, mis. pemakaian token aktual lebih besar)"""
+        self._transact(lambda level: (None, min(self.capacity, level + amount)))
+
+
+_shared_buckets = weakref.WeakSet()
+_inherited_connections = []
+
+
+def _reopen_buckets_after_fork():
+    for bucket in list(_shared_buckets):
+        bucket._reopen_after_fork()
+
+
+os.register_at_fork(after_in_child=_reopen_buckets_after_fork)
+
+
+class SharedTokenBucket(TokenBucket):
+    """Bucket yang state-nya di SQLite: semua proses yang memakai file yang sama berbagi kuota"""
+
+    def __init__(self, name, per_minute, path):
+        super().__init__(name, per_minute)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._connect()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)")
+        _shared_buckets.add(self)
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+
+    def _reopen_after_fork(self):
+        # Worker serve_prefork.py: koneksi warisan master ditinggal (tidak di-close), buka koneksi sendiri
+        _inherited_connections.append(self._conn)
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _transact(self, update):
+        with self._lock:
+            # BEGIN IMMEDIATE: kunci tulis diambil di awal, jadi baca-ubah-tulis atomik antar proses
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._conn.execute("SELECT level, updated FROM buckets WHERE name = ?", (self.name,)).fetchone()
+                level = self.capacity if row is None else min(self.capacity, row[0] + (now - row[1]) * self.rate)
+                result, level = update(level)
+                self._conn.execute("INSERT OR REPLACE INTO buckets (name, level, updated) VALUES (?, ?, ?)",
+                                   (self.name, level, now))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return result
+
+
+class RateLimiter:
+    """Requests/menit + token/menit untuk satu model, dengan antrian berprioritas di dalam proses"""
+
+    def __init__(self, name, rpm, tpm, shared_path=GEMINI_LIMITER_DB, batch_reserve=GEMINI_BATCH_RESERVE):
+        def bucket(suffix, per_minute):
+            if shared_path:
+                return SharedTokenBucket(f"{name}:{suffix}", per_minute, shared_path)
+            return TokenBucket(f"{name}:{suffix}", per_minute)
+
+        self.name = name
+        self.requests = bucket("rpm", rpm)
+        self.tokens = bucket("tpm", tpm)
+        self.batch_reserve = batch_reserve
+        self.waited_seconds = defaultdict(float)
+        self.acquired = defaultdict(int)
+        self._queue = []  # heap (prioritas, urutan datang)
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def _take(self, requests, tokens, reserve):
+        wait_seconds = self.requests.take(requests, reserve)
+        if wait_seconds:
+            return wait_seconds
+        wait_seconds = self.tokens.take(tokens, reserve)
+        if wait_seconds:
+            self.requests.give(requests)
+        return wait_seconds
+
+    def try_acquire(self, requests=1, tokens=0):
+        """Tanpa menunggu & tanpa menyalip antrian (dipakai hedging: hanya jika kuota longgar)"""
+        with self._cond:
+            return not self._queue and self._take(requests, tokens, self.batch_reserve) == 0
+
+    def acquire(self, requests=1, tokens=0, priority_name=None):
+        """Blok sampai kuota tersedia. Interactive selalu di depan batch; urutan datang dalam satu kelas."""
+        priority_name = priority_name or current_priority()
+        reserve = self.batch_reserve if priority_name == "batch" else 0.0
+        entry = (PRIORITIES.get(priority_name, 1), next(self._sequence))
+        started = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    if self._queue[0] == entry:
+                        wait_seconds = self._take(requests, tokens, reserve)
+                        if not wait_seconds:
+                            break
+                        self._cond.wait(min(wait_seconds, MAX_POLL_SECONDS))
+                    else:
+                        self._cond.wait(MAX_POLL_SECONDS)
+            finally:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+        waited = time.monotonic() - started
+        self.waited_seconds[priority_name] += waited
+        self.acquired[priority_name] += 1
+        return waited
+
+
+# --- CIRCUIT BREAKER ---
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    closed -> open (setelah `threshold` kegagalan beruntun) -> half-open (1 percobaan) -> closed.
+    Hanya kegagalan layanan (5xx, timeout, koneksi) yang dihitung; 429 cukup di-backoff.
+    """
+
+    def __init__(self, name, threshold=GEMINI_BREAKER_THRESHOLD, cooldown=GEMINI_BREAKER_COOLDOWN):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.opens = 0
+        self._trial = None  # token percobaan half-open yang sedang berjalan
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "open" if time.monotonic() - self.opened_at < self.cooldown else "half_open"
+
+    def before(self):
+        """Raise CircuitOpenError jika open. Return token percobaan half-open (None jika closed)."""
+        with self._lock:
+            if self.opened_at is None:
+                return None
+            remaining = self.cooldown - (time.monotonic() - self.opened_at)
+            if remaining > 0 or self._trial is not None:
+                raise CircuitOpenError(
+                    f"Layanan Gemini ({self.name}) sedang dibatasi, coba lagi dalam {max(remaining, 1):.0f} detik")
+            self._trial = object()
+            return self._trial
+
+    def release_trial(self, trial):
+        """Percobaan half-open berakhir tanpa hasil (dibatalkan / BaseException): percobaan lain boleh jalan"""
+        with self._lock:
+            if trial is not None and self._trial is trial:
+                self._trial = None
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial is not None or (self.opened_at is None and self.failures >= self.threshold):
+                self.opened_at = time.monotonic()
+                self.opens += 1
+            self._trial = None
+
+
+# --- KLASIFIKASI ERROR & BACKOFF ---
+def is_retryable(error):
+    if isinstance(error, CircuitOpenError):
+        return False
+    code = _status_code(error)
+    if code is not None:
+        return code in RETRYABLE_STATUS
+    return isinstance(error, (TimeoutError, ConnectionError)) or bool(_RETRYABLE_TEXT.search(str(error)))
+
+
+def _status_code(error):
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    code = getattr(code, "value", code)  # HTTPStatus
+    return code if isinstance(code, int) else None
+
+
+def is_rate_limited(error):
+    """429 / RESOURCE_EXHAUSTED: kuota habis, bukan layanan yang rusak"""
+    code = _status_code(error)
+    if code is not None:
+        return code == RATE_LIMIT_STATUS
+    return bool(_RATE_LIMIT_TEXT.search(str(error)))
+
+
+def retry_after(error):
+    """Jeda yang diminta server (header Retry-After / 'retry in 12s' / retry_delay), atau None"""
+    headers = getattr(error, "headers", None)
+    if headers is not None and headers.get("Retry-After"):
+        try:
+            return float(headers.get("Retry-After"))
+        except ValueError:
+            pass
+    match = _RETRY_DELAY.search(str(error))
+    if match:
+        return float(match.group(1) or match.group(2))
+    return None
+
+
+class GeminiGuard:
+    """Gabungan limiter + retry + circuit breaker + hedging untuk satu model"""
+
+    def __init__(self, name, rpm, tpm, max_retries=GEMINI_MAX_RETRIES, hedge_after=GEMINI_HEDGE_AFTER,
+                 shared_path=GEMINI_LIMITER_DB, hedge_workers=GEMINI_HEDGE_WORKERS):
+        self.name = name
+        self.limiter = RateLimiter(name, rpm, tpm, shared_path=shared_path)
+        self.breaker = CircuitBreaker(name)
+        self.max_retries = max_retries
+        self.hedge_after = hedge_after
+        self.counters = defaultdict(int)
+        self._hedge_pool = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix=f"hedge-{name}")
+        # Satu slot = satu thread pool yang bebas: submit hanya jika ada slot, jadi request tidak pernah
+        # mengantre di pool (antrean pool terhitung "lambat" dan memicu hedge palsu)
+        self._hedge_slots = threading.BoundedSemaphore(hedge_workers)
+
+    def _backoff(self, attempt, error):
+        # Full jitter: acak di [0, min(max, base * 2^attempt)], tapi tidak lebih cepat dari permintaan server
+        delay = random.uniform(0, min(GEMINI_BACKOFF_MAX, GEMINI_BACKOFF_BASE * 2 ** attempt))
+        return max(delay, min(GEMINI_BACKOFF_MAX, retry_after(error) or 0.0))
+
+    def _record_failure(self, error):
+        """Hanya kegagalan layanan yang menggerakkan breaker; 429 tidak mengubah status breaker"""
+        if not is_retryable(error):
+            self.breaker.success()  # server menjawab (mis. 400), layanan tidak sedang bermasalah
+        elif not is_rate_limited(error):
+            self.breaker.failure()
+
+    def _failed(self, error, attempt):
+        """Return detik tunggu sebelum retry, atau raise jika tidak perlu / tidak boleh retry lagi"""
+        self._record_failure(error)
+        if not is_retryable(error):
+            self.counters["errors"] += 1
+            raise error
+        if is_rate_limited(error):
+            self.counters["rate_limited"] += 1
+        if attempt >= self.max_retries:
+            self.counters["exhausted"] += 1
+            raise error
+        self.counters["retries"] += 1
+        return self._backoff(attempt, error)
+
+    def _settle(self, estimated, actual):
+        self.breaker.success()
+        if actual:
+            self.limiter.tokens.give(estimated - actual)
+
+    def _hedging(self, hedge):
+        return hedge and self.hedge_after > 0 and current_priority() == "interactive"
+
+    # --- SYNC ---
+    def _submit(self, fn):
+        future = self._hedge_pool.submit(contextvars.copy_context().run, fn)
+        future.add_done_callback(lambda _: self._hedge_slots.release())
+        return future
+
+    def _hedged(self, fn, requests, tokens):
+        if not self._hedge_slots.acquire(blocking=False):
+            return fn()  # pool penuh: jalankan di thread pemanggil, tanpa hedging
+        first = self._submit(fn)
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done or not self._hedge_slots.acquire(blocking=False):
+            return first.result()
+        if not self.limiter.try_acquire(requests, tokens):
+            self._hedge_slots.release()
+            return first.result()
+        self.counters["hedges"] += 1
+        second = self._submit(fn)
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is second:
+                        self.counters["hedge_wins"] += 1
+                    return future.result()
+        return first.result()  # keduanya gagal: lempar error request pertama
+
+    def call(self, fn, requests=1, tokens=0, hedge=False, usage=None):
+        """Jalankan fn() dengan kuota, retry & breaker. usage(hasil) -> token aktual (koreksi bucket)"""
+        attempt, trial = 0, None
+        try:
+            while True:
+                # Breaker hanya menahan panggilan baru; retry tidak dipotong breaker yang dibuka kegagalannya sendiri
+                if attempt == 0:
+                    trial = self.breaker.before()
+                self.limiter.acquire(requests, tokens)
+                self.counters["calls"] += 1
+                try:
+                    result = self._hedged(fn, requests, tokens) if self._hedging(hedge) else fn()
+                except Exception as e:
+                    time.sleep(self._failed(e, attempt))
+                    attempt += 1
+                    continue
+                self._settle(tokens, usage(result) if usage else None)
+                return result
+        finally:
+            # KeyboardInterrupt / batal di tengah percobaan half-open: breaker jangan tertahan selamanya
+            self.breaker.release_trial(trial)
+
+    def stream(self, make_iterator, requests=1, tokens=0):
+        """Streaming: retry hanya jika gagal sebelum potongan pertama terkirim ke pemanggil"""
+        attempt, trial = 0, None
+        try:
+            while True:
+                if attempt == 0:
+                    trial = self.breaker.before()
+                self.limiter.acquire(requests, tokens)
+                self.counters["calls"] += 1
+                started = False
+                try:
+                    for item in make_iterator():
+                        started = True
+                        yield item
+                except Exception as e:
+                    if started:
+                        self._record_failure(e)
+                        raise
+                    time.sleep(self._failed(e, attempt))
+                    attempt += 1
+                    continue
+                self._settle(tokens, None)
+                return
+        finally:
+            # Termasuk GeneratorExit: stream ditutup pemanggil sebelum selesai
+            self.breaker.release_trial(trial)
+
+    # --- ASYNC ---
+    async def _ahedged(self, make_coro, requests, tokens):
+        first = asyncio.ensure_future(make_coro())
+        done, _ = await asyncio.wait([first], timeout=self.hedge_after)
+        if done or not self.limiter.try_acquire(requests, tokens):
+            return await first
+        self.counters["hedges"] += 1
+        second = asyncio.ensure_future(make_coro())
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+            return await first
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def acall(self, make_coro, requests=1, tokens=0, hedge=False, usage=None):
+        attempt, trial = 0, None
+        try:
+            while True:
+                if attempt == 0:
+                    trial = self.breaker.before()
+                # Menunggu kuota di thread supaya event loop tidak terblok
+                await asyncio.to_thread(self.limiter.acquire, requests, tokens, current_priority())
+                self.counters["calls"] += 1
+                try:
+                    if self._hedging(hedge):
+                        result = await self._ahedged(make_coro, requests, tokens)
+                    else:
+                        result = await make_coro()
+                except Exception as e:
+                    await asyncio.sleep(self._failed(e, attempt))
+                    attempt += 1
+                    continue
+                self._settle(tokens, usage(result) if usage else None)
+                return result
+        finally:
+            # CancelledError di tengah percobaan half-open
+            self.breaker.release_trial(trial)
+
+    async def astream(self, make_iterator, requests=1, tokens=0):
+        attempt, trial = 0, None
+        try:
+            while True:
+                if attempt == 0:
+                    trial = self.breaker.before()
+                await asyncio.to_thread(self.limiter.acquire, requests, tokens, current_priority())
+                self.counters["calls"] += 1
+                started = False
+                try:
+                    async for item in make_iterator():
+                        started = True
+                        yield item
+                except Exception as e:
+                    if started:
+                        self._record_failure(e)
+                        raise
+                    await asyncio.sleep(self._failed(e, attempt))
+                    attempt += 1
+                    continue
+                self._settle(tokens, None)
+                return
+        finally:
+            self.breaker.release_trial(trial)
+
+    def stats(self):
+        return {
+            "model": self.name,
+            "breaker": self.breaker.state,
+            "breaker_opens": self.breaker.opens,
+            **self.counters,
+            "acquired": dict(self.limiter.acquired),
+            "waited_seconds": {k: round(v, 3) for k, v in self.limiter.waited_seconds.items()},
+        }
+
+
+# --- GUARD PER PROSES ---
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def get_guard(kind):
+    """Satu guard per jenis model per proses: 'chat' atau 'embed'"""
+    with _guards_lock:
+        if kind not in _guards:
+            if kind == "chat":
+                _guards[kind] = GeminiGuard("chat", GEMINI_CHAT_RPM, GEMINI_CHAT_TPM)
+            elif kind == "embed":
+                _guards[kind] = GeminiGuard("embed", GEMINI_EMBED_RPM, GEMINI_EMBED_TPM)
+            else:
+                raise ValueError(f"Jenis guard tidak dikenal: '{kind}'")
+        return _guards[kind]
+
+
+def render_prometheus():
+    """Counter limiter untuk endpoint /metrics"""
+    lines = []
+    with _guards_lock:
+        guards = list(_guards.values())
+    for guard in guards:
+        stats = guard.stats()
+        for key in ("calls", "retries", "rate_limited", "exhausted", "errors", "hedges", "hedge_wins", "breaker_opens"):
+            lines.append(f'gemini_{key}_total{{model="{guard.name}"}} {stats.get(key, 0)}')
+        for name, seconds in stats["waited_seconds"].items():
+            lines.append(f'gemini_limiter_wait_seconds_total{{model="{guard.name}",priority="{name}"}} {seconds}')
+        lines.append(f'gemini_breaker_open{{model="{guard.name}"}} {int(stats["breaker"] == "open")}')
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def _estimate_tokens(texts):
+    return sum(len(text) for text in texts) // CHARS_PER_TOKEN + len(texts)
+
+
+# --- PEMBUNGKUS MODEL LANGCHAIN ---
+def _usage_tokens(result):
+    usage = getattr(getattr(result.generations[0], "message", None), "usage_metadata", None) if result.generations else None
+    return usage.get("total_tokens") if usage else None
+
+
+class LimitedChatModel(BaseChatModel):
+    """Chat model LangChain yang setiap panggilannya lewat GeminiGuard (invoke/stream/batch/async/bind_tools)"""
+
+    inner: Any
+    guard: Any
+
+    @property
+    def _llm_type(self):
+        return f"limited-{self.inner._llm_type}"
+
+    def _cost(self, messages):
+        return _estimate_tokens([str(message.content) for message in messages]) + OUTPUT_TOKENS_ESTIMATE
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return self.guard.call(
+            lambda: self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs),
+            tokens=self._cost(messages), hedge=True, usage=_usage_tokens,
+        )
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return await self.guard.acall(
+            lambda: self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs),
+            tokens=self._cost(messages), hedge=True, usage=_usage_tokens,
+        )
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        yield from self.guard.stream(
+            lambda: self.inner._stream(messages, stop=stop, run_manager=run_manager, **kwargs),
+            tokens=self._cost(messages),
+        )
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        async for chunk in self.guard.astream(
+            lambda: self.inner._astream(messages, stop=stop, run_manager=run_manager, **kwargs),
+            tokens=self._cost(messages),
+        ):
+            yield chunk
+
+    def bind_tools(self, tools, **kwargs):
+        # Format tool mengikuti model aslinya, argumen hasil format diteruskan lewat _generate(**kwargs)
+        return self.bind(**self.inner.bind_tools(tools, **kwargs).kwargs)
+
+
+class LimitedEmbeddings(Embeddings):
+    """Embeddings yang setiap request API-nya lewat GeminiGuard"""
+
+    def __init__(self, embeddings, guard):
+        self.embeddings = embeddings
+        self.guard = guard
+
+    def __getattr__(self, name):
+        if name in ("embeddings", "guard"):
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
+
+    def _call(self, texts, fn, hedge=False):
+        texts = list(texts)
+        return self.guard.call(
+            fn, requests=max(1, math.ceil(len(texts) / EMBED_TEXTS_PER_REQUEST)),
+            tokens=_estimate_tokens(texts), hedge=hedge,
+        )
+
+    def embed_documents(self, texts, **kwargs):
+        texts = list(texts)
+        return self._call(texts, lambda: self.embeddings.embed_documents(texts, **kwargs))
+
+    def embed_queries(self, texts):
+        from embedding_cache import embed_queries
+        texts = list(texts)
+        return self._call(texts, lambda: embed_queries(self.embeddings, texts))
+
+    def embed_query(self, text):
+        # Query datang dari user yang menunggu jawaban: boleh di-hedge
+        return self._call([text], lambda: self.embeddings.embed_query(text), hedge=True)
+
+
+def limit_chat_model(model):
+    return LimitedChatModel(inner=model, guard=get_guard("chat")) if GEMINI_LIMITER_ENABLED else model
+
+
+def limit_embeddings(embeddings):
+    return LimitedEmbeddings(embeddings, get_guard("embed")) if GEMINI_LIMITER_ENABLED else embeddings
+
+
+# --- SERVER PALSU & UJI BEBAN (TANPA API GEMINI) ---
+def make_fake_server(port=0, rpm=120, error_rate=0.0, latency=0.0, slow_rate=0.0, slow_latency=0.0, fail_first=0):
+    """
+    Server HTTP yang meniru kuota Gemini: 429 + Retry-After saat rpm terlampaui, 503 acak, ekor latensi.
+    fail_first: N request pertama dijawab 503 (retry yang bisa diuji tanpa acak). port=0 -> port bebas.
+    Return server (belum jalan); jumlah jawaban per status ada di server.counts.
+    """
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    quota = TokenBucket("fake", rpm)
+    counts = defaultdict(int)
+    failures = itertools.count()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status, payload, headers=()):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            wait_seconds = quota.take(1)
+            if wait_seconds:
+                counts[429] += 1
+                self._reply(429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}},
+                            [("Retry-After", f"{wait_seconds:.2f}")])
+                return
+            if next(failures) < fail_first or random.random() < error_rate:
+                counts[503] += 1
+                self._reply(503, {"error": {"code": 503, "status": "UNAVAILABLE"}})
+                return
+            time.sleep(slow_latency if random.random() < slow_rate else latency)
+            counts[200] += 1
+            self._reply(200, {"ok": True})
+
+        def do_GET(self):
+            self._reply(200, dict(counts))
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    server.counts = counts
+    return server
+
+
+def run_fake_server(port, rpm, error_rate, latency, slow_rate, slow_latency, fail_first=0):
+    server = make_fake_server(port, rpm, error_rate, latency, slow_rate, slow_latency, fail_first)
+    print(f"🧪 Server Gemini palsu di http://127.0.0.1:{port} (rpm={rpm:g}, error={error_rate:.0%}, "
+          f"lambat={slow_rate:.0%} x {slow_latency}s)")
+    server.serve_forever()
+
+
+def run_load_test(url, n_requests, concurrency, batch_share, rpm):
+    """Kirim request campuran interactive/batch lewat GeminiGuard ke server palsu, cetak ringkasan"""
+    import urllib.request
+
+    # Tiap request bisa memakai 2 thread hedging (asli + duplikat): pool mengikuti concurrency
+    guard = GeminiGuard("fake", rpm, rpm * 1000, shared_path="", hedge_workers=2 * concurrency)
+    latencies, outcomes = defaultdict(list), defaultdict(int)
+
+    def post():
+        request = urllib.request.Request(url, data=b"{}", headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.read()
+
+    def one(i):
+        name = "batch" if i < n_requests * batch_share else "interactive"
+        started = time.perf_counter()
+        with priority(name):
+            try:
+                guard.call(post, tokens=100, hedge=True)
+                outcomes[f"{name}:ok"] += 1
+            except Exception as e:
+                outcomes[f"{name}:{type(e).__name__}"] += 1
+        latencies[name].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    # Batch dikirim lebih dulu (seperti ingest yang sedang jalan), interaktif menyusul
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(n_requests)))
+    elapsed = time.perf_counter() - started
+
+    def pct(values, p):
+        values = sorted(values)
+        return round(values[min(len(values) - 1, int(p / 100 * len(values)))], 3) if values else None
+
+    report = {
+        "seconds": round(elapsed, 2),
+        "outcomes": dict(outcomes),
+        "latency": {name: {"p50": pct(v, 50), "p99": pct(v, 99)} for name, v in latencies.items()},
+        "guard": guard.stats(),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    # Terminal 1: python gemini_limiter.py fake-server --rpm 120 --error-rate 0.1
+    # Terminal 2: GEMINI_HEDGE_AFTER=0.5 python gemini_limiter.py load-test --requests 200 --rpm 100
+    parser = argparse.ArgumentParser(description="Uji limiter/retry/breaker Gemini dengan server palsu")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    server_cmd = commands.add_parser("fake-server", help="Server yang mengembalikan 429/503 seperti Gemini")
+    server_cmd.add_argument("--port", type=int, default=8765)
+    server_cmd.add_argument("--rpm", type=float, default=120)
+    server_cmd.add_argument("--error-rate", type=float, default=0.05)
+    server_cmd.add_argument("--latency", type=float, default=0.05)
+    server_cmd.add_argument("--slow-rate", type=float, default=0.05, help="Porsi request yang sangat lambat")
+    server_cmd.add_argument("--slow-latency", type=float, default=2.0)
+    server_cmd.add_argument("--fail-first", type=int, default=0, help="N request pertama dijawab 503")
+
+    load_cmd = commands.add_parser("load-test", help="Kirim request lewat GeminiGuard ke server palsu")
+    load_cmd.add_argument("--url", default="http://127.0.0.1:8765/v1beta/models/fake:generateContent")
+    load_cmd.add_argument("--requests", type=int, default=200)
+    load_cmd.add_argument("--concurrency", type=int, default=16)
+    load_cmd.add_argument("--batch-share", type=float, default=0.5, help="Porsi request berprioritas batch")
+    load_cmd.add_argument("--rpm", type=float, default=100, help="Batas rpm sisi client (di bawah kuota server)")
+    args = parser.parse_args()
+
+    if args.command == "fake-server":
+        run_fake_server(args.port, args.rpm, args.error_rate, args.latency, args.slow_rate, args.slow_latency,
+                        args.fail_first)
+    else:
+        run_load_test(args.url, args.requests, args.concurrency, args.batch_share, args.rpm)
@@ -1,31 +1,221 @@
 import os
+import json
+import hashlib
+import argparse
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from token_chunker import TokenChunker
 from langchain_chroma import Chroma
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from embedding_cache import get_embeddings, check_embedding_compat, write_embedding_signature
+from ingest_pipeline import embed_and_store, iter_chunks, DEFAULT_BATCH_SIZE, DEFAULT_MAX_CONCURRENCY
+from bm25_index import load_or_build, index_path
+from flat_index import FLAT_INDEX_ENABLED, FLAT_INDEX_DTYPE, export_from_chroma, flat_path
+from gemini_limiter import set_default_priority
 
 load_dotenv()
 
-#1. Loading Data
-print("Reading PDF Data ...")
-loader = PyPDFLoader("./PDF Langchain Test.pdf")
-docs = loader.load()
+PDF_FILE_PATH = "./PDF Langchain Test.pdf"
+PERSIST_DIRECTORY = "./chroma_db"
+COLLECTION_NAME = "knowledge_base_perusahaan"
 
-#2. Split/Chunking Data
-splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-splits = splitter.split_documents(docs)
-print(f"Data dipecah menjadi {len(splits)} bagian")
 
-#3. Embedding
-print("💾 Sedang menyimpan ke Hard Disk (Vector DB)...")
-embeddings = GoogleGenerativeAIEmbeddings(model="gemini-embedding-001")
+# --- ID CHUNK YANG STABIL ---
+# ID dibentuk dari (source, page, hash isi). Chunk yang isinya tidak berubah
+# selalu mendapat ID yang sama, jadi tidak perlu di-embed ulang.
 
-vectorstore = Chroma.from_documents(
-    documents=splits,
-    embedding=embeddings,
-    collection_name="knowledge_base_perusahaan",
-    persist_directory="./chroma_db"  # <--- Data disimpan di folder ini
-)
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
-print("Database tersimpan di folder './chroma_db'.")
\ No newline at end of file
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def assign_chunk_ids(splits, seen=None):
+    """Isi metadata 'chunk_id' & 'content_hash' di setiap chunk, lalu kembalikan list ID"""
+    ids = []
+    # `seen` bisa dioper antar panggilan supaya penomoran chunk kembar tetap benar saat streaming
+    seen = {} if seen is None else seen
+    for doc in splits:
+        source = doc.metadata.get("source", "")
+        page = doc.metadata.get("page", 0)
+        digest = content_hash(doc.page_content)
+        # Chunk kembar di halaman yang sama tetap dapat ID berbeda
+        key = (source, page, digest)
+        occurrence = seen.get(key, 0)
+        seen[key] = occurrence + 1
+
+        raw_id = f"{source}|{page}|{digest}|{occurrence}"
+        chunk_id = hashlib.sha256(raw_id.encode("utf-8")).hexdigest()[:32]
+        doc.metadata["chunk_id"] = chunk_id
+        doc.metadata["content_hash"] = digest
+        ids.append(chunk_id)
+    return ids
+
+
+# --- MANIFEST (CATATAN APA SAJA YANG SUDAH DI-INDEX) ---
+
+def manifest_path(persist_directory=PERSIST_DIRECTORY, collection_name=COLLECTION_NAME):
+    return os.path.join(persist_directory, f"manifest_{collection_name}.json")
+
+
+def load_manifest(persist_directory=PERSIST_DIRECTORY, collection_name=COLLECTION_NAME):
+    path = manifest_path(persist_directory, collection_name)
+    if not os.path.exists(path):
+        return {"collection": collection_name, "sources": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, persist_directory=PERSIST_DIRECTORY, collection_name=COLLECTION_NAME):
+    os.makedirs(persist_directory, exist_ok=True)
+    manifest["updated_at"] = datetime.now(timezone.utc).isoformat()
+    path = manifest_path(persist_directory, collection_name)
+    # Tulis ke file sementara dulu agar manifest tidak korup kalau proses mati di tengah jalan
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def source_aliases(source, *originals):
+    """
+    Semua penulisan path untuk file yang sama: path ternormalisasi, bentuk './...' (dipakai ingest versi
+    lama, mis. './PDF Langchain Test.pdf') dan path persis seperti yang diketik user.
+    """
+    aliases = [source]
+    if not os.path.isabs(source):
+        aliases.append(f".{os.sep}{source}")
+    aliases.extend(originals)
+    return list(dict.fromkeys(aliases))
+
+
+def sync_source(vectorstore, source, chunks, batch_size=DEFAULT_BATCH_SIZE,
+                max_concurrency=DEFAULT_MAX_CONCURRENCY, bm25=None, aliases=None):
+    """
+    Sinkronkan chunk satu file ke vectorstore secara incremental.
+    Hanya chunk baru/berubah yang di-embed, chunk yang sudah hilang dihapus.
+    `chunks` boleh berupa generator: chunk baru langsung dialirkan ke pipeline embed.
+    Jika `bm25` diberikan, index BM25 ikut di-update dengan perubahan yang sama.
+    `aliases`: penulisan path lain untuk file ini (default: source_aliases(source)).
+    Return: (jumlah_baru, ids_dihapus, records {chunk_id: {page, content_hash}})
+    """
+    # Sumber kebenaran adalah isi collection (bukan manifest), supaya data lama
+    # hasil ingest versi sebelumnya (ID acak / duplikat / path belum dinormalisasi) ikut dibersihkan.
+    paths = aliases or source_aliases(source)
+    existing = set(vectorstore.get(where={"source": {"$in": paths}}, include=[])["ids"])
+    records = {}
+    seen = {}
+
+    def new_chunks():
+        for doc in chunks:
+            chunk_id = assign_chunk_ids([doc], seen)[0]
+            records[chunk_id] = {
+                "page": doc.metadata.get("page", 0),
+                "content_hash": doc.metadata["content_hash"],
+            }
+            if chunk_id not in existing:
+                if bm25 is not None:
+                    bm25.add(chunk_id, doc.page_content, doc.metadata)
+                yield doc
+
+    stats = embed_and_store(new_chunks(), vectorstore, batch_size=batch_size,
+                            max_concurrency=max_concurrency, label=os.path.basename(source))
+
+    stale_ids = sorted(existing - set(records))
+    if stale_ids:
+        vectorstore.delete(ids=stale_ids)
+        if bm25 is not None:
+            bm25.remove(stale_ids)
+
+    return stats["chunks"], stale_ids, records
+
+
+def record_source(manifest, source, records, source_hash):
+    manifest["sources"][source] = {
+        "file_hash": source_hash,
+        "indexed_at": datetime.now(timezone.utc).isoformat(),
+        "chunks": records,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest PDF ke Chroma (incremental)")
+    parser.add_argument("--pdf", default=PDF_FILE_PATH)
+    parser.add_argument("--collection", default=COLLECTION_NAME,
+                        help="Collection tujuan, mis. satu collection per tenant/divisi (lihat tenant_router.py)")
+    parser.add_argument("--force", action="store_true", help="Proses ulang walaupun file tidak berubah")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Jumlah chunk per request embedding")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY, help="Jumlah request embedding paralel")
+    args = parser.parse_args()
+    # Ingest boleh menunggu: kuota Gemini didahulukan untuk bot yang sedang melayani user
+    set_default_priority("batch")
+
+    # Normalisasi path supaya metadata 'source' (dan ID chunk) konsisten antar run
+    source = os.path.normpath(args.pdf)
+    manifest = load_manifest(PERSIST_DIRECTORY, args.collection)
+
+    source_hash = file_hash(source)
+    previous = manifest["sources"].get(source)
+    bm25_ready = os.path.exists(index_path(PERSIST_DIRECTORY, args.collection))
+    if previous and previous.get("file_hash") == source_hash and bm25_ready and not args.force:
+        print(f"✅ '{source}' tidak berubah sejak ingest terakhir, dilewati.")
+        return
+
+    #1. Loading Data (streaming per halaman)
+    print("Reading PDF Data ...")
+    loader = PyPDFLoader(source)
+    pages = loader.lazy_load()
+
+    #2. Split/Chunking Data (ukuran dalam token model embedding, mengikuti halaman & heading)
+    splitter = TokenChunker()
+    chunks = iter_chunks(pages, splitter)
+
+    #3. Embedding (hanya chunk yang baru/berubah, per batch & paralel)
+    print("💾 Sedang menyimpan ke Hard Disk (Vector DB)...")
+    embeddings = get_embeddings()
+
+    vectorstore = Chroma(
+        persist_directory=PERSIST_DIRECTORY,  # <--- Data disimpan di folder ini
+        embedding_function=embeddings,
+        collection_name=args.collection
+    )
+
+    # Jangan campur vector dari model embedding yang berbeda dalam satu collection
+    try:
+        check_embedding_compat(vectorstore, PERSIST_DIRECTORY, args.collection, embeddings)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+
+    # Index BM25 (pencarian kata kunci) di-update bersamaan dengan Chroma
+    bm25 = load_or_build(vectorstore, PERSIST_DIRECTORY, args.collection)
+
+    new_count, stale_ids, records = sync_source(
+        vectorstore, source, chunks,
+        batch_size=args.batch_size, max_concurrency=args.concurrency, bm25=bm25,
+        aliases=source_aliases(source, args.pdf)
+    )
+    bm25.save(index_path(PERSIST_DIRECTORY, args.collection))
+    record_source(manifest, source, records, source_hash)
+    save_manifest(manifest, PERSIST_DIRECTORY, args.collection)
+    write_embedding_signature(vectorstore, PERSIST_DIRECTORY, args.collection)
+    if FLAT_INDEX_ENABLED:
+        # Engine membaca flat index (VECTOR_STORE=flat), jadi export ulang dari Chroma
+        count = export_from_chroma(vectorstore, flat_path(PERSIST_DIRECTORY, args.collection), dtype=FLAT_INDEX_DTYPE)
+        print(f"🧮 Flat index diperbarui: {count} vector")
+
+    print(f"Data dipecah menjadi {len(records)} bagian")
+    print(splitter.stats.format())
+    print(f"➕ {new_count} chunk baru di-embed, ➖ {len(stale_ids)} chunk dihapus, "
+          f"= {len(records) - new_count} chunk tidak berubah")
+    print(f"Database tersimpan di folder '{PERSIST_DIRECTORY}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import time
+import uuid
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# --- PIPELINE INGEST STREAMING ---
+# halaman -> chunk -> batch -> embed + simpan (paralel, dibatasi) -> langsung masuk Chroma.
+# Yang ada di memori hanya batch yang sedang diproses, bukan seluruh dokumen.
+
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_MAX_CONCURRENCY = 4
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_chunks(pages, splitter):
+    """Pecah halaman satu per satu, jadi loader & splitter tetap streaming"""
+    for page in pages:
+        yield from splitter.split_documents([page])
+
+
+class ProgressReporter:
+    def __init__(self, label="Ingest", every_seconds=2.0):
+        self.label = label
+        self.every_seconds = every_seconds
+        self.started = time.perf_counter()
+        self.last_report = self.started
+        self.chunks = 0
+        self.batches = 0
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return self.chunks / elapsed if elapsed > 0 else 0.0
+
+    def update(self, n_chunks):
+        self.chunks += n_chunks
+        self.batches += 1
+        now = time.perf_counter()
+        if now - self.last_report >= self.every_seconds:
+            self.last_report = now
+            print(f"📈 {self.label}: {self.chunks} chunk ({self.batches} batch) | {self.rate:.1f} chunk/s")
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "chunks": self.chunks,
+            "batches": self.batches,
+            "seconds": round(elapsed, 3),
+            "chunks_per_second": round(self.rate, 2),
+        }
+
+
+def _store_batch(vectorstore, batch):
+    ids = [doc.metadata.get("chunk_id") or str(uuid.uuid4()) for doc in batch]
+    # API publik: vectorstore meng-embed batch (sekali, lewat vectorstore.embeddings) lalu upsert per ID
+    vectorstore.add_documents(batch, ids=ids)
+    return batch
+
+
+def embed_and_store(chunks, vectorstore, batch_size=DEFAULT_BATCH_SIZE,
+                    max_concurrency=DEFAULT_MAX_CONCURRENCY, label="Ingest"):
+    """
+    Embed & simpan chunk per batch dengan maksimal `max_concurrency` batch bersamaan.
+    Return: ringkasan (jumlah chunk, durasi, chunk/s).
+    """
+    # Backend lokal (CPU) sudah memakai semua core per batch: paralel hanya menambah rebutan thread
+    max_concurrency = min(max_concurrency, getattr(vectorstore.embeddings, "max_concurrency", max_concurrency))
+    progress = ProgressReporter(label)
+    # Batasi batch yang "melayang" supaya generator chunk tidak dibaca lebih cepat dari embed
+    max_inflight = max_concurrency * 2
+
+    with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embed") as pool:
+        inflight = set()
+
+        def drain(block_until):
+            nonlocal inflight
+            while len(inflight) > block_until:
+                done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    progress.update(len(future.result()))
+
+        for batch in batched(chunks, batch_size):
+            inflight.add(pool.submit(_store_batch, vectorstore, batch))
+            drain(max_inflight - 1)
+        drain(0)
+
+    stats = progress.summary()
+    print(f"✅ {label}: {stats['chunks']} chunk dalam {stats['seconds']}s "
+          f"({stats['chunks_per_second']} chunk/s)")
+    return stats
@@ -0,0 +1,201 @@
+import os
+import argparse
+from queue import Empty
+from itertools import chain
+from multiprocessing import Manager
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from langchain_community.document_loaders import PyPDFLoader
+from token_chunker import TokenChunker, ChunkStats, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+from langchain_chroma import Chroma
+from embedding_cache import get_embeddings, check_embedding_compat, write_embedding_signature
+from ingest import (
+    PERSIST_DIRECTORY, COLLECTION_NAME, file_hash,
+    load_manifest, save_manifest, sync_source, record_source,
+)
+from ingest_pipeline import batched, iter_chunks, DEFAULT_BATCH_SIZE, DEFAULT_MAX_CONCURRENCY
+from bm25_index import load_or_build, index_path
+from flat_index import FLAT_INDEX_ENABLED, FLAT_INDEX_DTYPE, export_from_chroma, flat_path
+from gemini_limiter import set_default_priority
+
+load_dotenv()
+
+# --- INGEST SATU FOLDER PENUH (MULTI-PROSES) ---
+# Parsing PDF itu berat di CPU, jadi dikerjakan paralel di process pool.
+# Proses utama fokus ke embed + simpan ke Chroma (lewat ingest_pipeline).
+# Worker mengirim chunk per batch lewat queue terbatas, jadi PDF besar tidak pernah utuh di memori.
+
+# Jumlah batch per file yang boleh menunggu di queue sebelum worker berhenti sejenak
+PARSE_QUEUE_BATCHES = 4
+
+
+def find_pdfs(root):
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            if name.lower().endswith(".pdf"):
+                yield os.path.normpath(os.path.join(dirpath, name))
+
+
+def parse_pdf(source, previous_hash, force, chunk_size, chunk_overlap, queue, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Dijalankan di worker process. Chunk dikirim ke `queue` per batch berukuran tetap,
+    selalu diakhiri None (juga saat error).
+    Return: (source, file_hash, changed) -- changed False jika file tidak berubah.
+    """
+    try:
+        source_hash = file_hash(source)
+        if previous_hash == source_hash and not force:
+            return source, source_hash, False
+
+        # lazy_load: halaman di-parse satu per satu, bukan seluruh dokumen sekaligus
+        pages = PyPDFLoader(source).lazy_load()
+        splitter = TokenChunker(max_tokens=chunk_size, overlap_tokens=chunk_overlap)
+        for batch in batched(iter_chunks(pages, splitter), batch_size):
+            queue.put(batch)  # queue penuh = worker menunggu proses utama selesai embed
+        return source, source_hash, True
+    finally:
+        queue.put(None)
+
+
+class ParseError(Exception):
+    """Parsing PDF gagal di worker (error aslinya ada di __cause__)"""
+
+
+def queued_chunks(queue, future):
+    """Chunk dari worker parse_pdf; error parsing (atau worker mati) dilempar ulang sebagai ParseError"""
+    while True:
+        try:
+            batch = queue.get(timeout=1)
+        except Empty:
+            if future.done() and future.exception() is not None:
+                raise ParseError(future.exception()) from future.exception()
+            continue
+        if batch is None:
+            if future.exception() is not None:
+                raise ParseError(future.exception()) from future.exception()
+            return
+        yield from batch
+
+
+def parse_all(pool, manager, pdfs, manifest, args):
+    """
+    Kirim PDF ke worker dengan jumlah antrian terbatas (2x worker), lalu yield
+    (source, future, queue) sesuai urutan kirim. Tiap file punya queue terbatas,
+    jadi chunk yang belum di-embed tidak menumpuk di memori.
+    """
+    pending = iter(pdfs)
+    inflight = []
+    while True:
+        while len(inflight) < args.workers * 2:
+            source = next(pending, None)
+            if source is None:
+                break
+            previous_hash = manifest["sources"].get(source, {}).get("file_hash")
+            queue = manager.Queue(maxsize=PARSE_QUEUE_BATCHES)
+            inflight.append((source, pool.submit(
+                parse_pdf, source, previous_hash, args.force, args.chunk_size, args.chunk_overlap,
+                queue, args.batch_size,
+            ), queue))
+        if not inflight:
+            return
+        yield inflight.pop(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest semua PDF di sebuah folder ke Chroma")
+    parser.add_argument("folder", help="Folder berisi PDF (dibaca rekursif)")
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Jumlah proses parsing PDF")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Jumlah chunk per request embedding")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY, help="Jumlah request embedding paralel")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_MAX_TOKENS, help="Ukuran chunk maksimal (token)")
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP_TOKENS, help="Overlap antar chunk (token)")
+    parser.add_argument("--force", action="store_true", help="Proses ulang walaupun file tidak berubah")
+    parser.add_argument("--no-prune", action="store_true", help="Jangan hapus data dari PDF yang sudah tidak ada di folder")
+    args = parser.parse_args()
+    set_default_priority("batch")
+
+    pdfs = list(find_pdfs(args.folder))
+    print(f"📂 Ditemukan {len(pdfs)} PDF di '{args.folder}' ({args.workers} worker)")
+
+    manifest = load_manifest(PERSIST_DIRECTORY, args.collection)
+    embeddings = get_embeddings()
+    vectorstore = Chroma(
+        persist_directory=PERSIST_DIRECTORY,
+        embedding_function=embeddings,
+        collection_name=args.collection
+    )
+    # Jangan campur vector dari model embedding yang berbeda dalam satu collection
+    try:
+        check_embedding_compat(vectorstore, PERSIST_DIRECTORY, args.collection, embeddings)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    # Index BM25 (pencarian kata kunci) di-update bersamaan dengan Chroma.
+    # Disimpan sekali di akhir; kalau proses terhenti, load_or_build akan membangun ulang.
+    bm25 = load_or_build(vectorstore, PERSIST_DIRECTORY, args.collection)
+
+    total_new, total_stale, skipped = 0, 0, 0
+    # Chunk dibuat di worker process, jadi distribusi ukurannya dihitung dari metadata 'tokens'
+    stats = ChunkStats(args.chunk_size)
+
+    def counted(chunks):
+        for doc in chunks:
+            stats.add_documents([doc])
+            yield doc
+
+    # Manager ditutup lebih dulu: kalau proses utama error, worker yang menunggu queue penuh ikut berhenti
+    with ProcessPoolExecutor(max_workers=args.workers) as pool, Manager() as manager:
+        # Embed batch pertama sudah jalan sementara file yang sama masih di-parse
+        for source, future, queue in parse_all(pool, manager, pdfs, manifest, args):
+            chunks = queued_chunks(queue, future)
+            try:
+                first = next(chunks, None)
+                if first is None and not future.result()[2]:
+                    skipped += 1
+                    continue
+                # Error parsing di tengah file memutus sync_source sebelum chunk lama dihapus
+                new_count, stale_ids, records = sync_source(
+                    vectorstore, source, counted(chain([] if first is None else [first], chunks)),
+                    batch_size=args.batch_size, max_concurrency=args.concurrency, bm25=bm25
+                )
+                source_hash = future.result()[1]
+            except ParseError as e:
+                print(f"❌ Gagal parsing PDF '{source}': {e}")
+                continue
+
+            record_source(manifest, source, records, source_hash)
+            # Simpan manifest per file supaya progres tidak hilang kalau proses terhenti
+            save_manifest(manifest, PERSIST_DIRECTORY, args.collection)
+            total_new += new_count
+            total_stale += len(stale_ids)
+
+    # Bersihkan data dari PDF yang sudah dihapus dari folder
+    if not args.no_prune:
+        root = os.path.normpath(args.folder)
+        present = set(pdfs)
+        for source in list(manifest["sources"]):
+            inside_root = os.path.commonpath([os.path.abspath(source), os.path.abspath(root)]) == os.path.abspath(root)
+            if inside_root and source not in present:
+                removed = list(manifest["sources"].pop(source)["chunks"])
+                if removed:
+                    vectorstore.delete(ids=removed)
+                    bm25.remove(removed)
+                total_stale += len(removed)
+                print(f"🗑️  '{source}' sudah tidak ada, {len(removed)} chunk dihapus")
+        save_manifest(manifest, PERSIST_DIRECTORY, args.collection)
+
+    bm25.save(index_path(PERSIST_DIRECTORY, args.collection))
+    write_embedding_signature(vectorstore, PERSIST_DIRECTORY, args.collection)
+    if FLAT_INDEX_ENABLED:
+        # Engine membaca flat index (VECTOR_STORE=flat), jadi export ulang dari Chroma
+        count = export_from_chroma(vectorstore, flat_path(PERSIST_DIRECTORY, args.collection), dtype=FLAT_INDEX_DTYPE)
+        print(f"🧮 Flat index diperbarui: {count} vector")
+    print(f"➕ {total_new} chunk baru di-embed, ➖ {total_stale} chunk dihapus, "
+          f"⏭️  {skipped} file tidak berubah")
+    print(stats.format())
+    print(f"Database tersimpan di folder '{PERSIST_DIRECTORY}' (collection '{args.collection}').")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+import time
+import threading
+import contextvars
+from collections import defaultdict
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+
+# --- INSTRUMENTASI PER TAHAP UNTUK rag_chain ---
+# Callback LangChain yang mencatat untuk setiap invocation:
+# - durasi per tahap: rewrite (reformulasi pertanyaan), retrieval, embed_query,
+#   search (retrieval di luar embedding), generate, total
+# - time-to-first-token, jumlah token input/output, jumlah dokumen hasil retrieval, error
+# Semua diagregasi sebagai histogram (untuk SLO) dan bisa dirender format Prometheus.
+
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+DOC_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 10, 20)
+
+REWRITE_TAG = "stage:rewrite"
+
+# Trace yang sedang aktif di context ini (dipakai TimedEmbeddings)
+_active_trace = contextvars.ContextVar("rag_active_trace", default=None)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(label_names)
+        self._series = {}  # label values -> [counts per bucket, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    labels = _format_labels(self.label_names, key, ("le", bound))
+                    lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+                labels = _format_labels(self.label_names, key, ("le", "+Inf"))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.label_names, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.stage_seconds = Histogram(
+            "rag_stage_seconds", "Durasi per tahap rag_chain", LATENCY_BUCKETS, ("stage",))
+        self.ttft_seconds = Histogram(
+            "rag_time_to_first_token_seconds", "Waktu sampai token jawaban pertama", LATENCY_BUCKETS)
+        self.tokens = Histogram("rag_tokens", "Jumlah token per invocation", TOKEN_BUCKETS, ("kind",))
+        self.retrieved_docs = Histogram(
+            "rag_retrieved_documents", "Jumlah dokumen hasil retrieval", DOC_BUCKETS)
+        self.requests = Counter("rag_requests_total", "Jumlah request RAG", ("status",))
+        self.errors = Counter("rag_errors_total", "Jumlah error per tahap", ("stage",))
+        self._listeners = []
+
+    def add_listener(self, fn):
+        """`fn(record)` dipanggil setiap invocation selesai (mis. untuk structured log)"""
+        self._listeners.append(fn)
+
+    def record(self, record):
+        self.requests.inc(status=record["status"])
+        if record["error_stage"]:
+            self.errors.inc(stage=record["error_stage"])
+        for stage, ms in record["stages_ms"].items():
+            self.stage_seconds.observe(ms / 1000, stage=stage)
+        if record["ttft_ms"] is not None:
+            self.ttft_seconds.observe(record["ttft_ms"] / 1000)
+        for kind, count in record["tokens"].items():
+            if count:
+                self.tokens.observe(count, kind=kind)
+        if record["documents"] is not None:
+            self.retrieved_docs.observe(record["documents"])
+        for listener in self._listeners:
+            listener(record)
+
+    def record_cache_hit(self, seconds):
+        self.requests.inc(status="cache_hit")
+        self.stage_seconds.observe(seconds, stage="cache_hit")
+
+    def render_prometheus(self):
+        lines = []
+        for metric in (self.requests, self.errors, self.stage_seconds, self.ttft_seconds,
+                       self.tokens, self.retrieved_docs):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+
+class RAGTrace(BaseCallbackHandler):
+    """
+    Satu objek per invocation: config={"callbacks": [trace]}.
+    Pakai `with trace:` di sekitar invoke supaya waktu embedding query ikut tercatat.
+    """
+
+    # Dipanggil langsung (bukan lewat executor) juga di jalur async, supaya timestamp akurat
+    run_inline = True
+
+    def __init__(self, registry=METRICS):
+        self.registry = registry
+        self.started = time.perf_counter()
+        self.stages = defaultdict(float)
+        self.ttft = None
+        self.tokens = {"input": 0, "output": 0}
+        self.documents = None
+        self.error_stage = None
+        self.finished = False
+        self._root = None
+        self._runs = {}             # run_id -> (tahap, waktu mulai)
+        self._retriever_runs = set()
+        self._token = None
+
+    # --- CONTEXT (UNTUK TimedEmbeddings) ---
+    def __enter__(self):
+        self._token = _active_trace.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _active_trace.reset(self._token)
+        if exc is not None and not self.finished:
+            # Dihentikan di luar callback chain: stream ditinggal / task dibatalkan, atau error biasa
+            if isinstance(exc, Exception):
+                self._finish("error", self.error_stage or "chain")
+            else:
+                self._finish("cancelled")
+
+    def add_stage(self, stage, seconds):
+        self.stages[stage] += seconds
+
+    def _start(self, run_id, stage):
+        self._runs[run_id] = (stage, time.perf_counter())
+
+    def _end(self, run_id):
+        entry = self._runs.pop(run_id, None)
+        if entry is None:
+            return None
+        stage, started = entry
+        self.stages[stage] += time.perf_counter() - started
+        return stage
+
+    # --- CHAIN ---
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        if parent_run_id is None and self._root is None:
+            self._root = run_id
+            self.started = time.perf_counter()
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        if run_id == self._root:
+            self._finish("ok")
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        if run_id == self._root:
+            self._finish("error", self.error_stage or "chain")
+
+    # --- RETRIEVER (hanya retriever terluar, retriever di dalamnya ikut terhitung) ---
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+        nested = parent_run_id in self._retriever_runs
+        self._retriever_runs.add(run_id)
+        if not nested:
+            self._start(run_id, "retrieval")
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        if self._end(run_id) is not None:
+            self.documents = len(documents)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        if self._end(run_id) is not None:
+            self.error_stage = "retrieval"
+
+    # --- LLM (reformulasi pertanyaan vs jawaban) ---
+    def _llm_start(self, run_id, tags):
+        self._start(run_id, "rewrite" if REWRITE_TAG in (tags or []) else "generate")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, tags=None, **kwargs):
+        self._llm_start(run_id, tags)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, tags=None, **kwargs):
+        self._llm_start(run_id, tags)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        entry = self._runs.get(run_id)
+        if self.ttft is None and token and entry is not None and entry[0] == "generate":
+            self.ttft = time.perf_counter() - self.started
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        stage = self._end(run_id)
+        if stage == "generate" and self.ttft is None:
+            # Tanpa streaming, token pertama datang bersamaan dengan seluruh jawaban
+            self.ttft = time.perf_counter() - self.started
+
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    self.tokens["input"] += usage.get("input_tokens", 0)
+                    self.tokens["output"] += usage.get("output_tokens", 0)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        entry = self._runs.get(run_id)
+        self._end(run_id)
+        if entry is not None:
+            self.error_stage = entry[0]
+
+    # --- HASIL ---
+    def _finish(self, status, error_stage=None):
+        if self.finished:
+            return
+        self.finished = True
+        self.error_stage = error_stage
+        self.stages["total"] = time.perf_counter() - self.started
+        if "retrieval" in self.stages:
+            self.stages["search"] = max(0.0, self.stages["retrieval"] - self.stages.get("embed_query", 0.0))
+        self.registry.record(self.report(status))
+
+    def report(self, status):
+        return {
+            "event": "rag_trace",
+            "status": status,
+            "error_stage": self.error_stage,
+            "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()},
+            "ttft_ms": round(self.ttft * 1000, 1) if self.ttft is not None else None,
+            "tokens": dict(self.tokens),
+            "documents": self.documents,
+        }
+
+
+class TimedEmbeddings(Embeddings):
+    """Bungkus model embedding: waktu embed query dicatat ke trace yang aktif"""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def __getattr__(self, name):
+        # Atribut lain (mis. statistik cache) diteruskan ke model aslinya
+        if name == "embeddings":
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_queries(self, texts):
+        from embedding_cache import embed_queries
+        return embed_queries(self.embeddings, texts)
+
+    def embed_query(self, text):
+        trace = _active_trace.get()
+        started = time.perf_counter()
+        try:
+            return self.embeddings.embed_query(text)
+        finally:
+            if trace is not None:
+                trace.add_stage("embed_query", time.perf_counter() - started)
@@ -2,6 +2,7 @@ from dotenv import load_dotenv
 import os
 from langchain.chat_models import init_chat_model
 from langchain.tools import tool
+from tool_executor import ToolExecutor
 
 load_dotenv()
 api_key = os.getenv("GOOGLE_API_KEY")
@@ -70,18 +71,12 @@ def get_weather(location: str) -> str:
 # Bind (potentially multiple) tools to the model
 model_with_tools = model.bind_tools([get_weather])
 
-# Step 1: Model generates tool calls
-messages = [{"role": "user", "content": "What's the weather in Boston?"}]
-ai_msg = model_with_tools.invoke(messages)
-messages.append(ai_msg)
+# Tool call dalam satu giliran dijalankan paralel (timeout per tool, hasil di-cache dengan TTL),
+# lalu hasilnya dikirim balik ke model sampai model menjawab tanpa tool call lagi.
+executor = ToolExecutor([get_weather], timeouts={"get_weather": 10})
 
-# Step 2: Execute tools and collect results
-for tool_call in ai_msg.tool_calls:
-    # Execute the tool with the generated arguments
-    tool_result = get_weather.invoke(tool_call)
-    messages.append(tool_result)
-
-# Step 3: Pass results back to model for final response
-final_response = model_with_tools.invoke(messages)
+messages = [{"role": "user", "content": "What's the weather in Boston and in Jakarta?"}]
+final_response = executor.run_agent(model_with_tools, messages)
 print(final_response.text)
-# "The current weather in Boston is 72°F and sunny."
\ No newline at end of file
+# "It's sunny in both Boston and Jakarta."
+print(executor.stats())
@@ -0,0 +1,68 @@
+import os
+from langchain_core.embeddings import Embeddings
+
+# --- BACKEND EMBEDDING LOKAL (CPU) ---
+# sentence-transformers di CPU: tanpa kuota API dan tanpa network hop di setiap query.
+# - Inference per batch (LOCAL_EMBEDDING_BATCH_SIZE)
+# - Jumlah thread CPU bisa diatur (LOCAL_EMBEDDING_THREADS, 0 = default library)
+# - Opsional model ONNX / ONNX int8 terkuantisasi (LOCAL_EMBEDDING_QUANTIZE=onnx|int8)
+
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "32"))
+LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", "0"))
+LOCAL_EMBEDDING_QUANTIZE = os.getenv("LOCAL_EMBEDDING_QUANTIZE", "none")
+# File ONNX int8 di repo model HuggingFace (all-MiniLM-L6-v2 menyediakan beberapa varian per CPU)
+LOCAL_EMBEDDING_ONNX_INT8_FILE = os.getenv("LOCAL_EMBEDDING_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+
+
+class LocalEmbeddings(Embeddings):
+    """Embeddings sentence-transformers di CPU, vector dinormalisasi (cosine)"""
+
+    # Satu model CPU sudah memakai semua thread, jadi pipeline ingest tidak perlu
+    # mengirim banyak batch paralel (lihat embed_and_store)
+    max_concurrency = 1
+
+    def __init__(self, model_name=LOCAL_EMBEDDING_MODEL, batch_size=LOCAL_EMBEDDING_BATCH_SIZE,
+                 threads=LOCAL_EMBEDDING_THREADS, quantize=LOCAL_EMBEDDING_QUANTIZE):
+        if quantize not in ("none", "onnx", "int8"):
+            raise ValueError(f"LOCAL_EMBEDDING_QUANTIZE harus none/onnx/int8, bukan '{quantize}'")
+        if threads:
+            # Harus di-set sebelum torch / onnxruntime di-import
+            os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+
+        from sentence_transformers import SentenceTransformer
+
+        kwargs = {"device": "cpu"}
+        if quantize != "none":
+            kwargs["backend"] = "onnx"
+            if quantize == "int8":
+                kwargs["model_kwargs"] = {"file_name": LOCAL_EMBEDDING_ONNX_INT8_FILE}
+        self.model = SentenceTransformer(model_name, **kwargs)
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.quantize = quantize
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def _encode(self, texts):
+        vectors = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        return vectors.tolist()
+
+    def embed_documents(self, texts):
+        return self._encode(list(texts))
+
+    def embed_queries(self, texts):
+        # Model ini memakai encoding yang sama untuk query & dokumen
+        return self._encode(list(texts))
+
+    def embed_query(self, text):
+        return self._encode([text])[0]
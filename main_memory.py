@@ -1,54 +1,19 @@
 import os
 from dotenv import load_dotenv
-from langchain_chroma import Chroma
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_classic.chains import create_retrieval_chain, create_history_aware_retriever
-from langchain_classic.chains.combine_documents import create_stuff_documents_chain
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_community.chat_message_histories import ChatMessageHistory
-from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_core.runnables.history import RunnableWithMessageHistory
+from rag_engine import get_engine
+from chat_history import BoundedChatHistory
+from session_store import SessionStore
 
 load_dotenv()
 
 #Loading Database
 print("Loading Data from Vector DB...")
-embeddings = GoogleGenerativeAIEmbeddings(model="gemini-embedding-001")
-vectorstore = Chroma(
-    persist_directory="/Users/azhardzakwan/Documents/To_DriveAzhar/Coding/AgenticAI/LangChain/chroma_db",
-    embedding_function=embeddings,
-    collection_name="knowledge_base_perusahaan"
-)
-retriever = vectorstore.as_retriever(search_kwargs={"k" : 3})
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite", temperature=0)
-
-# --- MEMBUAT SUB-CHAIN: REFORMULASI PERTANYAAN ---
-# Tugas: Mengubah pertanyaan ambigu ("Kalau itu?") menjadi pertanyaan lengkap.
-
-contextualize_q_system_prompt = (
-    "Diberikan riwayat percakapan dan pertanyaan pengguna terbaru "
-    "yang mungkin merujuk pada konteks sebelumnya, "
-    "rumuskan kembali menjadi pertanyaan mandiri yang dapat dipahami "
-    "tanpa melihat riwayat percakapan. "
-    "JANGAN dijawab pertanyaannya, cukup rumuskan ulang saja jika perlu."
-)
 
-contextualize_q_prompt = ChatPromptTemplate.from_messages(
-    [
-        ("system", contextualize_q_system_prompt),
-        ("placeholder", "{chat_history}"),  #Chat history
-        ("human", "{input}")
-    ]
-)
-
-#Re-Formatting question sebelum di pass kembali ke retriever
-history_aware_retriever = create_history_aware_retriever(
-    llm, retriever, contextualize_q_prompt
-)
-
-
-# --- MEMBUAT SUB-CHAIN: JAWAB PERTANYAAN (QA) ---""
-# Tugas: Menjawab pertanyaan yang sudah diperbaiki menggunakan dokumen.
+# Engine bersama sudah berisi 2 sub-chain:
+# - REFORMULASI PERTANYAAN: mengubah pertanyaan ambigu ("Kalau itu?") menjadi pertanyaan lengkap
+#   sebelum di-pass ke retriever (hanya jalan kalau ada chat history).
+# - JAWAB PERTANYAAN (QA): menjawab pertanyaan yang sudah diperbaiki menggunakan dokumen.
 
 qa_system_prompt = (
     "Anda adalah asisten tanya jawab tugas. "
@@ -58,26 +23,16 @@ qa_system_prompt = (
     "{context}"
 )
 
-qa_prompt = ChatPromptTemplate.from_messages(
-    [
-        ("system", qa_system_prompt),
-        ("placeholder", "{chat_history}"),
-        ("human", "{input}")
-    ]
-)
-
-question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
-rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+engine = get_engine("memory", system_prompt=qa_system_prompt)
+rag_chain = engine.rag_chain
 
 # --- MANAJEMEN SESSION (PENYIMPANAN MEMORI) ---
-# Kita butuh tempat untuk menyimpan history per user (Session ID)
-
-store = {}
+# Kita butuh tempat untuk menyimpan history per user (Session ID).
+# Sesi aktif di memori (LRU + idle TTL), sisanya di SQLite -> memori tetap rata & selamat dari restart.
+# Riwayat terbatas: N giliran terakhir + ringkasan giliran lama (ukuran prompt tidak terus membesar)
 
-def get_session_history(session_id : str) -> BaseChatMessageHistory:
-    if session_id not in store:
-        store[session_id] = ChatMessageHistory()
-    return store[session_id]
+store = SessionStore(history_factory=lambda **state: BoundedChatHistory(llm=engine.llm, **state))
+get_session_history = store.get
 
 
 #Combine RAG dengan Memory
@@ -104,3 +59,8 @@ while True:
     )
 
     print(f"Bot: {response['answer']}")
+
+    store.save(session_id)
+    size = store.get(session_id).size_report()
+    print(f"📏 History: {size['turns']} giliran, {size['recent_messages']} pesan utuh, "
+          f"ringkasan {size['summary_tokens']} token, prompt history {size['prompt_tokens']} token")
@@ -1,8 +1,10 @@
 import os
 from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.vectorstores import Chroma
-from langchain_google_genai import GoogleGenerativeAI, ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_google_genai import GoogleGenerativeAI, ChatGoogleGenerativeAI
+from embedding_cache import get_embeddings
+from snapshot import restore_or_build, snapshot_path_for
+from token_chunker import TokenChunker
+from gemini_limiter import limit_chat_model, INNER_RETRY_KWARGS
 
 from langchain_classic.chains import RetrievalQA
 # from langchain.chains import RetrievalQA
@@ -21,37 +23,38 @@ load_dotenv()
 api_key = os.getenv("GOOGLE_API_KEY")
 os.environ["GOOGLE_API_KEY"] = api_key
 
-loader = PyPDFLoader("/Users/azhardzakwan/Documents/To_DriveAzhar/AgenticAI/LangChain/PDF Langchain Test.pdf")
+PDF_PATH = "/Users/azhardzakwan/Documents/To_DriveAzhar/AgenticAI/LangChain/PDF Langchain Test.pdf"
+loader = PyPDFLoader(PDF_PATH)
 raw_documents = loader.load()
 print(f"Number of pages: {len(raw_documents)}")
 
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size = 1000,
-    chunk_overlap = 200
-)
+text_splitter = TokenChunker()  # CHUNK_MAX_TOKENS / CHUNK_OVERLAP_TOKENS (token, bukan karakter)
 
 documents = text_splitter.split_documents(raw_documents)
 
 print(f"Number of chunks: {len(documents)}")
+print(text_splitter.stats.format())
 print(f"First chunk: {documents[0].page_content}")
 
 print("Processing Embedding (Google)")
-embeddings = GoogleGenerativeAIEmbeddings(model="gemini-embedding-001")
-
-#saving to chroma db
-vector_db = Chroma.from_documents(
-    documents=documents,
-    embedding=embeddings,
-    collection_name="collection_langchain_pdf_test"
+embeddings = get_embeddings()
+
+#saving to chroma db (in-memory). Start berikutnya dimuat dari snapshot tanpa embed ulang.
+vector_db = restore_or_build(
+    snapshot_path_for(PDF_PATH, "collection_langchain_pdf_test", splitter=text_splitter),
+    embeddings,
+    "collection_langchain_pdf_test",
+    build=lambda store: store.add_documents(documents),
 )
 
 print("Data saved as vector to Chroma DB")
 
-llm = ChatGoogleGenerativeAI(
+llm = limit_chat_model(ChatGoogleGenerativeAI(
     model="gemini-2.5-flash-lite",
     temperature=0,
-    convert_system_message_to_human=True
-    )
+    convert_system_message_to_human=True,
+    **INNER_RETRY_KWARGS
+    ))
 
 retriever = vector_db.as_retriever(search_kwargs={"k": 3})
 
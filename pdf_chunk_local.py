@@ -1,8 +1,9 @@
 import os
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from embedding_cache import get_embeddings
+from token_chunker import TokenChunker, get_token_counter
+from local_embeddings import LOCAL_EMBEDDING_MODEL
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,22 +12,18 @@ loader = PyPDFLoader("/Users/azhardzakwan/Documents/To_DriveAzhar/AgenticAI/Lang
 raw_documents = loader.load()
 print(f"Number of pages: {len(raw_documents)}")
 
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size = 1000,
-    chunk_overlap = 200
-)
+# Panjang chunk diukur dengan tokenizer model lokal yang sama dengan embedding di bawah
+text_splitter = TokenChunker(counter=get_token_counter(LOCAL_EMBEDDING_MODEL))
 
 documents = text_splitter.split_documents(raw_documents)
 
 print(f"Number of chunks: {len(documents)}")
+print(text_splitter.stats.format())
 print(f"First chunk: {documents[0].page_content}")
 
 print("\nProcessing Embedding (HuggingFace - Local, No API needed)")
-# Using a lightweight, free local embedding model
-embeddings = HuggingFaceEmbeddings(
-    model_name="all-MiniLM-L6-v2",  # Small, fast, and effective
-    model_kwargs={'device': 'cpu'}
-)
+# Using a lightweight, free local embedding model (backend lokal bersama, lihat local_embeddings.py)
+embeddings = get_embeddings(backend="local")  # default: all-MiniLM-L6-v2, batched CPU inference
 
 print("Creating embeddings and saving to Chroma DB...")
 # Saving to chroma db
@@ -0,0 +1,120 @@
+import os
+import base64
+import shutil
+import hashlib
+import streamlit as st
+
+# --- PREVIEW PDF UNTUK STREAMLIT ---
+# Versi lama membaca + base64 seluruh PDF dan mengirimnya ke browser di SETIAP rerun
+# (setiap pesan chat). Di sini:
+# 1. PDF disajikan dari static route Streamlit (app/static/...) -> browser cukup download sekali.
+#    Kalau static serving mati, hasil base64 minimal di-cache per hash file.
+# 2. Halaman yang dikutip jawaban ditampilkan sebagai thumbnail (di-cache) + tombol lompat halaman.
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+THUMBNAIL_WIDTH = 220
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _digest(path, mtime_ns, size):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_digest(path):
+    """Hash isi file, hanya dihitung ulang jika mtime/ukuran file berubah"""
+    stat = os.stat(path)
+    return _digest(path, stat.st_mtime_ns, stat.st_size)
+
+
+def static_url(path, digest):
+    name = f"pdf_{digest[:16]}.pdf"
+    target = os.path.join(STATIC_DIR, name)
+    if not os.path.exists(target):
+        os.makedirs(STATIC_DIR, exist_ok=True)
+        shutil.copyfile(path, target)
+    return f"app/static/{name}"
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _base64_pdf(path, digest):
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode('utf-8')
+
+
+def pdf_src(path):
+    digest = file_digest(path)
+    if st.get_option("server.enableStaticServing"):
+        return static_url(path, digest)
+    return f"data:application/pdf;base64,{_base64_pdf(path, digest)}"
+
+
+def display_pdf(file_path, page=1, height=800):
+    # Cek apakah file ada
+    if not os.path.exists(file_path):
+        st.error(f"File PDF tidak ditemukan di: {file_path}")
+        return
+
+    # Embed PDF menggunakan HTML iframe (#page=N untuk lompat ke halaman)
+    src = pdf_src(file_path)
+    pdf_display = f'<iframe src="{src}#page={page}" width="100%" height="{height}px" type="application/pdf"></iframe>'
+    st.markdown(pdf_display, unsafe_allow_html=True)
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def page_thumbnail(path, digest, page_index, width=THUMBNAIL_WIDTH):
+    """PNG satu halaman. Butuh `pypdfium2` (opsional); None jika tidak terpasang."""
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        return None
+
+    import io
+    pdf = pdfium.PdfDocument(path)
+    try:
+        page = pdf[page_index]
+        scale = width / page.get_width()
+        image = page.render(scale=scale).to_pil()
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        return buffer.getvalue()
+    finally:
+        pdf.close()
+
+
+def _jump_to(page):
+    st.session_state.pdf_page = page
+
+
+def display_cited_pages(file_path, docs, per_row=3, key_prefix="cited"):
+    """
+    Thumbnail halaman yang dikutip (dari response['context']) + tombol lompat ke halaman.
+    `key_prefix` harus beda jika dipanggil lebih dari sekali dalam satu rerun.
+    """
+    target = os.path.normpath(file_path)
+    pages = sorted({
+        doc.metadata.get("page", 0) for doc in docs
+        if os.path.normpath(doc.metadata.get("source", file_path)) == target
+    })
+    if not pages or not os.path.exists(file_path):
+        return
+
+    digest = file_digest(file_path)
+    st.caption("📑 Halaman yang dikutip")
+    for i in range(0, len(pages), per_row):
+        columns = st.columns(per_row)
+        for column, page_index in zip(columns, pages[i:i + per_row]):
+            with column:
+                thumbnail = page_thumbnail(file_path, digest, page_index)
+                if thumbnail:
+                    st.image(thumbnail)
+                # Metadata page dari PyPDFLoader mulai dari 0, viewer PDF mulai dari 1
+                st.button(
+                    f"Buka Hal {page_index + 1}",
+                    key=f"{key_prefix}_{digest[:8]}_{page_index}",
+                    on_click=_jump_to,
+                    args=(page_index + 1,),
+                )
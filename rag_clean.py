@@ -3,14 +3,13 @@ from dotenv import load_dotenv
 
 # 1. Import Komponen Modern
 from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+from token_chunker import TokenChunker
+from embedding_cache import get_embeddings
+from ingest_pipeline import embed_and_store, iter_chunks
+from snapshot import restore_or_build, snapshot_path_for
 
-# 2. Import Chain & Prompt (Bagian Paling Penting)
-from langchain_classic.chains import create_retrieval_chain
-from langchain_classic.chains.combine_documents import create_stuff_documents_chain
-from langchain_core.prompts import ChatPromptTemplate
+# 2. Import Engine RAG (Chain & Prompt dirakit di sini)
+from rag_engine import RAGEngine
 
 # Setup Environment
 load_dotenv()
@@ -19,35 +18,36 @@ if not os.getenv("GOOGLE_API_KEY"):
     print("⚠️ GOOGLE_API_KEY belum di-set!")
 
 # --- TAHAP 1: PERSIAPAN DATA (INGESTION) ---
-print("📂 1. Memuat & Memecah Dokumen...")
 # Ganti path sesuai file Anda
-loader = PyPDFLoader("./PDF Langchain Test.pdf")
-docs = loader.load()
+PDF_PATH = "./PDF Langchain Test.pdf"
+splitter = TokenChunker()  # ukuran chunk dalam token, mengikuti halaman & heading
+# Hasil embedding disimpan sebagai snapshot; start berikutnya tidak perlu embed ulang PDF.
+# Kunci snapshot ikut pengaturan chunker & model embedding.
+SNAPSHOT_PATH = snapshot_path_for(PDF_PATH, "clean_rag_collection", splitter=splitter)
+
+
+def build_collection(vectorstore):
+    print("📂 1. Memuat & Memecah Dokumen...")
+    loader = PyPDFLoader(PDF_PATH)
+    pages = loader.lazy_load()  # Halaman dibaca satu per satu (streaming)
+
+    splits = iter_chunks(pages, splitter)
+    # Isi Vector DB per batch secara paralel
+    embed_and_store(splits, vectorstore)
 
-splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-splits = splitter.split_documents(docs)
 
 # --- TAHAP 2: OTAK & MEMORI (LLM & VECTOR DB) ---
 print("🧠 2. Membuat Embeddings & Vector Store...")
 # Menggunakan model embedding Google
-embeddings = GoogleGenerativeAIEmbeddings(model="gemini-embedding-001")
+embeddings = get_embeddings()
 
-# Membuat Vector DB (Chroma)
-vectorstore = Chroma.from_documents(
-    documents=splits,
-    embedding=embeddings,
-    collection_name="clean_rag_collection"
-)
-retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
-
-# Menyiapkan LLM (Gemini)
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite", temperature=0)
+# Vector DB (Chroma in-memory): dari snapshot jika ada, jika belum dibangun lalu di-snapshot
+vectorstore = restore_or_build(SNAPSHOT_PATH, embeddings, "clean_rag_collection", build_collection)
 
 # --- TAHAP 3: MERAKIT RAG (THE CHAIN) ---
 print("🔗 3. Merakit Rantai RAG Modern...")
 
 # A. Membuat Prompt (Instruksi)
-# Perhatikan struktur ("system", "human") ini standar untuk Chat Model
 system_prompt = (
     "Anda adalah Asisten HRD yang tegas. "
     "Jawab pertanyaan user berdasarkan konteks berikut:\n\n"
@@ -55,25 +55,16 @@ system_prompt = (
     "\n\nJika tidak ada di konteks, katakan: 'Maaf, info tidak ada di SOP'."
 )
 
-prompt = ChatPromptTemplate.from_messages([
-    ("system", system_prompt),
-    ("human", "{input}"),
-])
-
-# B. Chain 1: Dokumen + LLM (Question Answer Chain)
-# Chain ini tugasnya: "Ambil teks dokumen, masukkan ke prompt, kirim ke LLM"
-question_answer_chain = create_stuff_documents_chain(llm, prompt)
-
-# C. Chain 2: Retriever + Chain 1 (RAG Chain Utama)
-# Chain ini tugasnya: "Cari dokumen dulu (Retriever), lalu oper ke Chain 1"
-rag_chain = create_retrieval_chain(retriever, question_answer_chain)
+# B. Engine bersama merakit: Retriever -> (Prompt + Gemini) -> Jawaban
+# Vectorstore in-memory di atas kita oper langsung ke engine.
+engine = RAGEngine(system_prompt=system_prompt, vectorstore=vectorstore)
 
 # --- TAHAP 4: EKSEKUSI ---
 def tanya_hrd(pertanyaan):
     print(f"\n❓ User: {pertanyaan}")
     
     # 'input' adalah variabel yang kita definisikan di prompt ("human", "{input}")
-    response = rag_chain.invoke({"input": pertanyaan})
+    response = engine.answer(pertanyaan)
     
     print(f"💡 Bot: {response['answer']}")
     
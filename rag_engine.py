@@ -0,0 +1,511 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dotenv import load_dotenv
+
+# Sengaja TIDAK meng-import LangChain/Chroma/Gemini di sini.
+# Library berat baru di-import saat engine pertama kali dipakai (lazy),
+# supaya start-up bot & import modul ini tetap cepat.
+
+load_dotenv()
+
+# --- KONFIGURASI DEFAULT ---
+PERSIST_DIRECTORY = "./chroma_db"
+COLLECTION_NAME = "knowledge_base_perusahaan"
+LLM_MODEL = "gemini-2.5-flash-lite"
+RETRIEVER_K = 3
+# "hybrid" = BM25 + vector (RRF), otomatis turun ke "vector" jika index BM25 belum ada
+RETRIEVER_MODE = os.getenv("RAG_RETRIEVER", "hybrid")
+# "chroma" atau "flat" (numpy mmap, lihat flat_index.py; bangun dulu dengan `python flat_index.py`)
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma")
+# Kompresi konteks: ambil FETCH_K kandidat, gabungkan yang overlap, lalu packing ke budget token
+CONTEXT_COMPRESSION = os.getenv("RAG_CONTEXT_COMPRESSION", "1") == "1"
+CONTEXT_FETCH_K = int(os.getenv("RAG_CONTEXT_FETCH_K", "6"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1000"))
+WARMUP_ON_START = os.getenv("RAG_WARMUP", "0") == "1"
+# Metrik per tahap (callback LangChain, lihat instrumentation.py)
+METRICS_ENABLED = os.getenv("RAG_METRICS", "1") == "1"
+# Mode batch (/batch & batch_qa.py): jumlah pertanyaan per gelombang & paralelisme generate/retrieval
+BATCH_CHUNK_SIZE = int(os.getenv("RAG_BATCH_CHUNK_SIZE", "32"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("RAG_BATCH_MAX_CONCURRENCY", "8"))
+# Batas eksekusi chain async yang berjalan bersamaan (disesuaikan dengan kuota model)
+ASYNC_MAX_CONCURRENCY = int(os.getenv("RAG_ASYNC_MAX_CONCURRENCY", "16"))
+
+DEFAULT_SYSTEM_PROMPT = (
+    "Anda adalah Asisten. Jawab berdasarkan konteks berikut:\n\n"
+    "{context}"
+)
+
+CONTEXTUALIZE_Q_SYSTEM_PROMPT = (
+    "Diberikan riwayat percakapan dan pertanyaan pengguna terbaru "
+    "yang mungkin merujuk pada konteks sebelumnya, "
+    "rumuskan kembali menjadi pertanyaan mandiri yang dapat dipahami "
+    "tanpa melihat riwayat percakapan. "
+    "JANGAN dijawab pertanyaannya, cukup rumuskan ulang saja jika perlu."
+)
+
+
+class RAGEngine:
+    """
+    Satu paket Chroma + Gemini + retrieval chain yang dibangun sekali per proses.
+    Dibangun secara lazy (saat pertama dipakai) dan aman dipanggil dari banyak thread.
+    """
+
+    def __init__(self, system_prompt=DEFAULT_SYSTEM_PROMPT, persist_directory=PERSIST_DIRECTORY,
+                 collection_name=COLLECTION_NAME, k=RETRIEVER_K, vectorstore=None, embeddings=None, llm=None,
+                 answer_cache=False, collections=None):
+        self.system_prompt = system_prompt
+        self.persist_directory = persist_directory
+        # Lebih dari satu collection (shard per tenant) -> retrieval fan-out, lihat tenant_router.py
+        self.collections = list(collections or [collection_name])
+        self.collection_name = self.collections[0]
+        self.k = k
+        # Komponen boleh di-inject (misal vectorstore in-memory atau model palsu untuk benchmark)
+        self._vectorstore = vectorstore
+        self._shards = [vectorstore] if vectorstore is not None else None
+        self._owns_vectorstore = vectorstore is None
+        self._embeddings = embeddings
+        self._llm = llm
+        self._rag_chain = None
+        self._qa_chain = None
+        self._base_retriever = None
+        self._use_answer_cache = answer_cache
+        self.answer_cache = None
+        self._lock = threading.Lock()
+        # Untuk mode async: pertanyaan identik yang sedang diproses berbagi satu eksekusi chain
+        self._inflight = {}
+        self._async_slots = None
+        self.coalesced = 0
+        self.timings = {}
+
+    # --- STATUS ---
+    def has_database(self):
+        return self._vectorstore is not None or os.path.exists(self.persist_directory)
+
+    @property
+    def ready(self):
+        """True jika chain sudah dibangun: pertanyaan berikutnya tidak menunggu build (/readyz, serve_prefork.py)"""
+        return self._rag_chain is not None
+
+    # --- PEMBANGUNAN KOMPONEN (LAZY) ---
+    def _timed(self, name, fn):
+        started = time.perf_counter()
+        result = fn()
+        self.timings[name] = time.perf_counter() - started
+        return result
+
+    def _build(self):
+        def import_stack():
+            from langchain_chroma import Chroma
+            from langchain_google_genai import ChatGoogleGenerativeAI
+            from langchain_classic.chains import create_retrieval_chain, create_history_aware_retriever
+            from langchain_classic.chains.combine_documents import create_stuff_documents_chain
+            from langchain_core.prompts import ChatPromptTemplate
+            return (Chroma, ChatGoogleGenerativeAI, create_retrieval_chain,
+                    create_history_aware_retriever, create_stuff_documents_chain, ChatPromptTemplate)
+
+        (Chroma, ChatGoogleGenerativeAI, create_retrieval_chain, create_history_aware_retriever,
+         create_stuff_documents_chain, ChatPromptTemplate) = self._timed("imports", import_stack)
+
+        if self._vectorstore is None:
+            if self._embeddings is None:
+                from embedding_cache import get_embeddings
+                self._embeddings = self._timed("embeddings", get_embeddings)
+            embedding_function = self._embeddings
+            if METRICS_ENABLED:
+                from instrumentation import TimedEmbeddings
+                embedding_function = TimedEmbeddings(self._embeddings)
+            self._shards = self._timed("vectorstore", lambda: [
+                self._open_vectorstore(Chroma, embedding_function, name) for name in self.collections
+            ])
+            self._vectorstore = self._shards[0]
+            # Query dengan model/dimensi berbeda dari saat ingest menghasilkan hasil ngawur, jadi tolak
+            from embedding_cache import check_embedding_compat
+            self._timed("embedding_guard", lambda: [
+                check_embedding_compat(shard, self.persist_directory, name, self._embeddings)
+                for shard, name in zip(self._shards, self.collections)
+            ])
+        if self._llm is None:
+            from gemini_limiter import limit_chat_model, INNER_RETRY_KWARGS
+            self._llm = self._timed("llm", lambda: limit_chat_model(
+                ChatGoogleGenerativeAI(model=LLM_MODEL, temperature=0, **INNER_RETRY_KWARGS)))
+
+        def build_chain():
+            retriever = self._build_retriever()
+
+            # Tanpa chat_history, history-aware retriever langsung memakai pertanyaan asli
+            # (tidak ada panggilan LLM tambahan), jadi chain ini aman untuk bot tanpa memori.
+            context_prompt = ChatPromptTemplate.from_messages([
+                ("system", CONTEXTUALIZE_Q_SYSTEM_PROMPT),
+                ("placeholder", "{chat_history}"),
+                ("human", "{input}"),
+            ])
+            # Tag supaya metrik bisa membedakan LLM reformulasi dari LLM penjawab
+            rewrite_llm = self._llm.with_config(tags=["stage:rewrite"])
+            history_aware_retriever = create_history_aware_retriever(rewrite_llm, retriever, context_prompt)
+
+            qa_prompt = ChatPromptTemplate.from_messages([
+                ("system", self.system_prompt),
+                ("placeholder", "{chat_history}"),
+                ("human", "{input}"),
+            ])
+            question_answer_chain = create_stuff_documents_chain(self._llm, qa_prompt)
+            # Disimpan juga terpisah: mode batch melakukan retrieval sendiri lalu generate lewat .batch()
+            self._qa_chain = question_answer_chain
+            return create_retrieval_chain(history_aware_retriever, question_answer_chain)
+
+        self._rag_chain = self._timed("chain", build_chain)
+
+        if self._use_answer_cache:
+            from answer_cache import AnswerCache
+            # Vectorstore hasil inject (misal in-memory) tidak punya folder untuk dipantau
+            watched = self.persist_directory if self._owns_vectorstore else None
+            self.answer_cache = AnswerCache(embeddings=self._vectorstore.embeddings, persist_directory=watched)
+
+    def _open_vectorstore(self, Chroma, embedding_function, collection_name):
+        if VECTOR_STORE == "flat":
+            from flat_index import FlatVectorStore, flat_path
+            path = flat_path(self.persist_directory, collection_name)
+            if not os.path.exists(path):
+                raise FileNotFoundError(
+                    f"Flat index '{path}' belum ada! Jalankan 'python flat_index.py "
+                    f"--collection {collection_name}' terlebih dahulu."
+                )
+            return FlatVectorStore(path, embedding_function)
+        return Chroma(
+            persist_directory=self.persist_directory,
+            embedding_function=embedding_function,
+            collection_name=collection_name
+        )
+
+    def _build_base_retriever(self, k):
+        if len(self._shards) > 1:
+            from tenant_router import ShardedRetriever
+            return ShardedRetriever(vectorstores=self._shards, k=k)
+
+        vector_retriever = self._vectorstore.as_retriever(search_kwargs={"k": k})
+        if RETRIEVER_MODE != "hybrid" or not self._owns_vectorstore:
+            return vector_retriever
+
+        from bm25_index import HybridRetriever, index_path
+        path = index_path(self.persist_directory, self.collection_name)
+        if not os.path.exists(path):
+            return vector_retriever
+        # Index BM25 dimuat saat query pertama & dimuat ulang jika file berubah
+        return HybridRetriever(vectorstore=self._vectorstore, bm25_path=path, k=k)
+
+    def _build_retriever(self):
+        if not CONTEXT_COMPRESSION:
+            self._base_retriever = self._build_base_retriever(self.k)
+            return self._base_retriever
+
+        from context_compression import CompressingRetriever
+        base = self._base_retriever = self._build_base_retriever(max(self.k, CONTEXT_FETCH_K))
+        return CompressingRetriever(base_retriever=base, token_budget=CONTEXT_TOKEN_BUDGET)
+
+    def _ensure(self):
+        if self._rag_chain is None:
+            with self._lock:
+                if self._rag_chain is None:
+                    if not self.has_database():
+                        raise FileNotFoundError(
+                            f"Folder '{self.persist_directory}' tidak ditemukan! "
+                            "Jalankan 'ingest.py' atau 'ingest_universal.py' terlebih dahulu."
+                        )
+                    self._build()
+                    print(self.startup_report())
+        return self
+
+    @property
+    def vectorstore(self):
+        return self._ensure()._vectorstore
+
+    @property
+    def llm(self):
+        return self._ensure()._llm
+
+    @property
+    def rag_chain(self):
+        return self._ensure()._rag_chain
+
+    # --- WARM-UP & LAPORAN START-UP ---
+    def warm_up(self):
+        """Bangun engine + 1x embedding & pencarian dummy, supaya request pertama user tidak lambat"""
+        vectorstore = self.vectorstore
+        self._timed("warmup", lambda: vectorstore.similarity_search("warm up", k=1))
+        return self
+
+    def preload(self):
+        """
+        Bangun engine + muat index BM25 tanpa query apa pun (tanpa panggilan API / inference model).
+        Dipanggil master serve_prefork.py sebelum fork, supaya worker berbagi memori ini (copy-on-write).
+        """
+        self._ensure()
+        load_bm25 = getattr(self._base_retriever, "_current_bm25", None)
+        if load_bm25 is not None:
+            self._timed("bm25", load_bm25)
+        return self
+
+    def startup_report(self):
+        parts = [f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.timings.items()]
+        total = sum(self.timings.values())
+        return f"⏱️  Start-up engine: {total * 1000:.0f}ms ({', '.join(parts)})"
+
+    # --- METRIK ---
+    def _trace(self):
+        """Return (context manager, config) untuk satu invocation chain"""
+        if not METRICS_ENABLED:
+            return nullcontext(), None
+        from instrumentation import RAGTrace
+        trace = RAGTrace()
+        return trace, {"callbacks": [trace]}
+
+    def _cache_get(self, question):
+        started = time.perf_counter()
+        cached = self.answer_cache.get(question)
+        if cached is not None and METRICS_ENABLED:
+            from instrumentation import METRICS
+            METRICS.record_cache_hit(time.perf_counter() - started)
+        return cached
+
+    # --- API UTAMA ---
+    def answer(self, question, history=None):
+        """Return dict LangChain: {'input', 'chat_history', 'context', 'answer'}"""
+        rag_chain = self.rag_chain
+        # Jawaban hanya di-cache untuk pertanyaan tanpa riwayat chat
+        use_cache = self.answer_cache is not None and not history
+        if use_cache:
+            cached = self._cache_get(question)
+            if cached is not None:
+                return cached
+
+        trace, config = self._trace()
+        with trace:
+            response = rag_chain.invoke({"input": question, "chat_history": history or []}, config=config)
+        if use_cache:
+            self.answer_cache.put(question, response)
+        return response
+
+    def stream_answer(self, question, history=None):
+        """
+        Generator untuk streaming: yield ("context", docs) begitu retrieval selesai,
+        lalu ("token", potongan_teks) selama Gemini menghasilkan jawaban.
+        """
+        rag_chain = self.rag_chain
+        use_cache = self.answer_cache is not None and not history
+        if use_cache:
+            cached = self._cache_get(question)
+            if cached is not None:
+                yield "context", cached["context"]
+                yield "token", cached["answer"]
+                return
+
+        context, parts = [], []
+        trace, config = self._trace()
+        stream = rag_chain.stream({"input": question, "chat_history": history or []}, config=config)
+        try:
+            while True:
+                # Trace hanya aktif selama next(), tidak pernah melewati yield: generator ini bisa
+                # dilanjutkan / ditutup dari context lain (mis. thread lain di server streaming)
+                with trace:
+                    chunk = next(stream, None)
+                if chunk is None:
+                    break
+                if "context" in chunk:
+                    context = chunk["context"]
+                    yield "context", context
+                if "answer" in chunk:
+                    parts.append(chunk["answer"])
+                    yield "token", chunk["answer"]
+        except GeneratorExit:
+            # Stream ditinggal konsumen: trace dicatat 'cancelled' sebelum chain ditutup
+            with trace:
+                raise
+        finally:
+            stream.close()
+
+        if use_cache:
+            self.answer_cache.put(question, {
+                "input": question, "chat_history": [], "context": context, "answer": "".join(parts),
+            })
+
+    async def _aanswer_once(self, question):
+        if self.answer_cache is not None:
+            # get/put cache bisa memanggil API embedding, jadi jangan blok event loop
+            cached = await asyncio.to_thread(self._cache_get, question)
+            if cached is not None:
+                return cached
+
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(ASYNC_MAX_CONCURRENCY)
+        async with self._async_slots:
+            trace, config = self._trace()
+            with trace:
+                response = await self._rag_chain.ainvoke({"input": question, "chat_history": []}, config=config)
+
+        if self.answer_cache is not None:
+            await asyncio.to_thread(self.answer_cache.put, question, response)
+        return response
+
+    async def aanswer(self, question, history=None):
+        """Versi async dari answer(): pertanyaan identik yang datang bersamaan hanya diproses sekali"""
+        if self._rag_chain is None:
+            # Build pertama kali cukup berat (import + buka Chroma), jalankan di thread
+            await asyncio.to_thread(self._ensure)
+
+        if history:
+            trace, config = self._trace()
+            with trace:
+                return await self._rag_chain.ainvoke({"input": question, "chat_history": history}, config=config)
+
+        from answer_cache import normalize_question
+        key = normalize_question(question)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._aanswer_once(question))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+
+        # shield: kalau satu request dibatalkan, eksekusi bersama tetap jalan untuk yang lain
+        response = await asyncio.shield(task)
+        return {**response, "input": question}
+
+
+    # --- MODE BATCH ---
+    # Per gelombang: 1 panggilan embedding untuk semua query, retrieval paralel,
+    # lalu generate lewat qa_chain.batch/abatch (max_concurrency) -> jauh lebih cepat dari loop invoke.
+    def _retrieve_with_vector(self, question, vector):
+        """Retrieval yang sama dengan chain, tapi memakai vector query yang sudah dihitung"""
+        base = self._base_retriever
+        if hasattr(base, "search_with_vector"):
+            docs = base.search_with_vector(question, vector)
+        else:
+            docs = self._vectorstore.similarity_search_by_vector(vector, k=base.search_kwargs.get("k", self.k))
+        if CONTEXT_COMPRESSION:
+            from context_compression import compress_documents
+            return compress_documents(docs, CONTEXT_TOKEN_BUDGET)
+        return docs
+
+    def _prepare_batch(self, questions, pool):
+        """Return list konteks (atau Exception) per pertanyaan"""
+        from embedding_cache import embed_queries
+        try:
+            vectors = embed_queries(self._vectorstore.embeddings, questions)
+        except Exception as e:
+            # Embedding satu gelombang gagal: semua pertanyaan di gelombang ini jadi record error,
+            # gelombang berikutnya tetap jalan
+            return [e] * len(questions)
+
+        def retrieve(question, vector):
+            try:
+                return self._retrieve_with_vector(question, vector)
+            except Exception as e:
+                return e
+
+        return list(pool.map(retrieve, questions, vectors))
+
+    @staticmethod
+    def _batch_inputs(questions, contexts):
+        return [
+            {"input": question, "context": context, "chat_history": []}
+            for question, context in zip(questions, contexts) if not isinstance(context, Exception)
+        ]
+
+    @staticmethod
+    def _batch_records(start, questions, contexts, answers):
+        answers = iter(answers)
+        for offset, (question, context) in enumerate(zip(questions, contexts)):
+            record = {"index": start + offset, "question": question}
+            result = context if isinstance(context, Exception) else next(answers)
+            if isinstance(result, Exception):
+                record["error"] = str(result)
+            else:
+                record["answer"] = result
+                record["sources"] = [
+                    {"source": doc.metadata.get("source"), "page": doc.metadata.get("page")} for doc in context
+                ]
+            yield record
+
+    def answer_batch(self, questions, max_concurrency=BATCH_MAX_CONCURRENCY, chunk_size=BATCH_CHUNK_SIZE):
+        """Generator dict per pertanyaan (urut input): question, answer, sources / error"""
+        from gemini_limiter import priority
+        self._ensure()
+        config = {"max_concurrency": max_concurrency}
+        with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="batch") as pool:
+            for start in range(0, len(questions), chunk_size):
+                part = questions[start:start + chunk_size]
+                # Prioritas batch: kuota Gemini didahulukan untuk pertanyaan interaktif dari bot
+                with priority("batch"):
+                    contexts = self._prepare_batch(part, pool)
+                    answers = self._qa_chain.batch(self._batch_inputs(part, contexts), config=config,
+                                                   return_exceptions=True)
+                yield from self._batch_records(start, part, contexts, answers)
+
+    async def aanswer_batch(self, questions, max_concurrency=BATCH_MAX_CONCURRENCY, chunk_size=BATCH_CHUNK_SIZE):
+        """Versi async dari answer_batch() (dipakai endpoint /batch mode ASGI)"""
+        from gemini_limiter import priority
+        if self._rag_chain is None:
+            await asyncio.to_thread(self._ensure)
+        config = {"max_concurrency": max_concurrency}
+        with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="batch") as pool:
+            for start in range(0, len(questions), chunk_size):
+                part = questions[start:start + chunk_size]
+                # Tidak ada yield di dalam blok with: context var harus di-reset di context yang sama
+                with priority("batch"):
+                    contexts = await asyncio.to_thread(self._prepare_batch, part, pool)
+                    answers = await self._qa_chain.abatch(self._batch_inputs(part, contexts), config=config,
+                                                          return_exceptions=True)
+                for record in self._batch_records(start, part, contexts, answers):
+                    yield record
+
+
+# --- REGISTRY ENGINE PER PROSES ---
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(name="default", **kwargs):
+    """Ambil engine bernama `name`; dibuat sekali saja per proses (argumen hanya dipakai saat pertama)"""
+    with _engines_lock:
+        if name not in _engines:
+            _engines[name] = RAGEngine(**kwargs)
+        return _engines[name]
+
+
+def reset_engines():
+    """
+    Lupakan semua engine di proses ini (reload serve_prefork.py: engine dibangun ulang dari index terbaru).
+    Return engine lama, untuk restore_engines() jika reload gagal.
+    """
+    with _engines_lock:
+        previous = dict(_engines)
+        _engines.clear()
+        return previous
+
+
+def restore_engines(engines):
+    with _engines_lock:
+        _engines.clear()
+        _engines.update(engines)
+
+
+def answer(question, history=None):
+    return get_engine().answer(question, history=history)
+
+
+def boot(name="default", warm_up=WARMUP_ON_START, **kwargs):
+    """Dipanggil saat start-up bot: siapkan engine (opsional warm-up) dan cetak waktu start-up"""
+    engine = get_engine(name, **kwargs)
+    if not engine.has_database():
+        print(f"❌ ERROR: Folder '{engine.persist_directory}' tidak ditemukan! "
+              "Harap jalankan 'ingest.py' atau 'ingest_universal.py' terlebih dahulu.")
+        return None
+    if warm_up:
+        engine.warm_up()
+        print(f"🔥 Warm-up selesai dalam {engine.timings['warmup'] * 1000:.0f}ms")
+    return engine
@@ -0,0 +1,318 @@
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import argparse
+import importlib
+import threading
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+from dotenv import load_dotenv
+
+# --- SERVING PRE-FORK UNTUK bot_server.py: SATU MASTER, BANYAK WORKER, INDEX DIBAGI ---
+# Menjalankan N proses bot_server.py terpisah = N kali import LangChain, N kali buka index & bangun chain.
+# Di sini:
+# - master memuat engine SEKALI (import, index flat mmap, BM25, chain), gc.freeze(), lalu fork N worker
+# - worker berbagi memori itu copy-on-write; index flat di-mmap sehingga berbagi page cache yang sama
+# - semua worker accept() di satu socket yang dibuka master (kernel membagi koneksi)
+# - SIGHUP ke master = reload tanpa downtime: engine dibangun ulang dari index terbaru, generasi worker
+#   baru di-fork, generasi lama menyelesaikan request yang sedang jalan lalu berhenti
+# - SIGTERM / Ctrl+C = berhenti dengan rapi; worker yang mati mendadak langsung diganti
+# - SIGUSR1 = cetak pemakaian memori (RSS/PSS) master & semua worker
+# Chroma (koneksi SQLite + HNSW di memori) tidak aman dibawa lintas fork: dengan VECTOR_STORE=chroma
+# master hanya meng-import library dan setiap worker membuka Chroma sendiri (memori index tidak dibagi).
+
+load_dotenv()
+
+PREFORK_WORKERS = int(os.getenv("PREFORK_WORKERS", "0")) or os.cpu_count() or 1
+PREFORK_GRACEFUL_TIMEOUT = float(os.getenv("PREFORK_GRACEFUL_TIMEOUT", "30"))
+PREFORK_BACKLOG = int(os.getenv("PREFORK_BACKLOG", "1024"))
+# Tanpa file bersama, setiap worker memakai kuota Gemini penuh (N worker = N x kuota)
+os.environ.setdefault("GEMINI_LIMITER_DB", "./.gemini_limiter/buckets.sqlite3")
+# Client gRPC yang dibuat master (belum pernah dipakai) tetap aman dipakai worker setelah fork
+os.environ.setdefault("GRPC_ENABLE_FORK_SUPPORT", "1")
+# Warm-up memanggil API embedding (dan membuka Chroma): tidak boleh terjadi di master sebelum fork.
+# Master selalu memuat bot_server tanpa warm-up; RAG_WARMUP=1 dijalankan di setiap worker setelah fork.
+PREFORK_WARMUP = os.getenv("RAG_WARMUP", "0") == "1"
+os.environ["RAG_WARMUP"] = "0"
+
+# Dengan VECTOR_STORE=chroma master hanya meng-import ini (bagian terbesar memori & waktu start-up)
+PRELOAD_MODULES = (
+    "langchain_chroma",
+    "langchain_google_genai",
+    "langchain_classic.chains",
+    "langchain_classic.chains.combine_documents",
+    "langchain_core.prompts",
+)
+# Worker yang mati lebih cepat dari ini setelah start dianggap crash loop: respawn diperlambat
+CRASH_WINDOW_SECONDS = 5.0
+
+
+# --- WORKER ---
+class _WorkerWSGIServer(ThreadingMixIn, WSGIServer):
+    """Server WSGI satu thread per request di atas socket yang sudah di-listen oleh master"""
+
+    # Thread non-daemon: server_close() menunggu request yang masih berjalan (graceful shutdown)
+    daemon_threads = False
+    block_on_close = True
+
+
+def _make_server(listener, app):
+    host, port = listener.getsockname()[:2]
+    server = _WorkerWSGIServer((host, port), WSGIRequestHandler, bind_and_activate=False)
+    server.socket.close()
+    server.socket = listener
+    # Pengganti server_bind(): socket sudah di-bind & listen di master
+    server.server_name, server.server_port = host, port
+    server.setup_environ()
+    server.set_app(app)
+    return server
+
+
+def _run_worker(listener, generation):
+    """Dijalankan di child setelah fork; tidak pernah kembali ke kode master"""
+    state = {"server": None, "stopping": False}
+
+    def drain(signum, frame):
+        state["stopping"] = True
+        if state["server"] is not None:
+            # shutdown() menunggu loop serve_forever selesai, jadi tidak boleh dipanggil dari thread yang sama
+            threading.Thread(target=state["server"].shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, drain)
+    signal.signal(signal.SIGINT, drain)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+
+    code = 0
+    try:
+        import bot_server
+        engine = bot_server.engine
+        if engine is not None:
+            try:
+                if not engine.ready:
+                    # VECTOR_STORE=chroma: setiap worker membuka collection sendiri sebelum menerima request
+                    engine.preload()
+                if PREFORK_WARMUP:
+                    engine.warm_up()
+            except Exception as e:
+                # Tetap serve: /healthz ok, /readyz 503, request mendapat pesan error seperti mode biasa
+                print(f"❌ [worker {os.getpid()}] Engine gagal dimuat: {e}", flush=True)
+            # Engine tenant (tenants.json) dibangun di latar; /readyz 200 setelah semuanya siap
+            bot_server.preload_in_background()
+
+        server = state["server"] = _make_server(listener, bot_server.app)
+        print(f"👷 Worker {os.getpid()} (generasi {generation}) siap", flush=True)
+        if not state["stopping"]:
+            server.serve_forever(poll_interval=0.5)
+        server.server_close()
+    except Exception as e:
+        print(f"❌ [worker {os.getpid()}] {e}", flush=True)
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+
+# --- MEMORI ---
+def _memory_kb(pid):
+    """(RSS, PSS) dalam kB dari /proc (Linux). PSS membagi halaman bersama rata ke semua proses pemakainya."""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", encoding="ascii") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss"):
+                    values[key] = int(rest.split()[0])
+    except OSError:
+        return None
+    return values.get("Rss", 0), values.get("Pss", 0)
+
+
+# --- MASTER ---
+class PreforkMaster:
+    def __init__(self, listener, workers=PREFORK_WORKERS, graceful_timeout=PREFORK_GRACEFUL_TIMEOUT):
+        self.listener = listener
+        self.n_workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.generation = 0
+        self.workers = {}    # pid -> (generation, waktu start)
+        self.retiring = {}   # pid -> batas waktu sebelum SIGKILL
+        self.stop_deadline = None
+        self._signals = []
+
+    # --- MEMUAT ENGINE (SEBELUM FORK) ---
+    def load(self):
+        """Muat / muat ulang engine di master. Return False jika gagal (generasi lama tetap melayani)."""
+        import bot_server
+        import rag_engine
+
+        started = time.perf_counter()
+        previous = None
+        if self.generation > 0:
+            # Objek generasi lama sudah tidak dipakai master; lepas dari generasi permanen supaya bisa di-GC
+            gc.unfreeze()
+            previous = (bot_server.engine, rag_engine.reset_engines())
+            bot_server.engine = bot_server.load_engine()
+        try:
+            if previous is not None and bot_server.engine is None:
+                raise FileNotFoundError(f"Folder '{rag_engine.PERSIST_DIRECTORY}' tidak ditemukan")
+            if bot_server.engine is not None and rag_engine.VECTOR_STORE == "flat":
+                bot_server.engine.preload()
+            else:
+                if bot_server.engine is not None and bot_server.engine.ready:
+                    # Client Chroma tidak boleh diwarisi worker: buang engine yang sudah terbangun di master
+                    rag_engine.reset_engines()
+                    bot_server.engine = bot_server.load_engine()
+                for name in PRELOAD_MODULES:
+                    importlib.import_module(name)
+        except Exception as e:
+            print(f"❌ Gagal memuat engine: {e}", flush=True)
+            if previous is not None:
+                bot_server.engine = previous[0]
+                rag_engine.restore_engines(previous[1])
+            gc.collect()
+            gc.freeze()
+            return False
+
+        # Objek yang sudah ada tidak lagi di-scan GC: header GC-nya tidak ditulis ulang di worker,
+        # jadi halaman memori ini tetap dibagi (tidak di-copy) selama worker hanya membacanya
+        gc.collect()
+        gc.freeze()
+        self.generation += 1
+        print(f"📦 Engine generasi {self.generation} dimuat di master dalam "
+              f"{(time.perf_counter() - started) * 1000:.0f}ms ({gc.get_freeze_count()} objek dibekukan)", flush=True)
+        return True
+
+    # --- WORKER ---
+    def spawn(self):
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(self.listener, self.generation)
+        self.workers[pid] = (self.generation, time.monotonic())
+        return pid
+
+    def _signal_all(self, pids, signum):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def retire(self, pids):
+        """Minta worker berhenti dengan rapi; SIGKILL jika belum selesai setelah graceful timeout"""
+        deadline = time.monotonic() + self.graceful_timeout
+        for pid in pids:
+            self.workers.pop(pid, None)
+            self.retiring[pid] = deadline
+        self._signal_all(pids, signal.SIGTERM)
+
+    def reap(self):
+        crashed = 0
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return crashed
+            if pid == 0:
+                return crashed
+            self.retiring.pop(pid, None)
+            entry = self.workers.pop(pid, None)
+            if entry is None or self.stop_deadline is not None:
+                continue
+            generation, started = entry
+            print(f"⚠️  Worker {pid} berhenti mendadak (status {os.waitstatus_to_exitcode(status)}), diganti",
+                  flush=True)
+            if time.monotonic() - started < CRASH_WINDOW_SECONDS:
+                crashed += 1
+            if generation == self.generation:
+                self.spawn()
+
+    def reload(self):
+        print("🔄 Reload: memuat ulang engine...", flush=True)
+        old = list(self.workers)
+        if not self.load():
+            return
+        for _ in range(self.n_workers):
+            self.spawn()
+        # Generasi baru sudah accept() di socket yang sama; generasi lama cukup menyelesaikan request-nya
+        self.retire(old)
+        print(f"✅ Reload selesai: {self.n_workers} worker generasi {self.generation}, "
+              f"{len(old)} worker lama di-drain", flush=True)
+
+    def report_memory(self):
+        rows = [("master", os.getpid())] + [(f"worker g{self.workers[pid][0]}", pid) for pid in self.workers]
+        total_pss = 0
+        for name, pid in rows:
+            memory = _memory_kb(pid)
+            if memory is None:
+                continue
+            rss, pss = memory
+            total_pss += pss
+            print(f"📊 {name:<12} pid={pid:<7} RSS={rss / 1024:8.1f} MB  PSS={pss / 1024:8.1f} MB", flush=True)
+        print(f"📊 Total PSS (memori fisik sebenarnya): {total_pss / 1024:.1f} MB", flush=True)
+
+    # --- LOOP UTAMA ---
+    def _on_signal(self, signum, frame):
+        self._signals.append(signum)
+
+    def run(self):
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGUSR1):
+            signal.signal(signum, self._on_signal)
+
+        if not self.load():
+            raise SystemExit(1)
+        for _ in range(self.n_workers):
+            self.spawn()
+        host, port = self.listener.getsockname()[:2]
+        print(f"🚀 Master {os.getpid()} melayani http://{host}:{port} dengan {self.n_workers} worker "
+              f"(reload: kill -HUP {os.getpid()})", flush=True)
+
+        while True:
+            while self._signals:
+                signum = self._signals.pop(0)
+                if signum == signal.SIGHUP and self.stop_deadline is None:
+                    self.reload()
+                elif signum == signal.SIGUSR1:
+                    self.report_memory()
+                elif signum in (signal.SIGTERM, signal.SIGINT) and self.stop_deadline is None:
+                    print("🛑 Berhenti: menunggu request yang sedang berjalan...", flush=True)
+                    self.stop_deadline = time.monotonic() + self.graceful_timeout
+                    self.retire(list(self.workers))
+
+            crashed = self.reap()
+            if self.stop_deadline is not None and not self.workers and not self.retiring:
+                print("👋 Semua worker sudah berhenti", flush=True)
+                return
+
+            now = time.monotonic()
+            overdue = [pid for pid, deadline in self.retiring.items() if now > deadline]
+            self._signal_all(overdue, signal.SIGKILL)
+
+            # Crash loop (mis. port/konfigurasi salah): jangan fork terus-menerus
+            time.sleep(1.0 if crashed else 0.2)
+
+
+def open_listener(host, port, backlog=PREFORK_BACKLOG):
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    listener = socket.socket(family, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(backlog)
+    return listener
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bot Google Chat (RAG) multi-worker pre-fork")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=PREFORK_WORKERS, help="Jumlah worker (default: jumlah core)")
+    args = parser.parse_args()
+
+    PreforkMaster(open_listener(args.host, args.port), workers=args.workers).run()
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import zlib
+import atexit
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+
+from chat_history import BoundedChatHistory
+
+# --- SESSION STORE UNTUK RunnableWithMessageHistory ---
+# `store = {}` tumbuh terus (memory leak untuk bot multi-user) dan hilang saat restart. Di sini:
+# - Di memori hanya sesi aktif: LRU dengan batas jumlah + idle TTL
+# - Sesi yang dikeluarkan dari memori disimpan ke SQLite (JSON ringkas, dikompres zlib)
+# - Sesi dimuat ulang dari SQLite hanya saat user tersebut kembali (lazy)
+# - Sesi idle juga disapu saat save() dan oleh thread penyapu berkala (beban tulis saja tetap dibersihkan)
+# - Semua sesi di memori di-flush ke disk saat proses berhenti
+
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "./sessions/sessions.sqlite3")
+SESSION_MAX_IN_MEMORY = int(os.getenv("SESSION_MAX_IN_MEMORY", "1000"))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))  # detik
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))  # detik, 0 = tanpa thread penyapu
+
+# Representasi ringkas: [kode_role, isi]
+_ROLE_CODES = {HumanMessage: "h", AIMessage: "a", SystemMessage: "s"}
+_ROLE_CLASSES = {code: cls for cls, code in _ROLE_CODES.items()}
+
+
+def dump_history(history):
+    state = {
+        "s": history.summary,
+        "t": history.total_turns,
+        "m": [[_ROLE_CODES.get(type(m), "h"), m.content] for m in history.recent],
+    }
+    return zlib.compress(json.dumps(state, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def load_history_state(blob):
+    state = json.loads(zlib.decompress(blob).decode("utf-8"))
+    return {
+        "summary": state["s"],
+        "total_turns": state["t"],
+        "recent": [_ROLE_CLASSES[code](content=content) for code, content in state["m"]],
+    }
+
+
+class SessionStore:
+    """
+    Penyedia history per session_id: `get_session_history = store.get`.
+    `history_factory(**state)` membuat BoundedChatHistory (mis. untuk menyuntikkan LLM ringkasan).
+    """
+
+    def __init__(self, history_factory=None, path=SESSION_DB_PATH,
+                 max_in_memory=SESSION_MAX_IN_MEMORY, idle_ttl=SESSION_IDLE_TTL,
+                 sweep_interval=SESSION_SWEEP_INTERVAL):
+        self.history_factory = history_factory or BoundedChatHistory
+        self.path = path
+        self.max_in_memory = max_in_memory
+        self.idle_ttl = idle_ttl
+        self._active = OrderedDict()  # session_id -> (history, last_access)
+        self._lock = threading.RLock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, state BLOB NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.spilled = 0
+        self.rehydrated = 0
+        atexit.register(self.flush)
+
+        self._closed = threading.Event()
+        if sweep_interval > 0:
+            threading.Thread(target=self._sweep_loop, args=(sweep_interval,), daemon=True,
+                             name="session-sweeper").start()
+
+    def __len__(self):
+        return len(self._active)
+
+    # --- AKSES ---
+    def get(self, session_id):
+        now = time.time()
+        with self._lock:
+            entry = self._active.pop(session_id, None)
+            if entry is not None:
+                history = entry[0]
+            else:
+                history = self._rehydrate(session_id)
+            self._active[session_id] = (history, now)
+            self._evict(now)
+            return history
+
+    def _rehydrate(self, session_id):
+        row = self._conn.execute(
+            "SELECT state FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return self.history_factory()
+        self.rehydrated += 1
+        return self.history_factory(**load_history_state(row[0]))
+
+    # --- EVICTION (LRU + IDLE TTL) ---
+    def _evict(self, now):
+        expired = []
+        # OrderedDict urut dari akses terlama -> cukup cek dari depan
+        for session_id, (_, last_access) in self._active.items():
+            over_capacity = len(self._active) - len(expired) > self.max_in_memory
+            if not over_capacity and now - last_access <= self.idle_ttl:
+                break
+            expired.append(session_id)
+        if not expired:
+            return
+        self._write([(session_id, self._active.pop(session_id)[0]) for session_id in expired])
+        self.spilled += len(expired)
+
+    def sweep(self):
+        """Keluarkan sesi idle/kelebihan dari memori tanpa menunggu get() berikutnya"""
+        with self._lock:
+            self._evict(time.time())
+
+    def _sweep_loop(self, interval):
+        while not self._closed.wait(interval):
+            self.sweep()
+
+    def _write(self, items):
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO sessions (session_id, state, updated_at) VALUES (?, ?, ?)",
+            [(session_id, dump_history(history), now) for session_id, history in items],
+        )
+        self._conn.commit()
+
+    # --- PERSISTENSI ---
+    def save(self, session_id):
+        """Tulis satu sesi aktif ke disk (mis. setelah setiap giliran, agar aman dari crash)"""
+        with self._lock:
+            entry = self._active.get(session_id)
+            if entry is not None:
+                self._write([(session_id, entry[0])])
+            self._evict(time.time())
+
+    def flush(self):
+        with self._lock:
+            if self._active:
+                self._write([(session_id, history) for session_id, (history, _) in self._active.items()])
+
+    def close(self):
+        """Hentikan thread penyapu lalu flush semua sesi aktif"""
+        self._closed.set()
+        self.flush()
+
+    def delete(self, session_id):
+        with self._lock:
+            self._active.pop(session_id, None)
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            stored = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {
+            "in_memory": len(self._active),
+            "stored": stored,
+            "spilled": self.spilled,
+            "rehydrated": self.rehydrated,
+        }
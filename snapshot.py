@@ -0,0 +1,274 @@
+import os
+import io
+import json
+import gzip
+import struct
+import hashlib
+import argparse
+from datetime import datetime, timezone
+
+import numpy as np
+
+from embedding_cache import embedding_model_id, read_embedding_signature, write_embedding_signature
+
+# --- SNAPSHOT COLLECTION (SATU FILE, TERKOMPRESI, BERVERSI) ---
+# Isi collection (ID, vector, teks, metadata, info model embedding) dibekukan ke satu file,
+# lalu bisa dipulihkan ke Chroma (disk / in-memory) TANPA satu pun panggilan embedding.
+# Format file:
+#   MAGIC (8 byte) | panjang header (uint32) | header JSON | payload terkompresi
+#   payload = panjang JSON (uint64) | JSON {ids, documents, metadatas} | matriks vector (row-major)
+# Kompresi zstd jika paket `zstandard` terpasang, selain itu gzip.
+
+MAGIC = b"RAGSNAP\x00"
+FORMAT_VERSION = 1
+PERSIST_DIRECTORY = "./chroma_db"
+COLLECTION_NAME = "knowledge_base_perusahaan"
+UPSERT_BATCH = 5000
+SNAPSHOT_DIRECTORY = "./snapshots"
+
+
+# --- KOMPRESI ---
+def _compressor():
+    try:
+        import zstandard
+        return "zstd", lambda data: zstandard.ZstdCompressor(level=10).compress(data)
+    except ImportError:
+        return "gzip", lambda data: gzip.compress(data, compresslevel=6)
+
+
+def _decompress(method, data):
+    if method == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("Snapshot ini memakai zstd: pip install zstandard") from None
+        return zstandard.ZstdDecompressor().decompress(data)
+    if method == "gzip":
+        return gzip.decompress(data)
+    raise ValueError(f"Kompresi snapshot tidak dikenal: {method}")
+
+
+# --- EXPORT ---
+def read_collection(vectorstore, page_size=UPSERT_BATCH):
+    """Ambil seluruh isi collection Chroma per halaman: (ids, documents, metadatas, vectors)"""
+    collection = vectorstore._collection
+    ids, documents, metadatas, blocks = [], [], [], []
+    for offset in range(0, collection.count(), page_size):
+        data = collection.get(limit=page_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+        ids.extend(data["ids"])
+        documents.extend(data["documents"])
+        metadatas.extend(m or {} for m in data["metadatas"])
+        blocks.append(np.asarray(data["embeddings"], dtype=np.float32))
+    vectors = np.vstack(blocks) if blocks else np.zeros((0, 0), dtype=np.float32)
+    return ids, documents, metadatas, vectors
+
+
+def export_snapshot(vectorstore, path, collection_name, model_id=None, dtype="float32", persist_directory=None):
+    """
+    Tulis snapshot ke `path`. Return header (termasuk checksum payload).
+    Model embedding dicatat dari signature collection di persist_directory (embedding_<collection>.json),
+    bukan dari environment saat export; tanpa persist_directory (collection in-memory) = model aktif.
+    """
+    if model_id is None and persist_directory:
+        model_id = read_embedding_signature(persist_directory, collection_name)["model"]
+    ids, documents, metadatas, vectors = read_collection(vectorstore)
+    vectors = np.ascontiguousarray(vectors, dtype=np.dtype(dtype))
+
+    records = json.dumps({"ids": ids, "documents": documents, "metadatas": metadatas},
+                         ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    raw = struct.pack("<Q", len(records)) + records + vectors.tobytes()
+    method, compress = _compressor()
+    payload = compress(raw)
+
+    header = {
+        "format_version": FORMAT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "collection": collection_name,
+        "embedding_model": model_id or embedding_model_id(),
+        "dimension": int(vectors.shape[1]) if len(ids) else None,
+        "count": len(ids),
+        "dtype": vectors.dtype.name,
+        "compression": method,
+        "raw_bytes": len(raw),
+        "payload_sha256": hashlib.sha256(payload).hexdigest(),
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        f.write(payload)
+    os.replace(path + ".tmp", path)
+    return header
+
+
+# --- IMPORT ---
+def read_header(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Bukan file snapshot RAG")
+    (length,) = struct.unpack("<I", f.read(4))
+    header = json.loads(f.read(length))
+    if header["format_version"] > FORMAT_VERSION:
+        raise ValueError(
+            f"Snapshot versi {header['format_version']} lebih baru dari yang didukung ({FORMAT_VERSION})"
+        )
+    return header
+
+
+def load_snapshot(path):
+    """Return dict: header, ids, documents, metadatas, vectors (checksum diverifikasi)"""
+    with open(path, "rb") as f:
+        header = read_header(f)
+        payload = f.read()
+    if hashlib.sha256(payload).hexdigest() != header["payload_sha256"]:
+        raise ValueError(f"Checksum snapshot '{path}' tidak cocok (file rusak / terpotong)")
+
+    raw = io.BytesIO(_decompress(header["compression"], payload))
+    (length,) = struct.unpack("<Q", raw.read(8))
+    records = json.loads(raw.read(length))
+    vectors = np.frombuffer(raw.read(), dtype=np.dtype(header["dtype"]))
+    if header["count"]:
+        vectors = vectors.reshape(header["count"], header["dimension"])
+    return {"header": header, **records, "vectors": vectors}
+
+
+def restore_snapshot(path, embeddings, collection_name=None, persist_directory=None, model_id=None):
+    """
+    Pulihkan snapshot ke Chroma. persist_directory=None -> collection in-memory.
+    Tidak ada panggilan embedding; model aktif harus sama dengan model snapshot.
+    """
+    from langchain_chroma import Chroma
+
+    snapshot = load_snapshot(path)
+    header = snapshot["header"]
+    model_id = model_id or embedding_model_id()
+    if header["embedding_model"] != model_id:
+        raise ValueError(
+            f"Snapshot dibuat dengan {header['embedding_model']}, tapi backend aktif adalah {model_id}. "
+            "Samakan EMBEDDING_BACKEND atau buat snapshot baru."
+        )
+
+    collection_name = collection_name or header["collection"]
+    kwargs = {"persist_directory": persist_directory} if persist_directory else {}
+    vectorstore = Chroma(collection_name=collection_name, embedding_function=embeddings, **kwargs)
+    if vectorstore._collection.count():
+        # Upsert saja akan menyisakan chunk lama yang tidak ada di snapshot: kosongkan dulu
+        print(f"♻️ Collection '{collection_name}' tidak kosong, dikosongkan sebelum restore")
+        vectorstore.delete_collection()
+        vectorstore = Chroma(collection_name=collection_name, embedding_function=embeddings, **kwargs)
+
+    ids, documents, metadatas = snapshot["ids"], snapshot["documents"], snapshot["metadatas"]
+    vectors = snapshot["vectors"].astype(np.float32)
+    for start in range(0, len(ids), UPSERT_BATCH):
+        end = start + UPSERT_BATCH
+        vectorstore._collection.upsert(
+            ids=ids[start:end],
+            embeddings=vectors[start:end],
+            documents=documents[start:end],
+            metadatas=[m or None for m in metadatas[start:end]],
+        )
+
+    if persist_directory:
+        # Lengkapi artefak pendamping collection di disk: info model + index BM25
+        from bm25_index import BM25Index, index_path
+        write_embedding_signature(vectorstore, persist_directory, collection_name, model_id=header["embedding_model"])
+        BM25Index.from_vectorstore(vectorstore).save(index_path(persist_directory, collection_name))
+    return vectorstore
+
+
+def chunker_settings(splitter=None):
+    """Pengaturan chunker yang menentukan isi collection (ikut kunci snapshot)"""
+    if splitter is None:
+        from token_chunker import TokenChunker
+        splitter = TokenChunker()
+    return {
+        "max_tokens": splitter.max_tokens,
+        "overlap_tokens": splitter.overlap_tokens,
+        "min_tokens": splitter.min_tokens,
+        "tokenizer": splitter.counter.name,
+    }
+
+
+def snapshot_path_for(source, name, directory=SNAPSHOT_DIRECTORY, splitter=None, model_id=None):
+    """
+    Nama snapshot = hash isi file sumber + pengaturan chunker + model embedding.
+    PDF, CHUNK_* / tokenizer, atau EMBEDDING_BACKEND berubah -> snapshot baru otomatis.
+    """
+    key = json.dumps({
+        "source": file_sha256(source),
+        "chunker": chunker_settings(splitter),
+        "embedding_model": model_id or embedding_model_id(),
+    }, sort_keys=True)
+    return os.path.join(directory, f"{name}_{hashlib.sha256(key.encode()).hexdigest()[:12]}.ragsnap")
+
+
+def restore_or_build(path, embeddings, collection_name, build, model_id=None):
+    """
+    Untuk script demo: pulihkan collection in-memory dari snapshot jika ada,
+    jika belum, bangun dengan `build(vectorstore)` lalu simpan snapshot-nya untuk start berikutnya.
+    Snapshot yang tidak cocok (model embedding beda / file rusak) dibangun ulang, bukan error.
+    """
+    if os.path.exists(path):
+        print(f"📦 Memuat snapshot '{path}' (tanpa embedding ulang)...")
+        try:
+            return restore_snapshot(path, embeddings, collection_name=collection_name, model_id=model_id)
+        except ValueError as e:
+            print(f"⚠️ Snapshot tidak dipakai ({e}); membangun ulang...")
+
+    from langchain_chroma import Chroma
+
+    vectorstore = Chroma(collection_name=collection_name, embedding_function=embeddings)
+    build(vectorstore)
+    header = export_snapshot(vectorstore, path, collection_name, model_id=model_id)
+    print(f"📦 Snapshot disimpan: '{path}' ({header['count']} vector)")
+    return vectorstore
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+if __name__ == "__main__":
+    # python snapshot.py export --output knowledge_base.ragsnap
+    # python snapshot.py import knowledge_base.ragsnap
+    # python snapshot.py info knowledge_base.ragsnap
+    parser = argparse.ArgumentParser(description="Export / import snapshot collection vector")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_cmd = commands.add_parser("export", help="Collection Chroma -> file snapshot")
+    export_cmd.add_argument("--collection", default=COLLECTION_NAME)
+    export_cmd.add_argument("--output", required=True)
+    export_cmd.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+
+    import_cmd = commands.add_parser("import", help="File snapshot -> collection Chroma di disk")
+    import_cmd.add_argument("snapshot")
+    import_cmd.add_argument("--collection", help="Default: nama collection di snapshot")
+    import_cmd.add_argument("--persist-directory", default=PERSIST_DIRECTORY)
+
+    info_cmd = commands.add_parser("info", help="Tampilkan header & checksum snapshot")
+    info_cmd.add_argument("snapshot")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        from langchain_chroma import Chroma
+        store = Chroma(persist_directory=PERSIST_DIRECTORY, collection_name=args.collection)
+        header = export_snapshot(store, args.output, args.collection, dtype=args.dtype,
+                                 persist_directory=PERSIST_DIRECTORY)
+        size_mb = os.path.getsize(args.output) / 2**20
+        print(f"✅ {header['count']} vector ({header['dtype']}, {header['compression']}) -> "
+              f"'{args.output}' ({size_mb:.1f} MB)")
+    elif args.command == "import":
+        # Tanpa model embedding: vector sudah ada di snapshot
+        store = restore_snapshot(args.snapshot, None, collection_name=args.collection,
+                                 persist_directory=args.persist_directory)
+        print(f"✅ {store._collection.count()} vector dipulihkan ke '{args.persist_directory}'")
+    else:
+        with open(args.snapshot, "rb") as f:
+            print(json.dumps(read_header(f), indent=2))
+        print(f"sha256 file: {file_sha256(args.snapshot)}")
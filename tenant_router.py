@@ -0,0 +1,139 @@
+import os
+import json
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List
+
+from langchain_core.retrievers import BaseRetriever
+
+# --- COLLECTION PER TENANT / DIVISI + RETRIEVAL FAN-OUT ---
+# Satu collection per tenant (mis. "hr", "keuangan", "user_12345") alih-alih satu collection raksasa:
+# - tenants.json memetakan Space Google Chat / chat Telegram ke shard yang boleh dibaca
+# - query di-embed SEKALI, lalu dicari paralel di semua shard, hasilnya digabung jadi top-k global
+# - tanpa tenants.json semua chat tetap memakai collection default (perilaku lama)
+#
+# Contoh tenants.json:
+# {
+#   "default": ["knowledge_base_perusahaan"],
+#   "routes": {
+#     "gchat:spaces/AAAAxxxx": ["hr", "umum"],
+#     "telegram:12345": ["user_12345", "umum"],
+#     "telegram:*": ["umum"]
+#   }
+# }
+# Isi shard dengan: python ingest.py --pdf sop_hr.pdf --collection hr
+
+TENANT_ROUTES_PATH = os.getenv("TENANT_ROUTES", "./tenants.json")
+TENANT_FANOUT_WORKERS = int(os.getenv("TENANT_FANOUT_WORKERS", "8"))
+
+# Query Chroma (hnswlib) & perkalian matriks numpy melepas GIL, jadi thread sudah cukup
+_fanout_pool = ThreadPoolExecutor(max_workers=TENANT_FANOUT_WORKERS, thread_name_prefix="fanout")
+
+
+class TenantRouter:
+    """Baca tenants.json (dimuat ulang otomatis jika file berubah) -> daftar shard per chat"""
+
+    def __init__(self, path=TENANT_ROUTES_PATH):
+        self.path = path
+        self._config = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _current(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if mtime != self._mtime:
+                with open(self.path, encoding="utf-8") as f:
+                    self._config = json.load(f)
+                self._mtime = mtime
+            return self._config
+
+    def shards_for(self, channel, chat_id):
+        """
+        Return list collection untuk chat ini, [] jika chat tidak boleh mengakses apa pun,
+        atau None jika routing tidak aktif (belum ada tenants.json).
+        """
+        config = self._current()
+        if config is None:
+            return None
+        routes = config.get("routes", {})
+        for key in (f"{channel}:{chat_id}", f"{channel}:*"):
+            if key in routes:
+                return list(routes[key])
+        return list(config.get("default", []))
+
+    def engine_for(self, channel, chat_id, default_engine, **kwargs):
+        """
+        Engine RAG untuk chat ini (satu engine per kombinasi shard, dibuat sekali per proses).
+        default_engine dipakai jika routing tidak aktif; PermissionError jika chat tidak punya shard.
+        """
+        shards = self.shards_for(channel, chat_id)
+        if not shards and shards is not None:
+            raise PermissionError(f"{channel}:{chat_id} tidak punya akses ke knowledge base mana pun")
+        return self._engine(channel, shards, default_engine, **kwargs)
+
+    def _engine(self, channel, shards, default_engine, **kwargs):
+        if shards is None or (default_engine is not None and shards == default_engine.collections):
+            return default_engine
+        import rag_engine
+        return rag_engine.get_engine(f"{channel}:{','.join(shards)}", collections=shards, **kwargs)
+
+    def engines(self, channel, default_engine, **kwargs):
+        """Semua engine tenant untuk channel ini menurut tenants.json (tanpa default_engine), untuk boot & /readyz"""
+        config = self._current()
+        if config is None:
+            return []
+        shard_sets = [config.get("default", [])] + [
+            shards for key, shards in config.get("routes", {}).items() if key.split(":", 1)[0] == channel
+        ]
+        result = []
+        for shards in shard_sets:
+            engine = self._engine(channel, list(shards), default_engine, **kwargs) if shards else None
+            if engine is not None and engine is not default_engine and engine not in result:
+                result.append(engine)
+        return result
+
+
+def _scored_search(vectorstore, vector, k):
+    """Top-k satu shard dengan skor relevansi [0, 1] (lebih besar = lebih relevan) supaya bisa digabung"""
+    if hasattr(vectorstore, "similarity_search_by_vector_with_score"):
+        # FlatVectorStore: skor = cosine similarity
+        pairs = vectorstore.similarity_search_by_vector_with_score(vector, k=k)
+    else:
+        # Chroma: skor = jarak (lebih kecil = lebih dekat)
+        pairs = vectorstore.similarity_search_by_vector_with_relevance_scores(vector, k=k)
+    relevance = vectorstore._select_relevance_score_fn()
+    return [(doc, relevance(score)) for doc, score in pairs]
+
+
+class ShardedRetriever(BaseRetriever):
+    """
+    Vector search paralel ke beberapa collection, digabung per skor relevansi.
+    Sengaja vector-only: skor BM25 tiap shard punya statistik IDF sendiri sehingga tidak sebanding.
+    """
+
+    vectorstores: List[Any]
+    k: int = 3
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self.search_with_vector(query)
+
+    def search_with_vector(self, query, vector=None):
+        """Seperti invoke(), tapi boleh memakai vector query yang sudah dihitung (mode batch)"""
+        if vector is None:
+            # Semua shard memakai model embedding yang sama (dicek saat engine dibangun)
+            vector = self.vectorstores[0].embeddings.embed_query(query)
+
+        futures = [_fanout_pool.submit(_scored_search, store, vector, self.k) for store in self.vectorstores]
+        best = {}
+        for future in futures:
+            for doc, score in future.result():
+                # Dokumen yang sama bisa ada di dua shard (mis. "umum" ikut di-ingest ke shard divisi)
+                key = doc.id or doc.metadata.get("chunk_id") or doc.page_content
+                if key not in best or score > best[key][1]:
+                    best[key] = (doc, score)
+        return [doc for doc, _ in heapq.nlargest(self.k, best.values(), key=lambda pair: pair[1])]
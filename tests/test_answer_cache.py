@@ -0,0 +1,33 @@
+from answer_cache import AnswerCache, collection_fingerprint
+
+
+def chroma_dir(tmp_path):
+    """Tata letak chroma_db: chroma.sqlite3 + index HNSW di subfolder UUID per segment"""
+    persist = tmp_path / "chroma_db"
+    segment = persist / "3f2c9a1e-5b7d-4c1a-9e8f-0a1b2c3d4e5f"
+    segment.mkdir(parents=True)
+    (persist / "chroma.sqlite3").write_bytes(b"sqlite")
+    (segment / "data_level0.bin").write_bytes(b"\0" * 64)
+    return persist, segment
+
+
+def test_fingerprint_sees_changes_inside_segment_directories(tmp_path):
+    persist, segment = chroma_dir(tmp_path)
+    before = collection_fingerprint(str(persist))
+
+    (segment / "data_level0.bin").write_bytes(b"\0" * 128)
+    assert collection_fingerprint(str(persist)) != before
+
+    changed = collection_fingerprint(str(persist))
+    (segment / "link_lists.bin").write_bytes(b"\0")
+    assert collection_fingerprint(str(persist)) != changed
+
+
+def test_reingest_into_segment_clears_cached_answers(tmp_path):
+    persist, segment = chroma_dir(tmp_path)
+    cache = AnswerCache(persist_directory=str(persist))
+    cache.put("Bagaimana cara cuti?", {"answer": "Lewat portal HR."})
+    assert cache.get("bagaimana cara cuti")["answer"] == "Lewat portal HR."
+
+    (segment / "data_level0.bin").write_bytes(b"\1" * 128)  # ingest baru, chroma.sqlite3 tidak berubah
+    assert cache.get("bagaimana cara cuti") is None
@@ -0,0 +1,31 @@
+from langchain_core.messages import AIMessage, HumanMessage
+
+from chat_history import BoundedChatHistory, approx_tokens
+
+
+def prompt_tokens(messages):
+    return sum(approx_tokens(str(m.content)) for m in messages)
+
+
+def test_oversized_last_pair_is_truncated_to_hard_cap():
+    history = BoundedChatHistory(max_tokens=50)
+    answer = "Cuti tahunan diajukan lewat portal HR paling lambat 7 hari sebelumnya. " * 7  # ±125 token
+    history.add_messages([HumanMessage(content="Bagaimana cara mengajukan cuti?"), AIMessage(content=answer)])
+
+    messages = history.messages
+    assert history.last_prompt_tokens <= 50 and prompt_tokens(messages) <= 50
+    # Pertanyaan pendek tetap utuh, jawaban panjang yang dipotong; riwayat asli tidak berubah
+    assert messages[0].content == "Bagaimana cara mengajukan cuti?"
+    assert answer.startswith(messages[1].content) and isinstance(messages[1], AIMessage)
+    assert history.recent[1].content == answer
+
+
+def test_old_turns_and_summary_are_trimmed_before_last_pair():
+    history = BoundedChatHistory(max_tokens=50, summary="ringkasan " * 40)
+    history.add_messages([HumanMessage(content="a" * 400), AIMessage(content="b" * 400),
+                          HumanMessage(content="apa itu lembur?"), AIMessage(content="Kerja di luar jam kantor.")])
+
+    summary, *recent = history.messages
+    assert [m.content for m in recent] == ["apa itu lembur?", "Kerja di luar jam kantor."]
+    assert summary.content.startswith("Ringkasan percakapan sebelumnya:")
+    assert history.last_prompt_tokens <= 50
@@ -0,0 +1,50 @@
+from langchain_core.documents import Document
+
+from context_compression import approx_tokens, compress_documents
+
+PAGES = [" ".join(f"h{page}k{i} tentang prosedur cuti karyawan." for i in range(200)) for page in range(3)]
+PAGE = PAGES[0]
+
+
+def chunk(start, end, page=0, source="sop.pdf"):
+    return Document(page_content=PAGES[page][start:end],
+                    metadata={"source": source, "page": page, "start_index": start})
+
+
+def total_tokens(docs):
+    return sum(approx_tokens(doc.page_content) for doc in docs)
+
+
+def test_overlapping_chunks_are_merged_into_one_passage():
+    docs = [chunk(400, 800), chunk(0, 500), chunk(700, 1000)]
+    [passage] = compress_documents(docs, token_budget=1000)
+
+    assert passage.page_content == PAGE[0:1000]
+    assert passage.metadata["merged_chunks"] == 3
+    assert passage.metadata["start_index"] == 0
+
+
+def test_contained_and_duplicate_chunks_are_dropped():
+    docs = [chunk(0, 400), chunk(100, 200), chunk(0, 400), chunk(0, 400, page=1)]
+    result = compress_documents(docs, token_budget=1000)
+
+    assert [(doc.metadata["page"], len(doc.page_content)) for doc in result] == [(0, 400), (1, 400)]
+
+
+def test_oversize_first_passage_is_truncated_to_budget():
+    docs = [chunk(0, 1800)]  # ±450 token
+    [passage] = compress_documents(docs, token_budget=300)
+
+    assert approx_tokens(passage.page_content) <= 300
+    assert PAGE.startswith(passage.page_content)
+    assert PAGE[len(passage.page_content)].isspace()  # dipotong di batas kata
+    assert passage.metadata["truncated"] is True
+
+
+def test_packing_skips_passages_that_do_not_fit():
+    docs = [chunk(0, 800, page=0), chunk(0, 2000, page=1), chunk(0, 200, page=2)]
+    result = compress_documents(docs, token_budget=300)
+
+    assert [doc.metadata["page"] for doc in result] == [0, 2]
+    assert total_tokens(result) <= 300
+    assert all("truncated" not in doc.metadata for doc in result)
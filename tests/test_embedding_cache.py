@@ -0,0 +1,40 @@
+import sqlite3
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from embedding_cache import CachedEmbeddings
+
+
+def make_cache(path, max_entries=10):
+    return CachedEmbeddings(DeterministicFakeEmbedding(size=4), "fake", db_path=str(path), max_entries=max_entries)
+
+
+def stored_rows(path):
+    with sqlite3.connect(str(path)) as conn:
+        return conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+def test_workers_sharing_one_file_respect_max_entries(tmp_path):
+    path = tmp_path / "embeddings.sqlite3"
+    # Dua instance = dua worker prefork yang menulis ke file yang sama
+    first, second = make_cache(path), make_cache(path)
+    first.embed_documents([f"a{i}" for i in range(8)])
+    second.embed_documents([f"b{i}" for i in range(8)])
+    first.embed_documents([f"c{i}" for i in range(3)])
+
+    assert stored_rows(path) <= 10
+    assert first.stats()["entries"] == second.stats()["entries"] == stored_rows(path)
+
+
+def test_counter_is_seeded_from_existing_cache_file(tmp_path):
+    path = tmp_path / "embeddings.sqlite3"
+    make_cache(path, max_entries=100).embed_documents([f"t{i}" for i in range(5)])
+    with sqlite3.connect(str(path)) as conn:  # file dari versi lama: tanpa tabel counter & trigger
+        conn.execute("DROP TABLE embedding_count")
+        conn.execute("DROP TRIGGER embeddings_count_insert")
+        conn.execute("DROP TRIGGER embeddings_count_delete")
+
+    cache = make_cache(path, max_entries=100)
+    assert cache.stats()["entries"] == 5
+    cache.embed_documents(["t0", "baru"])  # t0 sudah ada: tidak dihitung dua kali
+    assert cache.stats()["entries"] == 6 == stored_rows(path)
@@ -0,0 +1,85 @@
+import threading
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from flat_index import FlatVectorStore
+
+
+def make_store(path, dtype="float32"):
+    return FlatVectorStore(str(path), DeterministicFakeEmbedding(size=16), dtype=dtype)
+
+
+def test_add_search_delete_roundtrip(tmp_path):
+    store = make_store(tmp_path)
+    store.add_texts(["cuti tahunan", "lembur", "reimburse"], metadatas=[{"bab": 1}, {"bab": 2}, {"bab": 2}],
+                    ids=["a", "b", "c"])
+
+    assert store.similarity_search("lembur", k=1)[0].id == "b"
+    assert {doc.id for doc in store.similarity_search("lembur", k=3, filter={"bab": 2})} == {"b", "c"}
+    store.delete(["b"])
+    assert len(store) == 2
+    assert [doc.id for doc in store.get_by_ids(["a", "b", "c"])] == ["a", "c"]
+
+
+def test_generated_ids_do_not_collide_after_delete(tmp_path):
+    store = make_store(tmp_path)
+    first = store.add_texts(["satu", "dua", "tiga"])
+    store.delete([first[0]])
+    second = store.add_texts(["empat"])
+
+    assert len(store) == 3
+    assert len(set(first[1:] + second)) == 3
+    assert {doc.page_content for doc in store.get_by_ids(first + second)} == {"dua", "tiga", "empat"}
+
+
+def test_reader_sees_rebuilt_index_from_another_process(tmp_path):
+    reader, writer = make_store(tmp_path), make_store(tmp_path)
+    writer.add_texts(["lama"], ids=["x"])
+    assert reader.get_by_ids(["x"])[0].page_content == "lama"
+
+    writer.add_texts(["baru"], ids=["x"])
+    assert reader.get_by_ids(["x"])[0].page_content == "baru"
+
+
+def test_search_during_reload_never_mixes_versions(tmp_path):
+    # Tiap versi index punya jumlah baris berbeda; teks selalu = ID-nya, jadi pasangan campuran langsung ketahuan
+    store = make_store(tmp_path)
+    embeddings = DeterministicFakeEmbedding(size=16)
+    store.add_texts(["v0-0"], ids=["v0-0"])
+    errors, stop = [], threading.Event()
+
+    def search():
+        query = embeddings.embed_query("v")
+        while not stop.is_set():
+            try:
+                for doc in store.similarity_search_by_vector(query, k=50):
+                    assert doc.page_content == doc.id
+            except Exception as e:
+                errors.append(e)
+                return
+
+    threads = [threading.Thread(target=search) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for version in range(1, 40):
+        ids = [f"v{version}-{i}" for i in range(version % 7 + 1)]
+        store.delete([f"v{version - 1}-{i}" for i in range(7)])
+        store.add_texts(ids, ids=ids)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+
+
+def test_float16_scores_match_float32(tmp_path):
+    texts = [f"dokumen {i}" for i in range(20)]
+    full, half = make_store(tmp_path / "f32"), make_store(tmp_path / "f16", dtype="float16")
+    full.add_texts(texts, ids=texts)
+    half.add_texts(texts, ids=texts)
+
+    query = DeterministicFakeEmbedding(size=16).embed_query("dokumen 3")
+    scores32 = [score for _, score in full.similarity_search_by_vector_with_score(query, k=5)]
+    scores16 = [score for _, score in half.similarity_search_by_vector_with_score(query, k=5)]
+    assert np.allclose(scores32, scores16, atol=1e-2)
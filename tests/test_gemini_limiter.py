@@ -0,0 +1,271 @@
+import asyncio
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+import gemini_limiter
+from gemini_limiter import (
+    CircuitBreaker, CircuitOpenError, GeminiGuard, LimitedChatModel, LimitedEmbeddings, make_fake_server, priority,
+)
+
+
+def post(url):
+    request = urllib.request.Request(url, data=b"{}", headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.read()
+
+
+class HttpChatModel(BaseChatModel):
+    """Chat model palsu: tiap panggilan = 1 POST ke server palsu (HTTPError 429/503 diteruskan apa adanya)"""
+
+    url: str
+
+    @property
+    def _llm_type(self):
+        return "http-fake"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        post(self.url)
+        tools = ",".join(tool["name"] for tool in kwargs.get("tools", []))
+        message = AIMessage(content=f"ok {tools}".strip(),
+                            usage_metadata={"input_tokens": 5, "output_tokens": 2, "total_tokens": 7})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        post(self.url)
+        for token in ("Halo", " dunia"):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[{"name": tool.__name__} for tool in tools], **kwargs)
+
+
+class HttpEmbeddings(Embeddings):
+    def __init__(self, url):
+        self.url = url
+        self.dimension = 3
+
+    def embed_documents(self, texts):
+        post(self.url)
+        return [[1.0, 0.0, 0.0] for _ in texts]
+
+    def embed_query(self, text):
+        post(self.url)
+        return [0.0, 1.0, 0.0]
+
+
+@pytest.fixture
+def fake_server():
+    servers = []
+
+    def start(**kwargs):
+        server = make_fake_server(**kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server, f"http://127.0.0.1:{server.server_address[1]}/v1beta/models/fake:generateContent"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    # Retry-After dari server palsu bisa puluhan detik; cukup jeda singkat di test
+    monkeypatch.setattr(gemini_limiter, "GEMINI_BACKOFF_BASE", 0.001)
+    monkeypatch.setattr(gemini_limiter, "GEMINI_BACKOFF_MAX", 0.01)
+
+
+def make_guard(rpm=6000, **kwargs):
+    kwargs.setdefault("shared_path", "")
+    return GeminiGuard("test", rpm, rpm * 1000, **kwargs)
+
+
+def test_bind_tools_passes_tool_kwargs_to_inner_model(fake_server):
+    server, url = fake_server()
+
+    def cari_sop(query: str) -> str:
+        """Cari SOP"""
+        return query
+
+    model = LimitedChatModel(inner=HttpChatModel(url=url), guard=make_guard())
+    reply = model.bind_tools([cari_sop]).invoke("Apa SOP cuti?")
+
+    assert reply.content == "ok cari_sop"
+    assert server.counts[200] == 1
+
+
+def test_stream_retries_before_first_chunk(fake_server):
+    server, url = fake_server(fail_first=1)
+    guard = make_guard()
+    model = LimitedChatModel(inner=HttpChatModel(url=url), guard=guard)
+
+    assert "".join(chunk.content for chunk in model.stream("Halo")) == "Halo dunia"
+    assert server.counts[503] == 1 and server.counts[200] == 1
+    assert guard.counters["retries"] == 1
+
+
+def test_embeddings_retry_and_passthrough(fake_server):
+    server, url = fake_server(fail_first=2)
+    embeddings = LimitedEmbeddings(HttpEmbeddings(url), make_guard())
+
+    assert embeddings.embed_query("cuti") == [0.0, 1.0, 0.0]
+    assert embeddings.embed_documents(["a", "b"]) == [[1.0, 0.0, 0.0]] * 2
+    assert embeddings.dimension == 3
+    assert server.counts[503] == 2
+
+
+def test_interactive_calls_go_before_queued_batch_calls(fake_server):
+    _, url = fake_server()
+    guard = make_guard(rpm=600)  # 10 request/detik setelah bucket dikosongkan
+    guard.limiter.batch_reserve = 0.0
+    guard.limiter.requests.take(600)
+    model = LimitedChatModel(inner=HttpChatModel(url=url), guard=guard)
+    finished = []
+
+    def ask(name):
+        with priority(name):
+            model.invoke(name)
+        finished.append(name)
+
+    def wait_queue(size):
+        deadline = time.monotonic() + 5
+        while len(guard.limiter._queue) < size and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        for _ in range(3):
+            pool.submit(ask, "batch")
+        wait_queue(3)
+        for _ in range(3):
+            pool.submit(ask, "interactive")
+        wait_queue(6)
+
+    assert finished[:3] == ["interactive"] * 3
+    assert guard.limiter.acquired == {"batch": 3, "interactive": 3}
+
+
+def test_shared_bucket_splits_quota_between_guards(tmp_path, fake_server):
+    _, url = fake_server()
+    path = str(tmp_path / "limiter.db")
+    first, second = make_guard(rpm=2, shared_path=path), make_guard(rpm=2, shared_path=path)
+
+    LimitedEmbeddings(HttpEmbeddings(url), first).embed_documents(["a"])
+    LimitedEmbeddings(HttpEmbeddings(url), second).embed_documents(["b"])
+
+    # Kuota 2 request/menit sudah habis dipakai berdua; guard tanpa file bersama masih punya kuota sendiri
+    assert not first.limiter.try_acquire()
+    assert not second.limiter.try_acquire()
+    assert make_guard(rpm=2).limiter.try_acquire()
+
+
+def test_rate_limits_do_not_open_breaker(fake_server):
+    server, url = fake_server(rpm=1)  # request pertama lolos, sisanya 429 + Retry-After
+    guard = make_guard(max_retries=3)
+    guard.breaker = CircuitBreaker("test", threshold=2, cooldown=60)
+    embeddings = LimitedEmbeddings(HttpEmbeddings(url), guard)
+
+    embeddings.embed_query("a")
+    for _ in range(2):
+        with pytest.raises(urllib.error.HTTPError) as error:
+            embeddings.embed_query("a")
+        assert error.value.code == 429
+
+    assert guard.breaker.state == "closed"
+    assert server.counts[429] == 8
+    assert guard.counters["rate_limited"] == 8
+
+
+def test_server_errors_open_breaker_after_retries_finish(fake_server):
+    server, url = fake_server(error_rate=1.0)
+    guard = make_guard(max_retries=3)
+    guard.breaker = CircuitBreaker("test", threshold=2, cooldown=60)
+    embeddings = LimitedEmbeddings(HttpEmbeddings(url), guard)
+
+    # Breaker terbuka di percobaan ke-2, tapi retry panggilan ini tetap dijalankan sampai habis
+    with pytest.raises(urllib.error.HTTPError) as error:
+        embeddings.embed_query("a")
+    assert error.value.code == 503
+    assert server.counts[503] == 4
+    assert guard.breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError):
+        embeddings.embed_query("a")
+    assert server.counts[503] == 4
+
+
+def half_open_guard(fake_server):
+    """Guard yang breaker-nya baru saja terbuka oleh satu 503 dan cooldown-nya sudah habis (half-open)"""
+    _, url = fake_server(fail_first=1)
+    guard = make_guard(max_retries=0)
+    guard.breaker = CircuitBreaker("test", threshold=1, cooldown=0.01)
+    with pytest.raises(urllib.error.HTTPError):
+        guard.call(lambda: post(url))
+    time.sleep(0.02)
+    assert guard.breaker.state == "half_open"
+    return guard, url
+
+
+def test_interrupted_half_open_trial_releases_breaker(fake_server):
+    guard, url = half_open_guard(fake_server)
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        guard.call(interrupted)
+    assert guard.call(lambda: post(url))
+    assert guard.breaker.state == "closed"
+
+
+def test_cancelled_half_open_trial_releases_breaker(fake_server):
+    guard, url = half_open_guard(fake_server)
+
+    async def scenario():
+        task = asyncio.ensure_future(guard.acall(lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return await guard.acall(lambda: asyncio.to_thread(post, url))
+
+    assert asyncio.run(scenario())
+    assert guard.breaker.state == "closed"
+
+
+def test_closed_half_open_stream_releases_breaker(fake_server):
+    guard, url = half_open_guard(fake_server)
+
+    stream = guard.stream(lambda: iter(["Halo", " dunia"]))
+    assert next(stream) == "Halo"
+    stream.close()  # GeneratorExit, mis. stream_answer ditinggal pembaca
+    assert guard.call(lambda: post(url))
+    assert guard.breaker.state == "closed"
+
+
+def test_saturated_hedge_pool_does_not_hedge(fake_server):
+    _, url = fake_server(latency=0.05)
+    guard = make_guard(hedge_after=0.15, hedge_workers=2)
+    embeddings = LimitedEmbeddings(HttpEmbeddings(url), guard)
+
+    # 8 request bersamaan, pool 2 thread: request yang tidak kebagian slot jalan langsung, bukan mengantre
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert list(pool.map(embeddings.embed_query, ["q"] * 8)) == [[0.0, 1.0, 0.0]] * 8
+    assert guard.counters["hedges"] == 0
+
+
+def test_slow_call_is_hedged(fake_server):
+    _, url = fake_server(latency=0.3)
+    guard = make_guard(hedge_after=0.05, hedge_workers=4)
+
+    assert LimitedEmbeddings(HttpEmbeddings(url), guard).embed_query("q") == [0.0, 1.0, 0.0]
+    assert guard.counters["hedges"] == 1
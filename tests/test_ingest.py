@@ -0,0 +1,85 @@
+import importlib
+import os
+import sys
+import types
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+LEGACY_SOURCE = "./PDF Langchain Test.pdf"  # cara ingest versi lama menyimpan 'source'
+SOURCE = os.path.normpath(LEGACY_SOURCE)
+
+
+class FakeVectorStore:
+    """Collection Chroma di memori: get(where $in) / delete / add_documents"""
+
+    def __init__(self):
+        self.embeddings = DeterministicFakeEmbedding(size=4)
+        self.rows = {}  # id -> (teks, metadata)
+        self.embedded = 0
+
+    def get(self, where=None, include=()):
+        allowed = where["source"]["$in"]
+        return {"ids": [i for i, (_, metadata) in self.rows.items() if metadata.get("source") in allowed]}
+
+    def delete(self, ids):
+        for doc_id in ids:
+            self.rows.pop(doc_id, None)
+
+    def add_documents(self, documents, ids=None):
+        self.embedded += len(documents)
+        for doc_id, doc in zip(ids, documents):
+            self.rows[doc_id] = (doc.page_content, dict(doc.metadata))
+        return ids
+
+
+@pytest.fixture
+def ingest(monkeypatch):
+    """Import ingest dengan Chroma & PyPDFLoader palsu (tidak terpasang di lingkungan test)"""
+    monkeypatch.setitem(sys.modules, "langchain_chroma", types.SimpleNamespace(Chroma=object))
+    monkeypatch.setitem(sys.modules, "langchain_community", types.ModuleType("langchain_community"))
+    monkeypatch.setitem(sys.modules, "langchain_community.document_loaders", types.SimpleNamespace(PyPDFLoader=object))
+    monkeypatch.delitem(sys.modules, "ingest", raising=False)
+    yield importlib.import_module("ingest")
+    sys.modules.pop("ingest", None)
+
+
+def pages(source, texts):
+    return [Document(page_content=text, metadata={"source": source, "page": page}) for page, text in enumerate(texts)]
+
+
+def test_chunk_ids_are_stable_and_duplicates_stay_distinct(ingest):
+    first = ingest.assign_chunk_ids(pages(SOURCE, ["cuti", "cuti", "lembur"]))
+    second = ingest.assign_chunk_ids(pages(SOURCE, ["cuti", "cuti", "lembur"]))
+    same_page = ingest.assign_chunk_ids([Document(page_content="cuti", metadata={"source": SOURCE, "page": 0})] * 2)
+
+    assert first == second
+    assert len(set(same_page)) == 2
+    assert ingest.assign_chunk_ids(pages("lain.pdf", ["cuti"]))[0] != first[0]
+
+
+def test_source_aliases_cover_legacy_dot_slash_path(ingest):
+    assert ingest.source_aliases(SOURCE) == [SOURCE, f".{os.sep}{SOURCE}"]
+    # Path persis seperti diketik user ikut dicari, tanpa duplikat
+    typed = "dokumen/../PDF Langchain Test.pdf"
+    assert ingest.source_aliases(SOURCE, typed, typed) == [SOURCE, f".{os.sep}{SOURCE}", typed]
+    absolute = os.path.abspath(SOURCE)
+    assert ingest.source_aliases(absolute) == [absolute]
+
+
+def test_reingest_replaces_chunks_stored_under_legacy_path(ingest):
+    store = FakeVectorStore()
+    # Ingest versi lama: ID acak, 'source' masih dengan './'
+    for i, text in enumerate(["cuti lama", "lembur"]):
+        store.rows[f"acak-{i}"] = (text, {"source": LEGACY_SOURCE, "page": i})
+    store.rows["lain"] = ("dokumen lain", {"source": "lain.pdf", "page": 0})
+
+    new_count, stale_ids, records = ingest.sync_source(store, SOURCE, iter(pages(SOURCE, ["cuti baru", "lembur"])))
+    assert new_count == 2 and stale_ids == ["acak-0", "acak-1"]
+    assert set(store.rows) == set(records) | {"lain"}
+    assert {metadata["source"] for doc_id, (_, metadata) in store.rows.items() if doc_id != "lain"} == {SOURCE}
+
+    # Jalan kedua tanpa perubahan: tidak ada yang di-embed atau dihapus
+    assert ingest.sync_source(store, SOURCE, iter(pages(SOURCE, ["cuti baru", "lembur"])))[:2] == (0, [])
+    assert store.embedded == 2
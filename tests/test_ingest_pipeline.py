@@ -0,0 +1,126 @@
+import importlib
+import queue
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from ingest_pipeline import embed_and_store
+
+PAGE = " ".join(["Karyawan mengajukan cuti tahunan lewat portal HR paling lambat tujuh hari sebelumnya."] * 60)
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    calls: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return super().embed_documents(texts)
+
+
+class FakeVectorStore:
+    """Hanya API publik: embeddings + add_documents(ids=...) (tanpa _collection)"""
+
+    def __init__(self):
+        self.embeddings = CountingEmbeddings(size=4)
+        self.rows = {}
+        self._lock = threading.Lock()
+
+    def add_documents(self, documents, ids=None):
+        vectors = self.embeddings.embed_documents([doc.page_content for doc in documents])
+        with self._lock:
+            for doc_id, doc, vector in zip(ids, documents, vectors):
+                self.rows[doc_id] = (doc.page_content, vector)
+        return ids
+
+
+class FakePDFLoader:
+    pages = 5
+    fail_at = None
+
+    def __init__(self, source):
+        self.source = source
+
+    def lazy_load(self):
+        for page in range(self.pages):
+            if page == self.fail_at:
+                raise ValueError("halaman rusak")
+            yield Document(page_content=PAGE, metadata={"source": self.source, "page": page})
+
+
+@pytest.fixture
+def ingest_universal(monkeypatch):
+    """Import ingest_universal dengan Chroma & PyPDFLoader palsu (tidak terpasang di lingkungan test)"""
+    monkeypatch.setitem(sys.modules, "langchain_chroma", types.SimpleNamespace(Chroma=object))
+    monkeypatch.setitem(sys.modules, "langchain_community", types.ModuleType("langchain_community"))
+    monkeypatch.setitem(sys.modules, "langchain_community.document_loaders",
+                        types.SimpleNamespace(PyPDFLoader=FakePDFLoader))
+    for name in ("ingest", "ingest_universal"):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    module = importlib.import_module("ingest_universal")
+    monkeypatch.setattr(FakePDFLoader, "fail_at", None)
+    yield module
+    for name in ("ingest", "ingest_universal"):
+        sys.modules.pop(name, None)
+
+
+def start_parse(module, path, chunk_queue, previous_hash=None, batch_size=4):
+    pool = ThreadPoolExecutor(max_workers=1)  # di ingest_universal: ProcessPoolExecutor
+    future = pool.submit(module.parse_pdf, str(path), previous_hash, False, 64, 8, chunk_queue, batch_size)
+    pool.shutdown(wait=False)
+    return future
+
+
+def test_chunks_are_embedded_once_and_stored_through_add_documents():
+    store = FakeVectorStore()
+    chunks = [Document(page_content=f"chunk {i}", metadata={"chunk_id": f"c{i}"}) for i in range(10)]
+
+    stats = embed_and_store(iter(chunks), store, batch_size=3, max_concurrency=2)
+    assert stats["chunks"] == 10 and stats["batches"] == 4
+    assert sorted(store.rows) == sorted(f"c{i}" for i in range(10))
+    assert store.embeddings.calls == 10
+
+
+def test_parse_pdf_streams_fixed_size_batches_through_bounded_queue(ingest_universal, tmp_path):
+    path = tmp_path / "sop.pdf"
+    path.write_bytes(b"%PDF isi")
+    chunk_queue = queue.Queue(maxsize=1)
+    future = start_parse(ingest_universal, path, chunk_queue)
+
+    time.sleep(0.2)
+    assert not future.done() and chunk_queue.full()  # worker menunggu, bukan menumpuk semua chunk
+
+    sizes = []
+    while (batch := chunk_queue.get(timeout=5)) is not None:
+        sizes.append(len(batch))
+    assert len(sizes) > 2 and set(sizes[:-1]) == {4} and sizes[-1] <= 4
+    assert future.result()[1:] == (ingest_universal.file_hash(str(path)), True)
+
+
+def test_unchanged_pdf_sends_no_chunks(ingest_universal, tmp_path):
+    path = tmp_path / "sop.pdf"
+    path.write_bytes(b"%PDF isi")
+    chunk_queue = queue.Queue(maxsize=1)
+    future = start_parse(ingest_universal, path, chunk_queue, previous_hash=ingest_universal.file_hash(str(path)))
+
+    assert list(ingest_universal.queued_chunks(chunk_queue, future)) == []
+    assert future.result()[2] is False
+
+
+def test_parse_error_mid_file_is_raised_to_the_writer(ingest_universal, tmp_path):
+    FakePDFLoader.fail_at = 3
+    path = tmp_path / "sop.pdf"
+    path.write_bytes(b"%PDF isi")
+    chunk_queue = queue.Queue(maxsize=1)
+    chunks = ingest_universal.queued_chunks(chunk_queue, start_parse(ingest_universal, path, chunk_queue))
+
+    received = []
+    with pytest.raises(ingest_universal.ParseError, match="halaman rusak"):
+        for doc in chunks:
+            received.append(doc)
+    assert received and {doc.metadata["page"] for doc in received} <= {0, 1, 2}
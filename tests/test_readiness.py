@@ -0,0 +1,87 @@
+import json
+import threading
+import time
+
+import pytest
+
+import bot_server
+import rag_engine
+from tenant_router import TenantRouter
+
+
+class FakeEngine:
+    """Engine palsu: preload() membangun 'chain' setelah gate dibuka"""
+
+    def __init__(self, collections, gate=None):
+        self.collections = list(collections)
+        self.ready = False
+        self.gate = gate
+        self.preloads = 0
+
+    def preload(self):
+        self.preloads += 1
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.ready = True
+        return self
+
+
+def wait_ready(timeout=5):
+    deadline = time.monotonic() + timeout
+    while bot_server.ready_status()[0] != 200 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return bot_server.ready_status()
+
+
+@pytest.fixture
+def routing(tmp_path, monkeypatch):
+    """tenants.json di tmp_path + get_engine palsu; return (engine default, dict engine tenant)"""
+    created = {}
+
+    def get_engine(name, collections=None, **kwargs):
+        return created.setdefault(name, FakeEngine(collections))
+
+    def configure(config, default_gate=None):
+        path = tmp_path / "tenants.json"
+        path.write_text(json.dumps(config), encoding="utf-8")
+        default = FakeEngine(["knowledge_base_perusahaan"], gate=default_gate)
+        monkeypatch.setattr(rag_engine, "get_engine", get_engine)
+        monkeypatch.setattr(bot_server, "tenants", TenantRouter(str(path)))
+        monkeypatch.setattr(bot_server, "engine", default)
+        return default, created
+
+    return configure
+
+
+def test_no_database_is_not_ready(monkeypatch):
+    monkeypatch.setattr(bot_server, "engine", None)
+    assert bot_server.ready_status()[0] == 503
+
+
+def test_default_engine_is_built_at_boot_without_a_question(routing):
+    gate = threading.Event()
+    default, _ = routing({}, default_gate=gate)
+
+    bot_server.preload_in_background()
+    status, payload = bot_server.ready_status()
+    assert status == 503 and payload["status"] == "loading"
+
+    gate.set()
+    assert wait_ready()[0] == 200
+    assert default.preloads == 1
+
+
+def test_readiness_waits_for_every_tenant_engine(routing):
+    default, created = routing({
+        "default": ["knowledge_base_perusahaan"],
+        "routes": {"gchat:spaces/HR": ["hr", "umum"], "gchat:spaces/FIN": ["keuangan"], "telegram:1": ["user_1"]},
+    })
+    default.ready = True
+
+    status, payload = bot_server.ready_status()
+    assert status == 503
+    assert sorted(payload["pending"]) == ["hr,umum", "keuangan"]
+
+    assert wait_ready()[0] == 200
+    # Route telegram bukan urusan bot Google Chat
+    assert sorted(created) == ["gchat:hr,umum", "gchat:keuangan"]
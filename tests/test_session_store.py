@@ -0,0 +1,26 @@
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from session_store import SessionStore
+
+
+def test_idle_sessions_are_swept_without_get(tmp_path):
+    store = SessionStore(path=str(tmp_path / "sessions.sqlite3"), idle_ttl=0.05, sweep_interval=0.02)
+    store.get("a").add_messages([HumanMessage(content="halo"), AIMessage(content="hai")])
+
+    deadline = time.monotonic() + 5
+    while len(store) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(store) == 0 and store.stats()["stored"] == 1
+    store.close()
+    assert [m.content for m in store.get("a").recent] == ["halo", "hai"]
+
+
+def test_save_sweeps_idle_sessions(tmp_path):
+    store = SessionStore(path=str(tmp_path / "sessions.sqlite3"), idle_ttl=0.05, sweep_interval=0)
+    store.get("lama").add_messages([HumanMessage(content="halo")])
+    time.sleep(0.1)
+
+    store.save("lama")  # beban tulis saja: tidak ada get() lagi
+    assert len(store) == 0 and store.stats() == {"in_memory": 0, "stored": 1, "spilled": 1, "rehydrated": 0}
@@ -0,0 +1,146 @@
+import json
+import os
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from embedding_cache import signature_path
+from snapshot import export_snapshot, load_snapshot, restore_or_build, restore_snapshot, snapshot_path_for
+from token_chunker import EstimateTokenCounter, TokenChunker
+
+
+class FakeCollection:
+    """Pengganti collection Chroma di memori (hanya API yang dipakai snapshot.py)"""
+
+    def __init__(self):
+        self.rows = {}
+
+    def count(self):
+        return len(self.rows)
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        for doc_id, vector, text, metadata in zip(ids, embeddings, documents, metadatas):
+            self.rows[doc_id] = (list(map(float, vector)), text, metadata or {})
+
+    def get(self, limit=None, offset=0, include=()):
+        ids = sorted(self.rows)[offset:None if limit is None else offset + limit]
+        return {
+            "ids": ids,
+            "embeddings": [self.rows[i][0] for i in ids],
+            "documents": [self.rows[i][1] for i in ids],
+            "metadatas": [self.rows[i][2] for i in ids],
+        }
+
+
+class FakeChroma:
+    collections = {}
+
+    def __init__(self, collection_name, embedding_function=None, persist_directory=None):
+        self.key = (persist_directory, collection_name)
+        self._collection = self.collections.setdefault(self.key, FakeCollection())
+
+    def get(self, include=()):
+        return self._collection.get(include=include)
+
+    def delete_collection(self):
+        self.collections.pop(self.key, None)
+
+
+@pytest.fixture(autouse=True)
+def fake_chroma(monkeypatch):
+    FakeChroma.collections = {}
+    monkeypatch.setitem(sys.modules, "langchain_chroma", types.SimpleNamespace(Chroma=FakeChroma))
+
+
+def filled_store(persist_directory, name, rows):
+    store = FakeChroma(name, persist_directory=persist_directory)
+    ids = [f"id-{i}" for i in range(rows)]
+    store._collection.upsert(ids, np.eye(rows, 4), [f"teks {i}" for i in range(rows)], [{"page": i} for i in range(rows)])
+    return store
+
+
+def test_roundtrip_keeps_ids_texts_metadata_and_vectors(tmp_path):
+    store = filled_store(None, "kb", 3)
+    path = str(tmp_path / "kb.ragsnap")
+    header = export_snapshot(store, path, "kb", model_id="local:mini")
+
+    loaded = load_snapshot(path)
+    assert header["count"] == 3 and loaded["header"]["embedding_model"] == "local:mini"
+    assert loaded["ids"] == ["id-0", "id-1", "id-2"]
+    assert loaded["metadatas"][2] == {"page": 2}
+    assert np.array_equal(loaded["vectors"], np.eye(3, 4, dtype=np.float32))
+
+
+def test_corrupted_snapshot_is_rejected(tmp_path):
+    path = str(tmp_path / "kb.ragsnap")
+    export_snapshot(filled_store(None, "kb", 2), path, "kb", model_id="local:mini")
+    with open(path, "r+b") as f:
+        f.seek(-1, 2)
+        last = f.read(1)
+        f.seek(-1, 2)
+        f.write(bytes([last[0] ^ 0xFF]))
+
+    with pytest.raises(ValueError, match="Checksum"):
+        load_snapshot(path)
+
+
+def test_export_records_model_from_collection_signature(tmp_path):
+    persist = str(tmp_path / "chroma_db")
+    store = filled_store(persist, "kb", 2)
+    os.makedirs(persist, exist_ok=True)
+    with open(signature_path(persist, "kb"), "w", encoding="utf-8") as f:
+        json.dump({"model": "local:all-MiniLM-L6-v2", "dimension": 4}, f)
+
+    header = export_snapshot(store, str(tmp_path / "kb.ragsnap"), "kb", persist_directory=persist)
+    assert header["embedding_model"] == "local:all-MiniLM-L6-v2"
+
+
+def test_restore_replaces_existing_collection_contents(tmp_path):
+    persist = str(tmp_path / "chroma_db")
+    path = str(tmp_path / "kb.ragsnap")
+    export_snapshot(filled_store(None, "kb", 2), path, "kb", model_id="local:mini")
+    filled_store(persist, "kb", 5)  # isi lama: id-0 .. id-4
+
+    store = restore_snapshot(path, None, persist_directory=persist, model_id="local:mini")
+    assert sorted(store._collection.rows) == ["id-0", "id-1"]
+    with open(signature_path(persist, "kb"), encoding="utf-8") as f:
+        assert json.load(f)["model"] == "local:mini"
+
+
+def test_restore_rejects_other_embedding_model(tmp_path):
+    path = str(tmp_path / "kb.ragsnap")
+    export_snapshot(filled_store(None, "kb", 2), path, "kb", model_id="local:mini")
+    with pytest.raises(ValueError, match="local:mini"):
+        restore_snapshot(path, None, model_id="gemini:gemini-embedding-001")
+
+
+def test_restore_or_build_rebuilds_on_model_mismatch(tmp_path):
+    path = str(tmp_path / "demo.ragsnap")
+    export_snapshot(filled_store(None, "old", 2), path, "demo", model_id="local:mini")
+    built = []
+
+    def build(store):
+        built.append(True)
+        store._collection.upsert(["baru"], [[1.0, 0.0]], ["teks baru"], [{}])
+
+    store = restore_or_build(path, None, "demo", build, model_id="gemini:gemini-embedding-001")
+    assert built and list(store._collection.rows) == ["baru"]
+    assert load_snapshot(path)["header"]["embedding_model"] == "gemini:gemini-embedding-001"
+
+
+def test_snapshot_key_follows_source_chunker_and_model(tmp_path):
+    source = tmp_path / "sop.pdf"
+    source.write_bytes(b"%PDF isi")
+
+    def key(max_tokens=256, model_id="local:mini"):
+        splitter = TokenChunker(max_tokens=max_tokens, overlap_tokens=32, counter=EstimateTokenCounter())
+        return snapshot_path_for(str(source), "demo", directory=str(tmp_path), splitter=splitter, model_id=model_id)
+
+    base = key()
+    assert key() == base
+    assert key(max_tokens=128) != base
+    assert key(model_id="gemini:gemini-embedding-001") != base
+    source.write_bytes(b"%PDF isi baru")
+    assert key() != base
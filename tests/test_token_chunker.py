@@ -0,0 +1,67 @@
+from langchain_core.documents import Document
+
+from token_chunker import TokenChunker, EstimateTokenCounter
+
+PARAGRAPH = " ".join(["Kebijakan ini adalah panduan kerja bagi seluruh karyawan perusahaan."] * 40)
+# Tanpa akhir kalimat: _split_long memotong di batas jendela token, bukan di titik
+RUN_ON = PARAGRAPH.replace(".", "")
+
+
+def make_chunker(max_tokens=64, overlap_tokens=16, min_tokens=16):
+    return TokenChunker(max_tokens=max_tokens, overlap_tokens=overlap_tokens, min_tokens=min_tokens,
+                        counter=EstimateTokenCounter())
+
+
+def test_heading_stays_with_oversize_paragraph():
+    text = "BAB I PENDAHULUAN\n" + RUN_ON
+    chunks, section = make_chunker().split_text_with_offsets(text)
+
+    first_start, first_end, tokens, chunk_section = chunks[0]
+    assert first_start == 0
+    assert text[first_start:first_end].startswith("BAB I PENDAHULUAN\nKebijakan")
+    assert tokens <= 64
+    assert chunk_section == section == "BAB I PENDAHULUAN"
+
+
+def test_table_rows_are_never_cut():
+    rows = [f"| {i} | Cuti tahunan | 12 hari | Karyawan tetap |" for i in range(30)]
+    text = "Tabel hak cuti karyawan:\n" + "\n".join(rows)
+    pieces = make_chunker().split_text(text)
+
+    for row in rows:
+        assert any(row in piece for piece in pieces)
+    for piece in pieces:
+        for line in piece.splitlines():
+            if line.startswith("|"):
+                assert line in rows
+
+
+def test_empty_page_gives_no_chunks():
+    chunker = make_chunker()
+    docs = [Document(page_content="", metadata={"source": "a.pdf", "page": 0}),
+            Document(page_content="  \n\n \t\n", metadata={"source": "a.pdf", "page": 1})]
+
+    assert chunker.split_documents(docs) == []
+    assert chunker.split_text("") == []
+
+
+def test_overlap_never_exceeds_max_tokens():
+    counter = EstimateTokenCounter()
+    chunker = make_chunker(max_tokens=48, overlap_tokens=40)
+    text = "1. Ketentuan Umum\n" + PARAGRAPH + "\n\n2. Ketentuan Khusus\n" + PARAGRAPH
+
+    chunks, _ = chunker.split_text_with_offsets(text)
+
+    assert len(chunks) > 2
+    for start, end, tokens, _ in chunks:
+        assert tokens <= 48
+        assert len(counter.spans([text[start:end]])[0]) <= 48
+
+
+def test_overlap_starts_on_word_boundary():
+    text = RUN_ON
+    chunks, _ = make_chunker().split_text_with_offsets(text)
+
+    assert len(chunks) > 1
+    for start, _, _, _ in chunks:
+        assert start == 0 or text[start - 1].isspace()
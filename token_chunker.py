@@ -0,0 +1,333 @@
+import os
+import re
+import bisect
+import threading
+from functools import lru_cache
+
+from langchain_core.documents import Document
+
+# --- CHUNKER BERBASIS TOKEN & LAYOUT (PENGGANTI RecursiveCharacterTextSplitter) ---
+# - Panjang chunk diukur dalam TOKEN tokenizer model embedding, bukan karakter
+# - Batas halaman (satu Document PyPDFLoader = satu halaman) tidak pernah dilewati
+# - Heading (BAB / Pasal / "1.2 Judul" / HURUF BESAR) memulai chunk baru, baris tabel tidak dipotong
+# - Satu pass per halaman: teks dipecah jadi unit (heading / paragraf / baris tabel),
+#   semua unit di-tokenize sekali (batch), lalu di-packing rakus ke batas token
+# - page_content = potongan persis teks halaman (start_index valid untuk merge konteks)
+# Distribusi ukuran chunk dicatat di ChunkStats (dicetak di akhir ingest).
+
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+# Heading hanya memutus chunk jika chunk berjalan sudah cukup besar (hindari chunk kecil-kecil)
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "64"))
+# Nama tokenizer HuggingFace; kosong = otomatis sesuai EMBEDDING_BACKEND
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "")
+
+# Estimasi untuk Gemini (tokenizer-nya tidak tersedia offline): 1 token per <=4 huruf tiap kata
+ESTIMATE_CHARS_PER_TOKEN = 4
+HEADING_MAX_CHARS = 80
+
+_WORD = re.compile(r"\w+|[^\w\s]")
+_HEADING = re.compile(
+    r"^(#{1,6}\s+\S"                              # markdown
+    r"|(BAB|Bab)\s+[IVXLC\d]+\b"                  # BAB II
+    r"|(Pasal|Bagian|Lampiran)\s+\w+"             # Pasal 3
+    r"|\d+(\.\d+)*\.?\s+[A-Z]"                    # 1. / 2.3 Judul
+    r"|[A-Z]\.\s+[A-Z])"                          # A. Judul
+)
+_TABLE_GAP = re.compile(r"\S(\t| {2,})\S")
+_SENTENCE_END = re.compile(r"[.!?;:](\s|$)|\n")
+_SPACE = re.compile(r"\s")
+
+
+# --- PENGHITUNG TOKEN ---
+class HFTokenCounter:
+    """Tokenizer HuggingFace (library `tokenizers`, Rust) -> posisi akhir tiap token"""
+
+    def __init__(self, name):
+        from tokenizers import Tokenizer
+
+        self.name = name
+        self.tokenizer = Tokenizer.from_pretrained(name)
+        # Hitung seluruh teks: truncation/padding bawaan model tidak berlaku di sini
+        self.tokenizer.no_truncation()
+        self.tokenizer.no_padding()
+
+    def spans(self, texts):
+        encodings = self.tokenizer.encode_batch(list(texts), add_special_tokens=False)
+        return [[end for _, end in encoding.offsets] for encoding in encodings]
+
+
+class EstimateTokenCounter:
+    """Estimasi tanpa tokenizer: tiap kata = ceil(panjang / 4) token, tanda baca = 1 token"""
+
+    name = "estimate"
+
+    def spans(self, texts):
+        result = []
+        for text in texts:
+            ends = []
+            for match in _WORD.finditer(text):
+                start, end = match.span()
+                ends.extend(range(start + ESTIMATE_CHARS_PER_TOKEN, end, ESTIMATE_CHARS_PER_TOKEN))
+                ends.append(end)
+            result.append(ends)
+        return result
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(name=CHUNK_TOKENIZER):
+    """Satu counter per proses (worker ingest_universal juga memanggil ini sekali saja)"""
+    if not name:
+        from embedding_cache import EMBEDDING_BACKEND
+        if EMBEDDING_BACKEND == "local":
+            from local_embeddings import LOCAL_EMBEDDING_MODEL
+            name = LOCAL_EMBEDDING_MODEL
+        else:
+            name = "estimate"
+    if name == "estimate":
+        return EstimateTokenCounter()
+    return HFTokenCounter(name)
+
+
+# --- DISTRIBUSI UKURAN CHUNK ---
+class ChunkStats:
+    def __init__(self, max_tokens=CHUNK_MAX_TOKENS):
+        self.max_tokens = max_tokens
+        self.sizes = []
+        self._lock = threading.Lock()
+
+    def add(self, tokens):
+        with self._lock:
+            self.sizes.append(tokens)
+
+    def add_documents(self, docs):
+        for doc in docs:
+            if "tokens" in doc.metadata:
+                self.add(doc.metadata["tokens"])
+
+    def summary(self):
+        sizes = sorted(self.sizes)
+        if not sizes:
+            return {"chunks": 0}
+
+        def pct(p):
+            return sizes[min(len(sizes) - 1, int(p / 100 * len(sizes)))]
+
+        # Histogram per seperempat batas token (kuartal terakhir termasuk chunk > batas)
+        quarter = max(1, self.max_tokens // 4)
+        histogram = [0, 0, 0, 0]
+        for size in sizes:
+            histogram[min(3, (size - 1) // quarter)] += 1
+        return {
+            "chunks": len(sizes),
+            "tokens_total": sum(sizes),
+            "mean": round(sum(sizes) / len(sizes), 1),
+            "min": sizes[0],
+            "p50": pct(50),
+            "p90": pct(90),
+            "p99": pct(99),
+            "max": sizes[-1],
+            "over_limit": sum(1 for size in sizes if size > self.max_tokens),
+            "histogram": {f"<={quarter * (i + 1)}" if i < 3 else f">{quarter * 3}": n
+                          for i, n in enumerate(histogram)},
+        }
+
+    def format(self):
+        s = self.summary()
+        if not s["chunks"]:
+            return "📏 Tidak ada chunk baru"
+        bars = " | ".join(f"{label}: {n}" for label, n in s["histogram"].items())
+        return (f"📏 {s['chunks']} chunk, {s['tokens_total']} token | min/p50/p90/max = "
+                f"{s['min']}/{s['p50']}/{s['p90']}/{s['max']} (rata-rata {s['mean']}) | {bars}")
+
+
+# --- ANALISIS LAYOUT HALAMAN ---
+def _line_kind(line):
+    stripped = line.strip()
+    if not stripped:
+        return "blank"
+    if stripped.count("|") >= 2 or len(_TABLE_GAP.findall(stripped)) >= 2:
+        return "table"
+    if len(stripped) <= HEADING_MAX_CHARS and stripped[-1] not in ".,;" and (
+        _HEADING.match(stripped) or (stripped.isupper() and sum(c.isalpha() for c in stripped) >= 3)
+    ):
+        return "heading"
+    return "text"
+
+
+def layout_units(text):
+    """
+    Pecah teks halaman jadi unit (start, end, jenis) dalam satu pass.
+    Paragraf = baris teks berurutan sampai baris kosong / heading / tabel. Baris tabel = unit sendiri.
+    """
+    units = []
+    paragraph = None  # [start, end]
+    position = 0
+    for line in text.splitlines(keepends=True):
+        line_start, position = position, position + len(line)
+        kind = _line_kind(line)
+        if kind == "text":
+            start = line_start + (len(line) - len(line.lstrip()))
+            end = line_start + len(line.rstrip())
+            if paragraph is None:
+                paragraph = [start, end]
+            else:
+                paragraph[1] = end
+            continue
+
+        if paragraph is not None:
+            units.append((paragraph[0], paragraph[1], "text"))
+            paragraph = None
+        if kind != "blank":
+            start = line_start + (len(line) - len(line.lstrip()))
+            units.append((start, line_start + len(line.rstrip()), kind))
+    if paragraph is not None:
+        units.append((paragraph[0], paragraph[1], "text"))
+    return units
+
+
+class TokenChunker:
+    """
+    Pengganti RecursiveCharacterTextSplitter dengan API yang sama untuk pipeline ingest:
+    split_documents(halaman) -> list Document (metadata: start_index, tokens, section).
+    """
+
+    def __init__(self, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS,
+                 min_tokens=CHUNK_MIN_TOKENS, counter=None, stats=None):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens harus lebih kecil dari max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_tokens = min_tokens
+        self.counter = counter or get_token_counter()
+        self.stats = stats if stats is not None else ChunkStats(max_tokens)
+        # Heading terakhir per sumber: halaman berikutnya biasanya masih bagian yang sama
+        self._section = (None, None)
+
+    # --- UNIT TERLALU BESAR ---
+    def _split_long(self, text, start, ends, first_budget=None):
+        """
+        Potong unit > max_tokens per jendela token, mundur ke akhir kalimat / spasi terdekat.
+        first_budget: jatah token potongan pertama (lebih kecil jika heading di depannya ikut satu chunk).
+        """
+        def word_boundary(position):
+            return position <= start or text[position - 1].isspace() or text[position].isspace()
+
+        pieces = []
+        first = 0
+        while first < len(ends):
+            budget = first_budget if first == 0 and first_budget else self.max_tokens
+            last = min(first + budget, len(ends))
+            piece_start = start if first == 0 else start + ends[first - 1]
+            cut = start + ends[last - 1]
+            if last < len(ends):
+                # Cari batas kalimat di seperempat akhir jendela, kalau tidak ada pakai spasi terakhir
+                window_start = piece_start + (cut - piece_start) * 3 // 4
+                window = text[window_start:cut]
+                boundaries = [m.end() for m in _SENTENCE_END.finditer(window)]
+                if not boundaries:
+                    boundaries = [m.start() for m in _SPACE.finditer(window)]
+                if boundaries:
+                    cut = window_start + boundaries[-1]
+                    last = max(first + 1, bisect.bisect_right(ends, cut - start))
+                    cut = start + ends[last - 1]
+            pieces.append((piece_start, cut, last - first))
+            if last >= len(ends):
+                break
+            # Overlap dimulai di awal kata (bukan di tengah kata); tanpa batas kata = tanpa overlap
+            first = max(first + 1, last - self.overlap_tokens)
+            while first < last and not word_boundary(start + ends[first - 1]):
+                first += 1
+        # Rapikan spasi di tepi potongan
+        result = []
+        for piece_start, piece_end, tokens in pieces:
+            while piece_start < piece_end and text[piece_start].isspace():
+                piece_start += 1
+            while piece_end > piece_start and text[piece_end - 1].isspace():
+                piece_end -= 1
+            if piece_end > piece_start:
+                result.append((piece_start, piece_end, "text", tokens))
+        return result
+
+    # --- PACKING ---
+    def split_text_with_offsets(self, text, section=None):
+        """
+        Return (chunks, section_terakhir) untuk satu halaman.
+        chunks = list (start, end, tokens, section); `section` = heading yang masih berlaku dari halaman sebelumnya.
+        """
+        raw = layout_units(text)
+        spans = self.counter.spans(text[start:end] for start, end, _ in raw)
+        units = []
+        # Token heading tepat di depan unit ini: disisakan supaya heading + awal isinya muat satu chunk
+        heading_tokens = 0
+        for (start, end, kind), ends in zip(raw, spans):
+            if not ends:
+                continue
+            reserve = heading_tokens if heading_tokens <= self.max_tokens // 2 else 0
+            if kind != "heading" and len(ends) > self.max_tokens - reserve:
+                units.extend(self._split_long(text, start, ends, first_budget=self.max_tokens - reserve))
+            elif len(ends) > self.max_tokens:
+                units.extend(self._split_long(text, start, ends))
+            else:
+                units.append((start, end, kind, len(ends)))
+            heading_tokens = heading_tokens + len(ends) if kind == "heading" else 0
+
+        chunks = []
+        current, tokens = [], 0
+        chunk_section = section
+
+        def flush(carry_overlap, final=False):
+            nonlocal current, tokens, chunk_section
+            # Heading di ujung chunk ikut pindah ke chunk berikutnya (heading menempel ke isinya)
+            body_end = len(current)
+            while not final and body_end and current[body_end - 1][2] == "heading":
+                body_end -= 1
+            body, trailing = current[:body_end], current[body_end:]
+            if body:
+                body_tokens = sum(unit[3] for unit in body)
+                chunks.append((body[0][0], body[-1][1], body_tokens, chunk_section))
+            carried = trailing
+            if carry_overlap and not trailing:
+                for unit in reversed(body):
+                    if unit[2] == "heading" or sum(u[3] for u in carried) + unit[3] > self.overlap_tokens:
+                        break
+                    carried = [unit] + carried
+            current, tokens = carried, sum(unit[3] for unit in carried)
+            chunk_section = section
+
+        for unit in units:
+            kind, count = unit[2], unit[3]
+            if kind == "heading":
+                if tokens >= self.min_tokens:
+                    flush(carry_overlap=False)
+                section = text[unit[0]:unit[1]]
+                if not current:
+                    chunk_section = section
+            elif tokens + count > self.max_tokens:
+                flush(carry_overlap=True)
+                # Overlap yang terbawa tidak boleh membuat chunk baru melewati batas
+                while current and tokens + count > self.max_tokens:
+                    tokens -= current.pop(0)[3]
+            current.append(unit)
+            tokens += count
+        flush(carry_overlap=False, final=True)
+        return chunks, section
+
+    def split_text(self, text):
+        chunks, _ = self.split_text_with_offsets(text)
+        return [text[start:end] for start, end, _, _ in chunks]
+
+    def split_documents(self, documents):
+        result = []
+        for doc in documents:
+            source = doc.metadata.get("source")
+            carried = self._section[1] if self._section[0] == source else None
+            chunks, last_section = self.split_text_with_offsets(doc.page_content, carried)
+            for start, end, tokens, section in chunks:
+                metadata = {**doc.metadata, "start_index": start, "tokens": tokens}
+                if section:
+                    metadata["section"] = section[:200]  # Chroma tidak menerima nilai None
+                result.append(Document(page_content=doc.page_content[start:end], metadata=metadata))
+                self.stats.add(tokens)
+            self._section = (source, last_section)
+        return result
@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import ToolMessage
+
+# --- EKSEKUTOR TOOL UNTUK LOOP TOOL-CALLING (bind_tools) ---
+# Satu giliran model bisa meminta beberapa tool sekaligus (ai_msg.tool_calls). Di sini:
+# - tool call yang independen dijalankan BERSAMAAN: tool async lewat asyncio, tool sync lewat thread pool
+# - tiap tool punya timeout sendiri; timeout / error dikembalikan ke model sebagai ToolMessage status="error"
+# - hasil di-memoize per (nama tool, argumen) dengan TTL; panggilan identik di satu giliran dijalankan sekali
+# Hasilnya: waktu per giliran = tool paling lambat, bukan jumlah semua tool.
+
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "30"))
+TOOL_CACHE_TTL = float(os.getenv("TOOL_CACHE_TTL", "300"))
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1000"))
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", "8"))
+TOOL_MAX_ROUNDS = int(os.getenv("TOOL_MAX_ROUNDS", "5"))
+
+
+def _cache_key(name, args):
+    return name, json.dumps(args, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class ToolResultCache:
+    """Cache hasil tool di memori: key (tool, argumen), TTL per tool, LRU"""
+
+    def __init__(self, ttl_seconds=TOOL_CACHE_TTL, max_entries=TOOL_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (hasil, kedaluwarsa)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, content, ttl_seconds=None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (content, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class ToolExecutor:
+    """
+    Jalankan tool_calls satu giliran model secara paralel, lalu return ToolMessage (urutan sama dengan input).
+    timeouts / cache_ttl: override per nama tool, mis. {"cari_dokumen": 10} / {"jam_sekarang": 0} (0 = tanpa cache).
+    """
+
+    def __init__(self, tools, timeouts=None, cache_ttl=None, default_timeout=TOOL_TIMEOUT,
+                 cache=None, max_workers=TOOL_MAX_WORKERS):
+        self.tools = {tool.name: tool for tool in tools}
+        self.timeouts = timeouts or {}
+        self.cache_ttl = cache_ttl or {}
+        self.default_timeout = default_timeout
+        self.cache = cache if cache is not None else ToolResultCache()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        self.timeouts_hit = 0
+        self.last_turn = {}
+
+    # --- UTILITAS ---
+    def _timeout(self, name):
+        return self.timeouts.get(name, self.default_timeout)
+
+    def _ttl(self, name):
+        return self.cache_ttl.get(name)
+
+    @staticmethod
+    def _is_async_only(tool):
+        return getattr(tool, "coroutine", None) is not None and getattr(tool, "func", None) is None
+
+    def _run_sync(self, tool, args):
+        if self._is_async_only(tool):
+            # Dipanggil dari thread pool, jadi aman membuat event loop sendiri
+            return asyncio.run(tool.ainvoke(args))
+        return tool.invoke(args)
+
+    def _plan(self, tool_calls):
+        """
+        Kelompokkan tool call per (tool, argumen). Return (jobs, results):
+        jobs = {key: (tool_call pertama)} yang perlu dijalankan, results = {key: (konten, status)} dari cache.
+        """
+        jobs, results = {}, {}
+        for call in tool_calls:
+            key = _cache_key(call["name"], call.get("args", {}))
+            if key in jobs or key in results:
+                continue
+            if call["name"] not in self.tools:
+                results[key] = (f"Error: tool '{call['name']}' tidak dikenal", "error")
+                continue
+            cached = self.cache.get(key)
+            if cached is not None:
+                results[key] = (cached[0], "success")
+            else:
+                jobs[key] = call
+        return jobs, results
+
+    def _store(self, key, name, outcome):
+        if outcome[1] == "success":
+            self.cache.put(key, outcome[0], self._ttl(name))
+
+    def _messages(self, tool_calls, results, started, executed, durations):
+        turn_seconds = time.perf_counter() - started
+        self.last_turn = {
+            "calls": len(tool_calls),
+            "executed": executed,
+            "seconds": round(turn_seconds, 3),
+            # Kalau dijalankan berurutan, waktunya kira-kira jumlah durasi tool (yang sudah selesai)
+            "sequential_seconds": round(sum(durations), 3),
+        }
+        messages = []
+        for call in tool_calls:
+            content, status = results[_cache_key(call["name"], call.get("args", {}))]
+            messages.append(ToolMessage(content=content, tool_call_id=call["id"], name=call["name"], status=status))
+        return messages
+
+    @staticmethod
+    def _content(result):
+        return result if isinstance(result, str) else json.dumps(result, ensure_ascii=False, default=str)
+
+    # --- SYNC (THREAD POOL) ---
+    def run(self, tool_calls):
+        started = time.perf_counter()
+        jobs, results = self._plan(tool_calls)
+
+        def timed(tool, args):
+            begin = time.perf_counter()
+            try:
+                return self._run_sync(tool, args)
+            finally:
+                durations.append(time.perf_counter() - begin)
+
+        durations = []
+        futures = {
+            key: self.pool.submit(timed, self.tools[call["name"]], call.get("args", {}))
+            for key, call in jobs.items()
+        }
+        for key, future in futures.items():
+            name = jobs[key]["name"]
+            # Deadline dihitung dari awal giliran: semua tool berjalan bersamaan
+            remaining = max(0.0, started + self._timeout(name) - time.perf_counter())
+            try:
+                outcome = (self._content(future.result(timeout=remaining)), "success")
+            except TimeoutError:
+                # Thread tidak bisa dihentikan paksa; hasilnya diabaikan saat selesai nanti
+                self.timeouts_hit += 1
+                outcome = (f"Error: tool '{name}' tidak selesai dalam {self._timeout(name):g} detik", "error")
+            except Exception as e:
+                outcome = (f"Error: {e}", "error")
+            results[key] = outcome
+            self._store(key, name, outcome)
+        return self._messages(tool_calls, results, started, len(jobs), durations)
+
+    # --- ASYNC ---
+    async def _arun_one(self, tool, args, durations):
+        begin = time.perf_counter()
+        try:
+            if getattr(tool, "coroutine", None) is not None:
+                work = tool.ainvoke(args)
+            else:
+                loop = asyncio.get_running_loop()
+                work = loop.run_in_executor(self.pool, tool.invoke, args)
+            return await asyncio.wait_for(work, timeout=self._timeout(tool.name))
+        finally:
+            durations.append(time.perf_counter() - begin)
+
+    async def arun(self, tool_calls):
+        started = time.perf_counter()
+        jobs, results = self._plan(tool_calls)
+        durations = []
+        keys = list(jobs)
+        outcomes = await asyncio.gather(
+            *(self._arun_one(self.tools[jobs[key]["name"]], jobs[key].get("args", {}), durations) for key in keys),
+            return_exceptions=True,
+        )
+        for key, outcome in zip(keys, outcomes):
+            name = jobs[key]["name"]
+            if isinstance(outcome, asyncio.TimeoutError):
+                self.timeouts_hit += 1
+                outcome = (f"Error: tool '{name}' tidak selesai dalam {self._timeout(name):g} detik", "error")
+            elif isinstance(outcome, BaseException):
+                if isinstance(outcome, asyncio.CancelledError):
+                    raise outcome
+                outcome = (f"Error: {outcome}", "error")
+            else:
+                outcome = (self._content(outcome), "success")
+            results[key] = outcome
+            self._store(key, name, outcome)
+        return self._messages(tool_calls, results, started, len(jobs), durations)
+
+    # --- LOOP AGEN ---
+    def run_agent(self, model_with_tools, messages, max_rounds=TOOL_MAX_ROUNDS):
+        """Model -> tool (paralel) -> model ... sampai model menjawab tanpa tool call. Return AIMessage terakhir."""
+        for _ in range(max_rounds):
+            ai_msg = model_with_tools.invoke(messages)
+            messages.append(ai_msg)
+            if not ai_msg.tool_calls:
+                return ai_msg
+            messages.extend(self.run(ai_msg.tool_calls))
+        return model_with_tools.invoke(messages)
+
+    async def arun_agent(self, model_with_tools, messages, max_rounds=TOOL_MAX_ROUNDS):
+        for _ in range(max_rounds):
+            ai_msg = await model_with_tools.ainvoke(messages)
+            messages.append(ai_msg)
+            if not ai_msg.tool_calls:
+                return ai_msg
+            messages.extend(await self.arun(ai_msg.tool_calls))
+        return await model_with_tools.ainvoke(messages)
+
+    def stats(self):
+        return {
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+            "timeouts": self.timeouts_hit,
+            "last_turn": self.last_turn,
+        }